@@ -7,10 +7,30 @@ Descripción: Pipeline completo para procesar datos de ventas online con capas B
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import logging
-from datetime import datetime
+import argparse
+import functools
+import hashlib
+import http.client
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Tuple, Optional, Union
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -24,21 +44,121 @@ class Config:
     BASE_PATH = Path('/content')
     BRONZE_PATH = BASE_PATH / 'data' / 'bronze'
     SILVER_PATH = BASE_PATH / 'data' / 'silver'
+    QUARANTINE_PATH = BASE_PATH / 'data' / 'quarantine'
     GOLD_PATH = BASE_PATH / 'data' / 'gold'
+    STATE_PATH = BASE_PATH / 'data' / 'state'
     LOGS_PATH = BASE_PATH / 'logs'
     
     # URL del dataset
     DATASET_URL = 'https://archive.ics.uci.edu/ml/machine-learning-databases/00352/Online%20Retail.xlsx'
     
+    # Caché local de la fuente (direccionada por contenido, dentro de Bronze)
+    SOURCE_CACHE_DIR = '_source_cache'
+    
+    # Catálogo de la capa Gold (versión vigente de cada tabla)
+    GOLD_MANIFEST_FILE = '_manifest.json'
+    DOWNLOAD_TIMEOUT = 60
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+    
+    # Extracción en streaming (filas por lote / row group en Bronze)
+    STREAM_BATCH_ROWS = 50_000
+    
+    # Particionado Hive de Silver (columnas derivadas por transform_silver)
+    SILVER_PARTITION_COLS = ['Year', 'Month']
+    
+    # Orden de las filas dentro de cada partición Silver (clustering): las
+    # estadísticas min/max por row group solo descartan datos si los valores
+    # cercanos quedan juntos. [] conserva el orden de origen; con 'sort' se
+    # ordena por las columnas en orden lexicográfico y con 'zorder' por una
+    # curva Z que intercala los bits de todas ellas
+    SILVER_CLUSTER_BY = []
+    SILVER_CLUSTER_ORDER = 'sort'
+    
+    # Columnas de Silver con filtro de Bloom por row group, para las búsquedas
+    # puntuales de lookup_silver, y su probabilidad de falso positivo
+    SILVER_BLOOM_FILTER_COLUMNS = ['CustomerID', 'InvoiceNo']
+    SILVER_BLOOM_FILTER_FPP = 0.01
+    # En el modo por chunks los filtros exigen reescribir cada partición
+    # completa una vez cerrada; solo se hace si se activa (o si la partición
+    # se reescribe de todos modos por clustering o devoluciones)
+    SILVER_CHUNKED_BLOOM_FILTERS = False
+    
+    # Opciones de escritura Parquet por capa (pyarrow.parquet): códec y nivel,
+    # filas por row group (None = valor de pyarrow), diccionario, estadísticas
+    # e índice de páginas. En Bronze el row group es la unidad de trabajo del
+    # modo por chunks.
+    PARQUET_SETTINGS = {
+        'bronze': {'compression': 'zstd', 'compression_level': 9, 'row_group_size': 100_000,
+                   'use_dictionary': True, 'write_statistics': True, 'write_page_index': False},
+        'silver': {'compression': 'snappy', 'compression_level': None, 'row_group_size': None,
+                   'use_dictionary': True, 'write_statistics': True, 'write_page_index': True},
+        'gold': {'compression': 'snappy', 'compression_level': None, 'row_group_size': None,
+                 'use_dictionary': True, 'write_statistics': True, 'write_page_index': False}
+    }
+    
+    # Variantes que compara --benchmark-storage (sobre las opciones de cada capa)
+    STORAGE_BENCHMARK_CANDIDATES = {
+        'none': {'compression': 'none'},
+        'snappy': {'compression': 'snappy'},
+        'lz4': {'compression': 'lz4'},
+        'gzip-6': {'compression': 'gzip', 'compression_level': 6},
+        'zstd-1': {'compression': 'zstd', 'compression_level': 1},
+        'zstd-3': {'compression': 'zstd', 'compression_level': 3},
+        'zstd-9': {'compression': 'zstd', 'compression_level': 9},
+        'zstd-19': {'compression': 'zstd', 'compression_level': 19},
+        'zstd-3 rg=25k': {'compression': 'zstd', 'compression_level': 3, 'row_group_size': 25_000},
+        'zstd-3 rg=1M': {'compression': 'zstd', 'compression_level': 3, 'row_group_size': 1_000_000},
+        'zstd-3 sin diccionario': {'compression': 'zstd', 'compression_level': 3, 'use_dictionary': False},
+        'zstd-3 sin estadísticas': {'compression': 'zstd', 'compression_level': 3, 'write_statistics': False},
+        'zstd-3 page index': {'compression': 'zstd', 'compression_level': 3, 'write_page_index': True}
+    }
+    
+    # Procesos para el modo Silver por chunks (0 = todos los núcleos)
+    SILVER_WORKERS = 1
+    
+    # Agregados parciales Gold que se combinan de una vez en el modo por chunks
+    GOLD_MERGE_FANIN = 8
+    
+    # Buckets por tabla del estado incremental Gold (hash de las columnas de
+    # grupo): cada delta solo reescribe los buckets de los grupos que toca
+    GOLD_STATE_BUCKETS = 8
+    
+    # Índice de ventas con unidades sin devolver del modo incremental: filas
+    # por segmento (tramos cronológicos; una devolución solo reescribe los
+    # segmentos de las ventas que consume) y por row group (ordenados por
+    # clave: un delta solo lee los row groups cuyo rango puede contener sus
+    # devoluciones)
+    OPEN_SALES_SEGMENT_ROWS = 65_536
+    OPEN_SALES_ROW_GROUP_ROWS = 4_096
+    
+    # Conteo aproximado de distintos (HyperLogLog) en ventas por país y mes:
+    # 2**HLL_PRECISION registros de 1 byte por grupo, error ≈ 1.04 / sqrt(2**p)
+    APPROX_DISTINCT = False
+    HLL_PRECISION = 14
+    
+    # Retención de snapshots (se conserva lo que mantenga cualquier regla)
+    RETENTION_KEEP_LAST = 5          # versiones más recientes por capa
+    RETENTION_KEEP_DAYS = 30         # antigüedad máxima en días (0 = desactivada)
+    RETENTION_KEEP_MONTHLY = 12      # última versión de cada mes (0 = desactivada)
+    RETENTION_TMP_MAX_AGE = 3600     # segundos antes de borrar un .tmp abandonado
+    
     # Parámetros de calidad
     MIN_QUANTITY = 0
     MIN_UNIT_PRICE = 0.01
     MAX_UNIT_PRICE = 10000
     
+    # Cardinalidad por columna del perfil de calidad (HyperLogLog, combinable
+    # entre chunks): 2**p registros de 1 byte por columna
+    QUALITY_HLL_PRECISION = 12
+    
+    # Segmentación RFM: niveles de puntuación por dimensión (5 = quintiles)
+    RFM_LEVELS = 5
+    
     @classmethod
     def create_directories(cls) -> None:
         """Crear estructura de directorios"""
-        for path in [cls.BRONZE_PATH, cls.SILVER_PATH, cls.GOLD_PATH, cls.LOGS_PATH]:
+        for path in [cls.BRONZE_PATH, cls.SILVER_PATH, cls.QUARANTINE_PATH, cls.GOLD_PATH,
+                     cls.STATE_PATH, cls.LOGS_PATH]:
             path.mkdir(parents=True, exist_ok=True)
 
 
@@ -74,14 +194,327 @@ def setup_logging() -> logging.Logger:
     return logger
 
 
+# ==================== ALMACENAMIENTO PARQUET ====================
+
+def parquet_options(layer: str, overrides: Optional[Dict] = None) -> Dict:
+    """
+    Opciones de escritura Parquet de una capa
+    
+    Args:
+        layer: 'bronze', 'silver' o 'gold' (Config.PARQUET_SETTINGS)
+        overrides: Opciones que reemplazan a las de la capa (benchmark)
+        
+    Returns:
+        Argumentos para pq.ParquetWriter / pq.write_table, sin row_group_size
+    """
+    overrides = dict(overrides or {})
+    if 'compression' in overrides:
+        # El nivel pertenece al códec: no se hereda al cambiarlo
+        overrides.setdefault('compression_level', None)
+    settings = {**Config.PARQUET_SETTINGS[layer], **overrides}
+    settings.pop('row_group_size', None)
+    if settings.get('compression_level') is None:
+        settings.pop('compression_level', None)
+    return settings
+
+
+def parquet_row_group_size(layer: str, overrides: Optional[Dict] = None) -> Optional[int]:
+    """Filas por row group de una capa (None = valor por defecto de pyarrow)"""
+    return {**Config.PARQUET_SETTINGS[layer], **(overrides or {})}.get('row_group_size')
+
+
+def _describe_parquet(layer: str) -> str:
+    """Descripción corta de las opciones de una capa para los logs"""
+    settings = Config.PARQUET_SETTINGS[layer]
+    level = settings.get('compression_level')
+    return f"{settings['compression']}{f'-{level}' if level is not None else ''}"
+
+
+# Columnas de la lectura selectiva del benchmark (consultas típicas por capa)
+STORAGE_BENCHMARK_COLUMNS = {
+    'bronze': ['InvoiceDate', 'Quantity', 'UnitPrice'],
+    'silver': ['InvoiceDate', 'Country', 'TotalPrice']
+}
+
+
+def _best_time(func: Callable, repeats: int) -> float:
+    """Mejor tiempo (s) de varias ejecuciones de func"""
+    best = float('inf')
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_storage(logger: logging.Logger, candidates: Optional[Dict[str, Dict]] = None,
+                      repeats: int = 3) -> Optional[pd.DataFrame]:
+    """
+    Compara opciones de almacenamiento Parquet sobre los datos actuales
+    
+    Escribe el último snapshot Bronze y el último Silver (como un archivo
+    por capa) con cada variante de Config.STORAGE_BENCHMARK_CANDIDATES y
+    mide tamaño, tiempo de escritura, lectura completa y lectura de pocas
+    columnas (mejor de `repeats` ejecuciones), en el mismo disco que los datos.
+    
+    Args:
+        logger: Logger para registro
+        candidates: Variantes nombre -> opciones (por defecto las de Config)
+        repeats: Repeticiones por medición
+        
+    Returns:
+        DataFrame con una fila por capa y variante, o None si falla
+    """
+    logger.info("\nBENCHMARK DE ALMACENAMIENTO PARQUET")
+    logger.info("-" * 60)
+    candidates = candidates or Config.STORAGE_BENCHMARK_CANDIDATES
+    
+    try:
+        bronze_path = find_bronze_snapshot()
+        if bronze_path is None:
+            logger.error("✗ No hay snapshot Bronze para el benchmark")
+            return None
+        tables = {'bronze': pq.read_table(bronze_path)}
+        
+        snapshots = _layer_snapshots(Config.SILVER_PATH, SILVER_FILE_PATTERN)
+        silver_paths = [p for p in snapshots[max(snapshots)] if p.suffix != '.json'] if snapshots else []
+        df_silver = (read_silver(silver_paths[0]) if silver_paths
+                     else transform_silver(read_bronze(bronze_path, logger), logger))
+        tables['silver'] = pa.Table.from_pandas(df_silver, schema=SILVER_SCHEMA, preserve_index=False)
+        
+        results = []
+        with tempfile.TemporaryDirectory(dir=Config.BASE_PATH) as tmp_dir:
+            path = Path(tmp_dir) / 'benchmark.parquet'
+            for layer, table in tables.items():
+                logger.info(f"{layer.capitalize()}: {table.num_rows:,} filas")
+                for name, overrides in candidates.items():
+                    options = parquet_options(layer, overrides)
+                    row_group_size = parquet_row_group_size(layer, overrides)
+                    
+                    write_sec = _best_time(
+                        lambda: pq.write_table(table, path, row_group_size=row_group_size, **options), repeats)
+                    read_sec = _best_time(lambda: pq.read_table(path), repeats)
+                    columns_sec = _best_time(
+                        lambda: pq.read_table(path, columns=STORAGE_BENCHMARK_COLUMNS[layer]), repeats)
+                    
+                    results.append({
+                        'Layer': layer,
+                        'Setting': name,
+                        'SizeMB': path.stat().st_size / 1024**2,
+                        'RowGroups': pq.read_metadata(path).num_row_groups,
+                        'WriteSec': write_sec,
+                        'ReadSec': read_sec,
+                        'ReadColumnsSec': columns_sec
+                    })
+                    logger.info(f"  {name:<24} {results[-1]['SizeMB']:>8.2f} MB  "
+                                f"escritura {write_sec:.3f} s  lectura {read_sec:.3f} s  "
+                                f"columnas {columns_sec:.3f} s")
+        
+        return pd.DataFrame(results)
+        
+    except Exception as e:
+        logger.error(f"✗ Error en benchmark de almacenamiento: {str(e)}")
+        return None
+
+
+# ==================== CAPA BRONZE: CACHÉ DE FUENTE ====================
+
+def _file_sha256(path: Path) -> str:
+    """
+    Calcula el hash SHA-256 de un archivo leyéndolo por bloques
+    
+    Args:
+        path: Ruta del archivo
+        
+    Returns:
+        Hash hexadecimal del contenido
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(Config.DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_dir() -> Path:
+    """Directorio de la caché de fuentes (se crea si no existe)"""
+    path = Config.BRONZE_PATH / Config.SOURCE_CACHE_DIR
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _load_cache_index() -> Dict[str, Dict]:
+    """Lee el índice de la caché (fuente -> hash y validadores HTTP)"""
+    index_file = _cache_dir() / 'index.json'
+    if not index_file.exists():
+        return {}
+    try:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache_index(index: Dict[str, Dict]) -> None:
+    """Escribe el índice de la caché de forma atómica"""
+    index_file = _cache_dir() / 'index.json'
+    tmp_file = index_file.with_suffix('.json.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, index_file)
+
+
+def _publish_cache_file(tmp_path: Path, sha256: str, suffix: str) -> Path:
+    """
+    Mueve un archivo temporal a su nombre definitivo direccionado por contenido
+    
+    Args:
+        tmp_path: Archivo temporal dentro del directorio de caché
+        sha256: Hash del contenido
+        suffix: Extensión del archivo original
+        
+    Returns:
+        Ruta definitiva en la caché
+    """
+    cached = _cache_dir() / f'{sha256}{suffix}'
+    if cached.exists():
+        tmp_path.unlink()
+    else:
+        os.replace(tmp_path, cached)
+    return cached
+
+
+def _fetch_local(source: str, path: Path, index: Dict[str, Dict],
+                 logger: logging.Logger) -> Tuple[Path, str]:
+    """Registra un archivo local en la caché (sin re-hashear si no cambió)"""
+    stat = path.stat()
+    suffix = path.suffix or '.xlsx'
+    entry = index.get(source, {})
+    cached = _cache_dir() / f"{entry.get('sha256', '')}{suffix}"
+    
+    if (entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+            and cached.exists()):
+        logger.info(f"✓ Fuente local sin cambios, usando caché: {cached.name}")
+        return cached, entry['sha256']
+    
+    tmp_path = _cache_dir() / f'.{path.name}.tmp'
+    shutil.copyfile(path, tmp_path)
+    sha256 = _file_sha256(tmp_path)
+    cached = _publish_cache_file(tmp_path, sha256, suffix)
+    
+    index[source] = {
+        'sha256': sha256,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'fetched_at': datetime.now().isoformat(timespec='seconds')
+    }
+    logger.info(f"✓ Fuente local registrada en caché: {cached.name}")
+    return cached, sha256
+
+
+def _fetch_http(source: str, index: Dict[str, Dict],
+                logger: logging.Logger) -> Tuple[Path, str]:
+    """Descarga condicional (ETag / Last-Modified) hacia la caché"""
+    suffix = Path(urlparse(source).path).suffix or '.xlsx'
+    entry = index.get(source, {})
+    cached = _cache_dir() / f"{entry.get('sha256', '')}{suffix}"
+    has_cache = bool(entry) and cached.exists()
+    
+    request = urllib.request.Request(source)
+    if has_cache:
+        if entry.get('etag'):
+            request.add_header('If-None-Match', entry['etag'])
+        if entry.get('last_modified'):
+            request.add_header('If-Modified-Since', entry['last_modified'])
+    
+    tmp_path = _cache_dir() / f'.download{suffix}.tmp'
+    try:
+        response = urllib.request.urlopen(request, timeout=Config.DOWNLOAD_TIMEOUT)
+        digest = hashlib.sha256()
+        received = 0
+        with response, open(tmp_path, 'wb') as f:
+            for block in iter(lambda: response.read(Config.DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(block)
+                f.write(block)
+                received += len(block)
+        # Leyendo por bloques, http.client no señala un cuerpo truncado
+        expected = response.headers.get('Content-Length')
+        if expected is not None and received != int(expected):
+            raise http.client.IncompleteRead(b'', int(expected) - received)
+        sha256 = digest.hexdigest()
+        published = _publish_cache_file(tmp_path, sha256, suffix)
+    except (OSError, http.client.HTTPException) as e:
+        # URLError / HTTPError (4xx/5xx, incluido 304), timeouts y cortes de
+        # conexión son OSError; IncompleteRead es HTTPException
+        tmp_path.unlink(missing_ok=True)
+        if not has_cache:
+            raise
+        if getattr(e, 'code', None) == 304:
+            logger.info(f"✓ Fuente sin cambios (HTTP 304), usando caché: {cached.name}")
+        else:
+            logger.warning(f"Fuente no disponible ({getattr(e, 'reason', None) or repr(e)}), "
+                           f"usando caché: {cached.name}")
+        return cached, entry['sha256']
+    cached = published
+    
+    index[source] = {
+        'sha256': sha256,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'fetched_at': datetime.now().isoformat(timespec='seconds')
+    }
+    if entry.get('sha256') == sha256:
+        logger.info(f"✓ Descarga idéntica a la versión en caché: {cached.name}")
+    else:
+        logger.info(f"✓ Fuente descargada y almacenada en caché: {cached.name}")
+    return cached, sha256
+
+
+def fetch_source(logger: logging.Logger, source: Optional[str] = None) -> Optional[Tuple[Path, str]]:
+    """
+    Obtiene el archivo fuente a través de la caché local direccionada por contenido
+    
+    La fuente puede ser una URL HTTP(S) (descarga condicional con ETag /
+    Last-Modified), una URL file:// o una ruta local. El archivo queda en
+    Bronze/_source_cache/<sha256>.<ext> y solo se descarga si cambió.
+    
+    Args:
+        logger: Logger para registro de eventos
+        source: Fuente a usar (por defecto Config.DATASET_URL)
+        
+    Returns:
+        Tupla (ruta en caché, hash SHA-256) o None si falla
+    """
+    source = source or Config.DATASET_URL
+    
+    try:
+        index = _load_cache_index()
+        parsed = urlparse(source)
+        
+        if parsed.scheme in ('http', 'https'):
+            result = _fetch_http(source, index, logger)
+        elif parsed.scheme == 'file':
+            result = _fetch_local(source, Path(url2pathname(parsed.path)), index, logger)
+        else:
+            result = _fetch_local(source, Path(source), index, logger)
+        
+        _save_cache_index(index)
+        return result
+        
+    except Exception as e:
+        logger.error(f"✗ Error obteniendo fuente {source}: {str(e)}")
+        return None
+
+
 # ==================== CAPA BRONZE: EXTRACCIÓN ====================
 
-def extract_data(logger: logging.Logger) -> Optional[pd.DataFrame]:
+def extract_data(logger: logging.Logger, source: Optional[str] = None) -> Optional[pd.DataFrame]:
     """
     Extrae datos crudos desde la fuente original
     
     Args:
         logger: Logger para registro de eventos
+        source: URL o ruta local de la fuente (por defecto Config.DATASET_URL)
         
     Returns:
         DataFrame con datos crudos o None si falla
@@ -90,10 +523,16 @@ def extract_data(logger: logging.Logger) -> Optional[pd.DataFrame]:
     logger.info("-" * 60)
     
     try:
-        logger.info(f"Descargando datos desde: {Config.DATASET_URL}")
+        logger.info(f"Obteniendo datos desde: {source or Config.DATASET_URL}")
         
-        # Descargar datos
-        df_raw = pd.read_excel(Config.DATASET_URL, engine='openpyxl')
+        # Descargar datos (solo si la fuente cambió)
+        fetched = fetch_source(logger, source)
+        if fetched is None:
+            return None
+        source_path, source_sha256 = fetched
+        
+        df_raw = pd.read_excel(source_path, engine='openpyxl')
+        df_raw.attrs['source_sha256'] = source_sha256
         
         # Métricas de extracción
         logger.info(f"✓ Datos extraídos exitosamente")
@@ -108,415 +547,4089 @@ def extract_data(logger: logging.Logger) -> Optional[pd.DataFrame]:
         return None
 
 
-def load_bronze(df: pd.DataFrame, logger: logging.Logger) -> bool:
+# Esquema de la capa Bronze (mismos tipos que produce load_bronze)
+BRONZE_SCHEMA = pa.schema([
+    ('InvoiceNo', pa.string()),
+    ('StockCode', pa.string()),
+    ('Description', pa.string()),
+    ('Quantity', pa.int64()),
+    ('InvoiceDate', pa.timestamp('ns')),
+    ('UnitPrice', pa.float64()),
+    ('CustomerID', pa.float64()),
+    ('Country', pa.string())
+])
+
+
+# Clave de metadatos Parquet con el hash SHA-256 de la fuente original
+BRONZE_SOURCE_KEY = b'source_sha256'
+
+
+def _bronze_metadata(source_sha256: Optional[str]) -> Dict[bytes, bytes]:
+    """Metadatos Parquet que vinculan un snapshot Bronze con su fuente"""
+    return {BRONZE_SOURCE_KEY: source_sha256.encode()} if source_sha256 else {}
+
+
+def _rows_to_record_batch(rows: List[tuple], positions: List[int]) -> pa.RecordBatch:
     """
-    Guarda datos crudos en la capa Bronze sin modificaciones
+    Convierte un lote de filas de openpyxl en un RecordBatch con BRONZE_SCHEMA
     
     Args:
-        df: DataFrame con datos crudos
-        logger: Logger para registro
+        rows: Filas (tuplas de valores) leídas de la hoja
+        positions: Posición en la fila de cada columna de BRONZE_SCHEMA
         
     Returns:
-        True si se guardó exitosamente, False en caso contrario
+        RecordBatch tipado
     """
-    logger.info("Guardando datos en capa BRONZE...")
+    columns = list(zip(*rows))
+    invoice, stock, description, quantity, date, price, customer, country = (
+        columns[pos] for pos in positions
+    )
+    
+    arrays = [
+        pa.array([None if v is None else str(v) for v in invoice], pa.string()),
+        pa.array([None if v is None else str(v) for v in stock], pa.string()),
+        pa.array(['' if v is None else str(v) for v in description], pa.string()),
+        pa.array(quantity, pa.int64()),
+        pa.array(date, pa.timestamp('ns')),
+        pa.array(price, pa.float64()),
+        pa.array(customer, pa.float64()),
+        pa.array(country, pa.string())
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=BRONZE_SCHEMA)
+
+
+def extract_to_bronze_streaming(logger: logging.Logger, source: Optional[str] = None,
+                                batch_rows: Optional[int] = None) -> Optional[Path]:
+    """
+    Extrae el Excel fila a fila (modo read-only) y escribe Bronze por lotes
+    
+    A diferencia de extract_data + load_bronze, nunca se materializa la hoja
+    completa: cada lote de filas se convierte en un RecordBatch de Arrow y se
+    escribe como un row group, por lo que la memoria queda acotada por
+    batch_rows independientemente del tamaño del libro.
+    
+    Args:
+        logger: Logger para registro de eventos
+        source: URL o ruta local de la fuente (por defecto Config.DATASET_URL)
+        batch_rows: Filas por lote (por defecto Config.STREAM_BATCH_ROWS)
+        
+    Returns:
+        Ruta del archivo Bronze escrito o None si falla
+    """
+    from openpyxl import load_workbook
+    
+    logger.info("ETAPA 1: EXTRACCIÓN EN STREAMING (BRONZE LAYER)")
+    logger.info("-" * 60)
+    
+    batch_rows = batch_rows or Config.STREAM_BATCH_ROWS
+    tmp_path = None
     
     try:
+        fetched = fetch_source(logger, source)
+        if fetched is None:
+            return None
+        source_path, source_sha256 = fetched
+        
+        start = time.perf_counter()
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filepath = Config.BRONZE_PATH / f'raw_data_{timestamp}.parquet'
+        tmp_path = filepath.with_suffix('.parquet.tmp')
         
-        # Crear copia para no modificar el original
-        df_to_save = df.copy()
-        
-        # Convertir tipos problemáticos para Parquet
-        # InvoiceNo puede contener 'C' para cancelaciones, mantener como string
-        if 'InvoiceNo' in df_to_save.columns:
-            df_to_save['InvoiceNo'] = df_to_save['InvoiceNo'].astype(str)
-        
-        # StockCode también puede tener caracteres especiales
-        if 'StockCode' in df_to_save.columns:
-            df_to_save['StockCode'] = df_to_save['StockCode'].astype(str)
-        
-        # Description puede tener valores nulos
-        if 'Description' in df_to_save.columns:
-            df_to_save['Description'] = df_to_save['Description'].fillna('').astype(str)
+        workbook = load_workbook(source_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else '' for h in next(rows)]
+            missing = [name for name in BRONZE_SCHEMA.names if name not in header]
+            if missing:
+                raise ValueError(f"Columnas faltantes en la fuente: {missing}")
+            positions = [header.index(name) for name in BRONZE_SCHEMA.names]
+            
+            total_rows = 0
+            batch = []
+            schema = BRONZE_SCHEMA.with_metadata(_bronze_metadata(source_sha256))
+            row_group_size = parquet_row_group_size('bronze')
+            with pq.ParquetWriter(tmp_path, schema, **parquet_options('bronze')) as writer:
+                for row in rows:
+                    if not any(v is not None for v in row):
+                        continue
+                    batch.append(row)
+                    if len(batch) >= batch_rows:
+                        writer.write_batch(_rows_to_record_batch(batch, positions), row_group_size=row_group_size)
+                        total_rows += len(batch)
+                        batch = []
+                if batch:
+                    writer.write_batch(_rows_to_record_batch(batch, positions), row_group_size=row_group_size)
+                    total_rows += len(batch)
+        finally:
+            workbook.close()
         
-        # CustomerID como float (tiene nulos)
-        if 'CustomerID' in df_to_save.columns:
-            df_to_save['CustomerID'] = df_to_save['CustomerID'].astype('float64')
+        os.replace(tmp_path, filepath)
+        elapsed = time.perf_counter() - start
         
-        # Guardar en formato Parquet con compresión
-        df_to_save.to_parquet(filepath, index=False, compression='snappy', engine='pyarrow')
-        
-        logger.info(f"✓ Datos guardados en: {filepath}")
-        logger.info(f"  - Formato: Parquet (compresión Snappy)")
+        logger.info(f"✓ Datos extraídos y guardados en: {filepath}")
+        logger.info(f"  - Registros: {total_rows:,}")
+        logger.info(f"  - Velocidad: {total_rows / max(elapsed, 1e-9):,.0f} filas/s")
         logger.info(f"  - Tamaño archivo: {filepath.stat().st_size / 1024**2:.2f} MB")
         
-        return True
+        return filepath
         
     except Exception as e:
-        logger.error(f"✗ Error guardando Bronze: {str(e)}")
-        logger.exception("Stack trace completo:")
-        return False
+        logger.error(f"✗ Error en extracción streaming: {str(e)}")
+        if tmp_path is not None and tmp_path.exists():
+            tmp_path.unlink()
+        return None
 
 
-# ==================== CAPA SILVER: TRANSFORMACIÓN ====================
+def _benchmark_extraction_worker(mode: str, source: str, bronze_path: str) -> Dict[str, float]:
+    """Ejecuta una ruta de extracción en un proceso limpio y mide tiempo y RSS pico"""
+    import resource
+    
+    Config.BRONZE_PATH = Path(bronze_path)
+    logger = logging.getLogger('ETL_Benchmark')
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    
+    start = time.perf_counter()
+    if mode == 'pandas':
+        df = extract_data(logger, source)
+        load_bronze(df, logger)
+        rows = len(df)
+    else:
+        rows = pq.ParquetFile(extract_to_bronze_streaming(logger, source)).metadata.num_rows
+    elapsed = time.perf_counter() - start
+    
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_sec': rows / max(elapsed, 1e-9),
+        'peak_rss_mb': peak_rss,
+        'delta_rss_mb': peak_rss - baseline_rss
+    }
 
-def validate_data_quality(df: pd.DataFrame, logger: logging.Logger) -> Dict[str, int]:
+
+def benchmark_extraction(logger: logging.Logger, source: Optional[str] = None) -> Dict[str, Dict[str, float]]:
     """
-    Valida calidad de datos y reporta problemas
+    Compara la extracción clásica (read_excel + load_bronze) con la de streaming
+    
+    Cada ruta se ejecuta en un proceso nuevo para que el RSS pico sea comparable.
     
     Args:
-        df: DataFrame a validar
         logger: Logger para registro
+        source: URL o ruta local de la fuente
         
     Returns:
-        Diccionario con métricas de calidad
+        Diccionario modo -> métricas (filas/s, RSS pico)
     """
-    logger.info("Validando calidad de datos...")
+    import multiprocessing
     
-    metrics = {
-        'total_rows': len(df),
-        'duplicates': df.duplicated().sum(),
-        'missing_invoice': df['InvoiceNo'].isna().sum(),
-        'missing_customer': df['CustomerID'].isna().sum(),
-        'negative_quantity': (df['Quantity'] < 0).sum(),
-        'zero_price': (df['UnitPrice'] == 0).sum(),
-        'invalid_dates': pd.isna(df['InvoiceDate']).sum()
-    }
+    # Descargar una sola vez: ambas rutas leen la copia local en caché
+    fetched = fetch_source(logger, source)
+    if fetched is None:
+        return {}
+    cached_path, _ = fetched
     
-    logger.info("Métricas de calidad:")
-    for key, value in metrics.items():
-        if value > 0:
-            logger.warning(f"  - {key}: {value:,} ({value/metrics['total_rows']*100:.2f}%)")
+    results = {}
+    for mode in ['pandas', 'streaming']:
+        bench_dir = Config.BRONZE_PATH / '_benchmark' / mode
+        bench_dir.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results[mode] = pool.submit(
+                _benchmark_extraction_worker, mode, str(cached_path), str(bench_dir)
+            ).result()
+        shutil.rmtree(bench_dir, ignore_errors=True)
     
-    return metrics
+    logger.info("Benchmark de extracción:")
+    for mode, m in results.items():
+        logger.info(f"  - {mode:<10} {m['rows']:,} filas | {m['seconds']:.1f} s | "
+                    f"{m['rows_per_sec']:,.0f} filas/s | RSS pico {m['peak_rss_mb']:.0f} MB "
+                    f"(+{m['delta_rss_mb']:.0f} MB)")
+    return results
 
 
-def transform_silver(df: pd.DataFrame, logger: logging.Logger) -> Optional[pd.DataFrame]:
+def _prepare_bronze_frame(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Limpia y transforma datos para capa Silver
+    Normaliza los tipos problemáticos para Parquet sin modificar el original
     
     Args:
-        df: DataFrame de capa Bronze
-        logger: Logger para registro
+        df: DataFrame con datos crudos
         
     Returns:
-        DataFrame limpio o None si falla
+        Copia con los tipos de BRONZE_SCHEMA
     """
-    logger.info("\nETAPA 2: TRANSFORMACIÓN Y LIMPIEZA (SILVER LAYER)")
-    logger.info("-" * 60)
+    # Crear copia para no modificar el original
+    df_to_save = df.copy()
     
-    try:
-        df_clean = df.copy()
-        initial_rows = len(df_clean)
-        
-        # 1. Validar calidad inicial
-        validate_data_quality(df_clean, logger)
-        
-        # 2. Eliminar duplicados
-        df_clean = df_clean.drop_duplicates()
-        logger.info(f"Duplicados eliminados: {initial_rows - len(df_clean):,}")
-        
-        # 3. Filtrar registros con CustomerID válido
-        df_clean = df_clean[df_clean['CustomerID'].notna()]
-        logger.info(f"Registros sin CustomerID eliminados: {initial_rows - len(df_clean):,}")
-        
-        # 4. Filtrar cantidades y precios válidos
-        df_clean = df_clean[
-            (df_clean['Quantity'] > Config.MIN_QUANTITY) &
-            (df_clean['UnitPrice'] >= Config.MIN_UNIT_PRICE) &
-            (df_clean['UnitPrice'] <= Config.MAX_UNIT_PRICE)
-        ]
-        logger.info(f"Registros con valores inválidos eliminados")
-        
-        # 5. Crear columnas derivadas
-        df_clean['TotalPrice'] = df_clean['Quantity'] * df_clean['UnitPrice']
-        df_clean['InvoiceDate'] = pd.to_datetime(df_clean['InvoiceDate'])
-        df_clean['Year'] = df_clean['InvoiceDate'].dt.year
-        df_clean['Month'] = df_clean['InvoiceDate'].dt.month
-        df_clean['DayOfWeek'] = df_clean['InvoiceDate'].dt.dayofweek
-        df_clean['Hour'] = df_clean['InvoiceDate'].dt.hour
-        
-        # 6. Normalizar datos
-        df_clean['Description'] = df_clean['Description'].str.strip().str.upper()
-        df_clean['Country'] = df_clean['Country'].str.strip()
-        df_clean['InvoiceNo'] = df_clean['InvoiceNo'].astype(str).str.strip()
-        df_clean['StockCode'] = df_clean['StockCode'].astype(str).str.strip()
-        df_clean['CustomerID'] = df_clean['CustomerID'].astype(int)
-        
-        # 7. Resumen de transformación
-        final_rows = len(df_clean)
-        logger.info(f"\n✓ Transformación completada:")
-        logger.info(f"  - Registros iniciales: {initial_rows:,}")
-        logger.info(f"  - Registros finales: {final_rows:,}")
-        logger.info(f"  - Registros eliminados: {initial_rows - final_rows:,} ({(initial_rows-final_rows)/initial_rows*100:.2f}%)")
-        logger.info(f"  - Columnas nuevas: Year, Month, DayOfWeek, Hour, TotalPrice")
-        
-        return df_clean
-        
-    except Exception as e:
-        logger.error(f"✗ Error en transformación Silver: {str(e)}")
-        return None
+    # Convertir tipos problemáticos para Parquet
+    # InvoiceNo puede contener 'C' para cancelaciones, mantener como string
+    if 'InvoiceNo' in df_to_save.columns:
+        df_to_save['InvoiceNo'] = df_to_save['InvoiceNo'].astype(str)
+    
+    # StockCode también puede tener caracteres especiales
+    if 'StockCode' in df_to_save.columns:
+        df_to_save['StockCode'] = df_to_save['StockCode'].astype(str)
+    
+    # Description puede tener valores nulos
+    if 'Description' in df_to_save.columns:
+        df_to_save['Description'] = df_to_save['Description'].fillna('').astype(str)
+    
+    # CustomerID como float (tiene nulos)
+    if 'CustomerID' in df_to_save.columns:
+        df_to_save['CustomerID'] = df_to_save['CustomerID'].astype('float64')
+    
+    return df_to_save
 
 
-def load_silver(df: pd.DataFrame, logger: logging.Logger) -> bool:
+def load_bronze(df: pd.DataFrame, logger: logging.Logger) -> bool:
     """
-    Guarda datos limpios en capa Silver
+    Guarda datos crudos en la capa Bronze sin modificaciones
     
     Args:
-        df: DataFrame limpio
+        df: DataFrame con datos crudos
         logger: Logger para registro
         
     Returns:
-        True si se guardó exitosamente
+        True si se guardó exitosamente, False en caso contrario
     """
+    logger.info("Guardando datos en capa BRONZE...")
+    tmp_path = None
+    
     try:
-        logger.info("\nGuardando datos en capa SILVER...")
-        
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filepath = Config.SILVER_PATH / f'clean_data_{timestamp}.parquet'
+        filepath = Config.BRONZE_PATH / f'raw_data_{timestamp}.parquet'
         
-        df.to_parquet(filepath, index=False, compression='snappy')
+        df_to_save = _prepare_bronze_frame(df)
+        
+        # Registrar el hash de la fuente para poder reanudar desde Bronze
+        table = pa.Table.from_pandas(df_to_save, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            **_bronze_metadata(df.attrs.get('source_sha256'))
+        })
+        
+        # Guardar en formato Parquet con compresión (publicación atómica)
+        tmp_path = filepath.with_suffix('.parquet.tmp')
+        pq.write_table(table, tmp_path, row_group_size=parquet_row_group_size('bronze'),
+                       **parquet_options('bronze'))
+        os.replace(tmp_path, filepath)
         
         logger.info(f"✓ Datos guardados en: {filepath}")
+        logger.info(f"  - Formato: Parquet (compresión {_describe_parquet('bronze')})")
         logger.info(f"  - Tamaño archivo: {filepath.stat().st_size / 1024**2:.2f} MB")
         
         return True
         
     except Exception as e:
-        logger.error(f"✗ Error guardando Silver: {str(e)}")
+        logger.error(f"✗ Error guardando Bronze: {str(e)}")
+        logger.exception("Stack trace completo:")
+        if tmp_path is not None and tmp_path.exists():
+            tmp_path.unlink()
         return False
 
 
-# ==================== CAPA GOLD: AGREGACIÓN ====================
-
-def aggregate_sales_by_country(df: pd.DataFrame, logger: logging.Logger) -> Optional[pd.DataFrame]:
+def find_bronze_snapshot(source_sha256: Optional[str] = None) -> Optional[Path]:
     """
-    Agrega ventas por país
+    Busca el snapshot Bronze válido más reciente
+    
+    Solo se leen los metadatos Parquet (footer), no los datos. Un snapshot es
+    válido si tiene el esquema Bronze, al menos una fila y, si se indica,
+    el mismo hash de fuente.
     
     Args:
-        df: DataFrame de capa Silver
-        logger: Logger para registro
+        source_sha256: Hash de la fuente esperado (None acepta cualquiera)
         
     Returns:
-        DataFrame agregado
+        Ruta del snapshot o None si no hay ninguno válido
     """
-    try:
-        logger.info("Creando agregación: Ventas por País")
-        
-        df_country = df.groupby('Country').agg({
-            'InvoiceNo': 'nunique',
-            'CustomerID': 'nunique',
-            'Quantity': 'sum',
-            'TotalPrice': 'sum'
-        }).reset_index()
+    # El timestamp del nombre ordena cronológicamente
+    for filepath in sorted(Config.BRONZE_PATH.glob('raw_data_*.parquet'), reverse=True):
+        try:
+            metadata = pq.read_metadata(filepath)
+        except Exception:
+            continue
         
-        df_country.columns = ['Country', 'TotalOrders', 'UniqueCustomers', 
-                              'TotalQuantity', 'TotalRevenue']
-        
-        df_country['AvgOrderValue'] = df_country['TotalRevenue'] / df_country['TotalOrders']
-        df_country = df_country.sort_values('TotalRevenue', ascending=False)
-        
-        logger.info(f"  ✓ Agregación completada: {len(df_country)} países")
-        
-        return df_country
+        schema = metadata.schema.to_arrow_schema()
+        if metadata.num_rows == 0 or not set(BRONZE_SCHEMA.names) <= set(schema.names):
+            continue
         
-    except Exception as e:
-        logger.error(f"  ✗ Error en agregación por país: {str(e)}")
-        return None
+        file_sha256 = (metadata.metadata or {}).get(BRONZE_SOURCE_KEY, b'').decode()
+        if source_sha256 is None or file_sha256 == source_sha256:
+            return filepath
+    
+    return None
 
 
-def aggregate_sales_by_time(df: pd.DataFrame, logger: logging.Logger) -> Optional[pd.DataFrame]:
+def read_bronze_table(filepath: Path, logger: logging.Logger,
+                      after: Optional[pd.Timestamp] = None) -> Optional[pa.Table]:
     """
-    Agrega ventas por período temporal
+    Lee un snapshot Bronze como tabla Arrow (textos como strings Arrow, sin objetos Python)
     
     Args:
-        df: DataFrame de capa Silver
+        filepath: Ruta del snapshot Bronze
         logger: Logger para registro
+        after: Si se indica, solo filas con InvoiceDate posterior (usa estadísticas de row group)
         
     Returns:
-        DataFrame agregado
+        Tabla con datos crudos (metadatos Bronze incluidos) o None si falla
     """
     try:
-        logger.info("Creando agregación: Ventas por Período")
-        
-        df['YearMonth'] = df['InvoiceDate'].dt.to_period('M').astype(str)
-        
-        df_time = df.groupby('YearMonth').agg({
-            'InvoiceNo': 'nunique',
-            'CustomerID': 'nunique',
-            'TotalPrice': ['sum', 'mean'],
-            'Quantity': 'sum'
-        }).reset_index()
-        
-        df_time.columns = ['YearMonth', 'TotalOrders', 'UniqueCustomers', 
-                          'TotalRevenue', 'AvgOrderValue', 'TotalQuantity']
+        start = time.perf_counter()
+        filters = [('InvoiceDate', '>', pd.Timestamp(after))] if after is not None else None
+        table = pq.read_table(filepath, filters=filters)
         
-        logger.info(f"  ✓ Agregación completada: {len(df_time)} períodos")
+        logger.info(f"✓ Datos leídos desde Bronze: {filepath.name}")
+        logger.info(f"  - Registros: {table.num_rows:,}")
+        logger.info(f"  - Tiempo de lectura: {time.perf_counter() - start:.2f} s")
         
-        return df_time
+        return table
         
     except Exception as e:
-        logger.error(f"  ✗ Error en agregación temporal: {str(e)}")
+        logger.error(f"✗ Error leyendo Bronze {filepath}: {str(e)}")
         return None
 
 
-def aggregate_top_products(df: pd.DataFrame, logger: logging.Logger, top_n: int = 50) -> Optional[pd.DataFrame]:
+def read_bronze(filepath: Path, logger: logging.Logger,
+                after: Optional[pd.Timestamp] = None) -> Optional[pd.DataFrame]:
     """
-    Identifica productos más vendidos
+    Lee un snapshot Bronze como fuente del pipeline (en lugar del Excel)
     
     Args:
-        df: DataFrame de capa Silver
+        filepath: Ruta del snapshot Bronze
         logger: Logger para registro
-        top_n: Número de productos top
+        after: Si se indica, solo filas con InvoiceDate posterior (usa estadísticas de row group)
         
     Returns:
-        DataFrame con top productos
+        DataFrame con datos crudos o None si falla
     """
-    try:
-        logger.info(f"Creando agregación: Top {top_n} Productos")
-        
-        df_products = df.groupby(['StockCode', 'Description']).agg({
-            'Quantity': 'sum',
+    table = read_bronze_table(filepath, logger, after)
+    if table is None:
+        return None
+    
+    df_raw = table.to_pandas()
+    source_sha256 = (table.schema.metadata or {}).get(BRONZE_SOURCE_KEY)
+    if source_sha256:
+        df_raw.attrs['source_sha256'] = source_sha256.decode()
+    return df_raw
+
+
+# ==================== CAPA SILVER: TRANSFORMACIÓN ====================
+
+# Esquema de la capa Silver (salida de transform_silver). Las columnas clave
+# de texto se guardan codificadas como diccionario (categorical en pandas)
+SILVER_SCHEMA = pa.schema([
+    ('InvoiceNo', pa.dictionary(pa.int32(), pa.string())),
+    ('StockCode', pa.dictionary(pa.int32(), pa.string())),
+    ('Description', pa.dictionary(pa.int32(), pa.string())),
+    ('Quantity', pa.int64()),
+    ('InvoiceDate', pa.timestamp('ns')),
+    ('UnitPrice', pa.float64()),
+    ('CustomerID', pa.int64()),
+    ('Country', pa.dictionary(pa.int32(), pa.string())),
+    ('TotalPrice', pa.float64()),
+    ('ReturnedQuantity', pa.int64()),
+    ('NetTotalPrice', pa.float64()),
+    ('Year', pa.int32()),
+    ('Month', pa.int32()),
+    ('DayOfWeek', pa.int32()),
+    ('Hour', pa.int32())
+])
+
+SILVER_DICTIONARY_COLUMNS = [f.name for f in SILVER_SCHEMA if pa.types.is_dictionary(f.type)]
+
+
+# Conteos del perfil de calidad (se suman al combinar perfiles de varios chunks)
+QUALITY_COUNTS = ['total_rows', 'duplicates', 'missing_invoice', 'missing_customer',
+                  'negative_quantity', 'zero_price', 'invalid_dates']
+
+
+def _combine_hashes(column_hashes: List[np.ndarray]) -> np.ndarray:
+    """Combina los hashes por columna en un hash de 64 bits por fila (mismo esquema que pandas)"""
+    mult = np.uint64(1000003)
+    out = np.full(len(column_hashes[0]), 0x345678, dtype=np.uint64)
+    for i, hashes in enumerate(column_hashes):
+        out ^= hashes
+        out *= mult
+        mult += np.uint64(82520 + 2 * (len(column_hashes) - i))
+    return out + np.uint64(97531)
+
+
+def _distinct_value_hashes(values: pd.Series) -> np.ndarray:
+    """Hash de 64 bits de cada valor distinto (no nulo) de una columna"""
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+
+def _empty_profile(columns: List[str], precision: int) -> Dict:
+    """Perfil de calidad de un lote vacío (elemento neutro de merge_quality_profiles)"""
+    profile = {key: 0 for key in QUALITY_COUNTS}
+    profile['nulls'] = {col: 0 for col in columns}
+    profile['registers'] = {col: np.zeros(1 << precision, dtype=np.uint8) for col in columns}
+    return profile
+
+
+def profile_quality(df: pd.DataFrame, precision: Optional[int] = None) -> Tuple[Dict, np.ndarray]:
+    """
+    Perfil de calidad de un lote con una sola pasada por columna
+    
+    Cada columna se factoriza una vez: los códigos -1 dan los nulos, y solo
+    los valores distintos se hashean, para el sketch HyperLogLog de
+    cardinalidad de la columna y, devueltos a cada fila por su código, para
+    el hash de fila con el que se detectan los duplicados. Los perfiles se
+    combinan con merge_quality_profiles, así que pueden calcularse por chunks.
+    
+    Args:
+        df: DataFrame de capa Bronze (o un chunk)
+        precision: Bits de índice del HLL (por defecto Config.QUALITY_HLL_PRECISION)
+        
+    Returns:
+        Tupla (perfil con 'duplicates' = 0, hash de 64 bits de cada fila);
+        mark_duplicates completa los duplicados a partir de los hashes
+    """
+    precision = Config.QUALITY_HLL_PRECISION if precision is None else precision
+    profile = _empty_profile(list(df.columns), precision)
+    profile['total_rows'] = len(df)
+    
+    column_hashes = []
+    for col in df.columns:
+        codes, uniques = pd.factorize(df[col])
+        value_hashes = _distinct_value_hashes(uniques)
+        profile['nulls'][col] = int((codes < 0).sum())
+        profile['registers'][col] = hll_registers(np.zeros(len(uniques), dtype=np.int64),
+                                                  value_hashes, 1, precision)[0]
+        # El código -1 (nulo) toma el último elemento: un hash fijo para los nulos
+        column_hashes.append(np.append(value_hashes, np.uint64(0))[codes])
+    
+    profile['missing_invoice'] = profile['nulls']['InvoiceNo']
+    profile['missing_customer'] = profile['nulls']['CustomerID']
+    profile['invalid_dates'] = profile['nulls']['InvoiceDate']
+    profile['negative_quantity'] = int((df['Quantity'] < 0).sum())
+    profile['zero_price'] = int((df['UnitPrice'] == 0).sum())
+    return profile, _combine_hashes(column_hashes)
+
+
+def mark_duplicates(profile: Dict, row_hashes: np.ndarray,
+                    seen: Optional['RowHashSet'] = None) -> np.ndarray:
+    """
+    Marca los duplicados por hash de fila y los anota en el perfil
+    
+    Args:
+        profile: Perfil de profile_quality (se actualiza 'duplicates')
+        row_hashes: Hash de cada fila
+        seen: Hashes de lotes anteriores (modo por chunks); None = solo dentro del lote
+        
+    Returns:
+        Máscara de repeticiones de una fila anterior (keep='first')
+    """
+    if seen is None:
+        duplicated = pd.Series(row_hashes).duplicated().to_numpy()
+    else:
+        duplicated = ~seen.add_new(row_hashes)
+    profile['duplicates'] = int(duplicated.sum())
+    return duplicated
+
+
+def merge_quality_profiles(*profiles: Dict) -> Dict:
+    """
+    Combina perfiles de calidad de lotes disjuntos
+    
+    Los conteos se suman y los registros HLL se combinan con el máximo. Los
+    duplicados solo suman bien si cada lote se marcó contra los anteriores
+    (mark_duplicates con el mismo RowHashSet).
+    """
+    merged = {key: sum(p[key] for p in profiles) for key in QUALITY_COUNTS}
+    merged['nulls'] = {col: sum(p['nulls'][col] for p in profiles) for col in profiles[0]['nulls']}
+    merged['registers'] = {col: np.maximum.reduce([p['registers'][col] for p in profiles])
+                           for col in profiles[0]['registers']}
+    return merged
+
+
+def quality_cardinalities(profile: Dict) -> Dict[str, int]:
+    """Valores distintos (no nulos) estimados por columna a partir de los registros HLL"""
+    return {col: int(round(hll_estimate(registers[np.newaxis, :])[0]))
+            for col, registers in profile['registers'].items()}
+
+
+def log_quality_profile(profile: Dict, logger: logging.Logger) -> None:
+    """Registra las métricas de calidad y los nulos y la cardinalidad de cada columna"""
+    _log_quality_metrics({key: profile[key] for key in QUALITY_COUNTS}, logger)
+    total = max(profile['total_rows'], 1)
+    cardinalities = quality_cardinalities(profile)
+    logger.info("Nulos y cardinalidad por columna:")
+    for col, nulls in profile['nulls'].items():
+        logger.info(f"  - {col}: {nulls / total * 100:.2f}% nulos, ~{cardinalities[col]:,} distintos")
+
+
+def _log_quality_metrics(metrics: Dict[str, int], logger: logging.Logger) -> None:
+    """Registra las métricas de calidad distintas de cero"""
+    logger.info("Métricas de calidad:")
+    for key, value in metrics.items():
+        if value > 0:
+            logger.warning(f"  - {key}: {value:,} ({value/metrics['total_rows']*100:.2f}%)")
+
+
+def _valid_values_mask(df: pd.DataFrame) -> pd.Series:
+    """Máscara de filas con cantidad y precio unitario dentro de rango"""
+    return (
+        (df['Quantity'] > Config.MIN_QUANTITY) &
+        (df['UnitPrice'] >= Config.MIN_UNIT_PRICE) &
+        (df['UnitPrice'] <= Config.MAX_UNIT_PRICE)
+    )
+
+
+# Reglas de rechazo de Silver en orden de evaluación: cada fila rechazada se
+# atribuye a la primera regla que incumple (código = posición + 1, 0 = válida)
+SILVER_REJECTION_RULES = ['duplicate', 'missing_customer', 'invalid_values']
+REJECTED_INVALID_VALUES = SILVER_REJECTION_RULES.index('invalid_values') + 1
+
+
+def silver_rejection_codes(duplicated: np.ndarray, customer_valid: np.ndarray,
+                           values_valid: np.ndarray) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Combina las reglas de Silver en una sola máscara de códigos por fila
+    
+    Args:
+        duplicated: True en las repeticiones de una fila anterior
+        customer_valid: True si la fila tiene CustomerID
+        values_valid: True si cantidad y precio están en rango
+        
+    Returns:
+        Tupla (código por fila: 0 = válida, i = regla SILVER_REJECTION_RULES[i - 1],
+        filas rechazadas por cada regla)
+    """
+    codes = np.select([duplicated, ~customer_valid, ~values_valid],
+                      np.arange(1, len(SILVER_REJECTION_RULES) + 1, dtype=np.int8), 0).astype(np.int8)
+    counts = np.bincount(codes, minlength=len(SILVER_REJECTION_RULES) + 1)
+    return codes, {rule: int(counts[i + 1]) for i, rule in enumerate(SILVER_REJECTION_RULES)}
+
+
+def _log_rejections(rejections: Dict[str, int], logger: logging.Logger) -> None:
+    """Registra las filas rechazadas por cada regla"""
+    logger.info(f"Duplicados eliminados: {rejections['duplicate']:,}")
+    logger.info(f"Registros sin CustomerID eliminados: {rejections['missing_customer']:,}")
+    logger.info(f"Registros con valores inválidos eliminados: {rejections['invalid_values']:,}")
+
+
+def _derive_silver_columns(df_clean: pd.DataFrame) -> pd.DataFrame:
+    """
+    Crea las columnas derivadas y normaliza textos sobre filas ya filtradas
+    
+    Args:
+        df_clean: DataFrame filtrado (CustomerID válido, valores en rango)
+        
+    Returns:
+        DataFrame con el esquema Silver
+    """
+    # Crear columnas derivadas (sin devoluciones hasta net_returns)
+    df_clean['TotalPrice'] = df_clean['Quantity'] * df_clean['UnitPrice']
+    df_clean['ReturnedQuantity'] = np.zeros(len(df_clean), dtype=np.int64)
+    df_clean['NetTotalPrice'] = df_clean['TotalPrice']
+    df_clean['InvoiceDate'] = pd.to_datetime(df_clean['InvoiceDate'])
+    df_clean['Year'] = df_clean['InvoiceDate'].dt.year
+    df_clean['Month'] = df_clean['InvoiceDate'].dt.month
+    df_clean['DayOfWeek'] = df_clean['InvoiceDate'].dt.dayofweek
+    df_clean['Hour'] = df_clean['InvoiceDate'].dt.hour
+    
+    # Normalizar datos
+    df_clean['Description'] = df_clean['Description'].str.strip().str.upper()
+    df_clean['Country'] = df_clean['Country'].str.strip()
+    df_clean['InvoiceNo'] = df_clean['InvoiceNo'].astype(str).str.strip()
+    df_clean['StockCode'] = df_clean['StockCode'].astype(str).str.strip()
+    df_clean['CustomerID'] = df_clean['CustomerID'].astype(int)
+    
+    # Codificar claves de texto como diccionario (códigos enteros)
+    for col in SILVER_DICTIONARY_COLUMNS:
+        df_clean[col] = df_clean[col].astype('category')
+    
+    return df_clean
+
+
+def transform_silver(df: pd.DataFrame, logger: logging.Logger,
+                     quarantine: bool = False, open_sales: Optional[List[str]] = None,
+                     consumed_sales: Optional[List[pd.DataFrame]] = None) -> Optional[pd.DataFrame]:
+    """
+    Limpia y transforma datos para capa Silver
+    
+    Args:
+        df: DataFrame de capa Bronze
+        logger: Logger para registro
+        quarantine: Guardar las filas rechazadas en la cuarentena (write_quarantine)
+        open_sales: Segmentos del índice de ventas abiertas (modo incremental):
+            las devoluciones también consumen sus unidades aún no devueltas
+        consumed_sales: Recibe las filas del índice consumidas por las
+            devoluciones (ver match_returns_incremental)
+        
+    Returns:
+        DataFrame limpio o None si falla
+    """
+    logger.info("\nETAPA 2: TRANSFORMACIÓN Y LIMPIEZA (SILVER LAYER)")
+    logger.info("-" * 60)
+    
+    try:
+        initial_rows = len(df)
+        
+        # 1. Perfil de calidad inicial; su hash de fila da los duplicados
+        logger.info("Validando calidad de datos...")
+        profile, row_hashes = profile_quality(df)
+        duplicated = mark_duplicates(profile, row_hashes)
+        log_quality_profile(profile, logger)
+        
+        # 2-4. Duplicados, CustomerID y valores en una sola máscara sobre las
+        # columnas de origen; solo se copian las filas que sobreviven
+        codes, rejections = silver_rejection_codes(
+            duplicated,
+            df['CustomerID'].notna().to_numpy(),
+            _valid_values_mask(df).to_numpy()
+        )
+        _log_rejections(rejections, logger)
+        if quarantine:
+            write_quarantine(df, codes, logger)
+        
+        # 5-6. Crear columnas derivadas y normalizar datos
+        df_clean = _derive_silver_columns(df[codes == 0])
+        
+        # 7. Compensar las devoluciones (facturas C) con sus ventas
+        df_returns = df[(codes == REJECTED_INVALID_VALUES) & cancellation_mask(df)]
+        if open_sales:
+            returned, df_consumed = match_returns_incremental(open_sales, df_clean, df_returns, logger)
+            if consumed_sales is not None:
+                consumed_sales.append(df_consumed)
+        else:
+            returned = match_returns(df_clean, df_returns, logger)
+        df_clean = net_returns(df_clean, returned)
+        
+        # 8. Resumen de transformación
+        final_rows = len(df_clean)
+        logger.info(f"\n✓ Transformación completada:")
+        logger.info(f"  - Registros iniciales: {initial_rows:,}")
+        logger.info(f"  - Registros finales: {final_rows:,}")
+        logger.info(f"  - Registros eliminados: {initial_rows - final_rows:,} ({(initial_rows-final_rows)/initial_rows*100:.2f}%)")
+        logger.info(f"  - Columnas nuevas: Year, Month, DayOfWeek, Hour, TotalPrice, ReturnedQuantity, NetTotalPrice")
+        
+        return df_clean
+        
+    except Exception as e:
+        logger.error(f"✗ Error en transformación Silver: {str(e)}")
+        return None
+
+
+def _new_snapshot_dir(base: Path, prefix: str) -> Path:
+    """Ruta de un snapshot nuevo base/prefix_<versión> (versión que no colisiona con otra)"""
+    version = datetime.now().strftime('%Y%m%d_%H%M%S')
+    candidate, suffix = version, 0
+    while any(base.glob(f'{prefix}_{candidate}[.]*')) or (base / f'{prefix}_{candidate}').exists():
+        suffix += 1
+        candidate = f'{version}_{suffix}'
+    return base / f'{prefix}_{candidate}'
+
+
+def _new_silver_path() -> Path:
+    """Ruta de un dataset Silver nuevo (versión que no colisiona con otra)"""
+    return _new_snapshot_dir(Config.SILVER_PATH, 'clean_data')
+
+
+def _partition_dir(values: Tuple[int, ...]) -> str:
+    """Directorio Hive de una partición (meses con dos dígitos: orden cronológico)"""
+    return '/'.join(f'{col}={value:02d}' for col, value in zip(Config.SILVER_PARTITION_COLS, values))
+
+
+def _split_partitions(table: pa.Table) -> Iterator[Tuple[Tuple[int, ...], pa.Table]]:
+    """
+    Divide una tabla Silver por las columnas de partición
+    
+    Ordena de forma estable por la clave de partición (las filas de cada
+    partición conservan su orden), quita las columnas de partición, que
+    quedan en la ruta, y deja en cada diccionario solo los valores de la
+    partición (el diccionario global vive en el archivo .dictionaries.json).
+    
+    Args:
+        table: Tabla con el esquema SILVER_SCHEMA
+        
+    Yields:
+        (valores de partición, tabla de la partición)
+    """
+    cols = Config.SILVER_PARTITION_COLS
+    if not cols:
+        yield (), table
+        return
+    
+    keys = [table.column(col).to_numpy() for col in cols]
+    order = np.lexsort(keys[::-1])
+    sorted_keys = [key[order] for key in keys]
+    changes = np.flatnonzero(np.any([key[1:] != key[:-1] for key in sorted_keys], axis=0)) + 1
+    bounds = np.r_[0, changes, len(order)]
+    
+    table = table.take(pa.array(order)).drop_columns(cols)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop > start:
+            yield tuple(int(key[start]) for key in sorted_keys), _compact_dictionaries(table.slice(start, stop - start))
+
+
+def _sort_key_column(table: pa.Table, col: str) -> pa.ChunkedArray:
+    """Columna usable como clave de orden (los diccionarios se comparan por su texto)"""
+    values = table.column(col)
+    return values.cast(pa.string()) if pa.types.is_dictionary(values.type) else values
+
+
+def zorder_keys(table: pa.Table, columns: List[str]) -> np.ndarray:
+    """
+    Clave de curva Z (Morton) de cada fila sobre varias columnas
+    
+    Cada columna se reemplaza por su rango denso (reducido a 64 // n bits
+    si hay más valores distintos) y la clave intercala esos bits, de modo
+    que las filas cercanas en todas las columnas a la vez quedan juntas.
+    
+    Args:
+        table: Tabla Arrow
+        columns: Columnas a intercalar
+        
+    Returns:
+        Array uint64 con la clave de cada fila
+    """
+    bits = 64 // len(columns)
+    keys = np.zeros(table.num_rows, dtype=np.uint64)
+    for j, col in enumerate(columns):
+        ranks = pc.rank(_sort_key_column(table, col), tiebreaker='dense').to_numpy().astype(np.uint64) - 1
+        excess = max(int(ranks.max(initial=0)).bit_length() - bits, 0)
+        ranks >>= np.uint64(excess)
+        for b in range(bits):
+            keys |= ((ranks >> np.uint64(b)) & np.uint64(1)) << np.uint64(b * len(columns) + j)
+    return keys
+
+
+def cluster_silver_rows(table: pa.Table) -> pa.Table:
+    """
+    Reordena las filas según Config.SILVER_CLUSTER_BY / SILVER_CLUSTER_ORDER
+    
+    El orden es estable: las filas con la misma clave conservan su orden
+    de origen, así el resultado no depende del modo de ejecución.
+    
+    Args:
+        table: Tabla Silver (normalmente una partición)
+        
+    Returns:
+        Tabla con las filas agrupadas (la misma si no hay clustering)
+    """
+    columns = [col for col in Config.SILVER_CLUSTER_BY if col in table.column_names]
+    if not columns or table.num_rows < 2:
+        return table
+    
+    if Config.SILVER_CLUSTER_ORDER == 'zorder':
+        order = np.argsort(zorder_keys(table, columns), kind='stable')
+    else:
+        keys = pa.table({col: _sort_key_column(table, col) for col in columns})
+        order = pc.sort_indices(keys, sort_keys=[(col, 'ascending') for col in columns])
+    return table.take(order)
+
+
+def _bloom_filter_options(table: pa.Table) -> Dict[str, Dict]:
+    """
+    Opciones de filtro de Bloom para escribir una partición Silver
+    
+    El tamaño del filtro se calcula con los valores distintos reales (como
+    máximo las filas de un row group): con el valor por defecto de pyarrow
+    cada filtro ocuparía ~1 MB por columna y row group.
+    """
+    row_group_rows = parquet_row_group_size('silver') or table.num_rows
+    return {
+        col: {'ndv': max(min(pc.count_distinct(_sort_key_column(table, col)).as_py(), row_group_rows), 1),
+              'fpp': Config.SILVER_BLOOM_FILTER_FPP}
+        for col in Config.SILVER_BLOOM_FILTER_COLUMNS
+        if col in table.column_names
+    }
+
+
+def _write_silver_partition(table: pa.Table, path: Path) -> None:
+    """Escribe el archivo de una partición Silver (clustering, opciones de capa y filtros de Bloom)"""
+    table = cluster_silver_rows(table)
+    pq.write_table(table, path, row_group_size=parquet_row_group_size('silver'),
+                   bloom_filter_options=_bloom_filter_options(table), **parquet_options('silver'))
+
+
+def _rewrite_partition_file(path: Path, returned: Optional[np.ndarray] = None,
+                            target: Optional[Path] = None) -> None:
+    """
+    Reescribe un archivo de partición completo (modo por chunks e incremental)
+    
+    Args:
+        path: Archivo de la partición
+        returned: Unidades devueltas de cada fila (None = sin cambios)
+        target: Archivo de destino (por defecto el mismo)
+    """
+    table = pq.read_table(path)
+    if returned is not None:
+        net = pc.multiply(pc.subtract(table.column('Quantity'), pa.array(returned)).cast(pa.float64()),
+                          table.column('UnitPrice'))
+        for name, values in [('ReturnedQuantity', pa.array(returned)), ('NetTotalPrice', net)]:
+            table = table.set_column(table.schema.get_field_index(name), name, values)
+    _write_silver_partition(_compact_dictionaries(table), target or path)
+
+
+def _compact_dictionaries(table: pa.Table) -> pa.Table:
+    """Recodifica las columnas de diccionario con solo los valores presentes en la tabla"""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field, pc.dictionary_encode(table.column(i).cast(pa.string())))
+    return table
+
+
+def load_silver(df: pd.DataFrame, logger: logging.Logger) -> Optional[Path]:
+    """
+    Guarda datos limpios en capa Silver como dataset particionado
+    
+    Se escribe un directorio clean_data_<timestamp>/Year=YYYY/Month=MM/
+    (Config.SILVER_PARTITION_COLS) con un Parquet por partición, primero
+    como temporal y luego renombrado, más el archivo de diccionarios.
+    
+    Args:
+        df: DataFrame limpio o tabla Arrow con SILVER_SCHEMA (modo Arrow)
+        logger: Logger para registro
+        
+    Returns:
+        Ruta del dataset guardado (evalúa como True) o None si falla
+    """
+    tmp_path = None
+    try:
+        logger.info("\nGuardando datos en capa SILVER...")
+        
+        filepath = _new_silver_path()
+        tmp_path = filepath.with_suffix('.tmp')
+        tmp_path.mkdir(parents=True)
+        
+        if isinstance(df, pa.Table):
+            table = df
+            dictionaries = {col: sorted_unique_strings(table.column(col)).to_pylist()
+                            for col in SILVER_DICTIONARY_COLUMNS}
+        else:
+            table = pa.Table.from_pandas(df, schema=SILVER_SCHEMA, preserve_index=False)
+            dictionaries = {col: df[col].cat.categories.tolist()
+                            for col in SILVER_DICTIONARY_COLUMNS
+                            if isinstance(df[col].dtype, pd.CategoricalDtype)}
+        
+        partitions = 0
+        for values, part in _split_partitions(table):
+            part_dir = tmp_path / _partition_dir(values)
+            part_dir.mkdir(parents=True, exist_ok=True)
+            _write_silver_partition(part, part_dir / 'part-0.parquet')
+            partitions += 1
+        
+        _write_silver_dictionaries(filepath, dictionaries)
+        os.replace(tmp_path, filepath)
+        
+        size = sum(p.stat().st_size for p in silver_partitions(filepath))
+        logger.info(f"✓ Datos guardados en: {filepath}")
+        logger.info(f"  - Particiones ({'/'.join(Config.SILVER_PARTITION_COLS)}): {partitions}")
+        if Config.SILVER_CLUSTER_BY:
+            logger.info(f"  - Clustering ({Config.SILVER_CLUSTER_ORDER}): {', '.join(Config.SILVER_CLUSTER_BY)}")
+        logger.info(f"  - Tamaño: {size / 1024**2:.2f} MB")
+        
+        return filepath
+        
+    except Exception as e:
+        logger.error(f"✗ Error guardando Silver: {str(e)}")
+        if tmp_path is not None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return None
+
+
+def _dictionaries_path(silver_path: Path) -> Path:
+    """Archivo de diccionarios que acompaña a un dataset (o archivo) Silver"""
+    return silver_path.with_suffix('.dictionaries.json')
+
+
+def _write_silver_dictionaries(silver_path: Path, dictionaries: Dict[str, List[str]]) -> None:
+    """Persiste los diccionarios (valores ordenados por código) junto al Parquet"""
+    dict_path = _dictionaries_path(silver_path)
+    tmp_path = dict_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dictionaries, f, ensure_ascii=False)
+    os.replace(tmp_path, dict_path)
+
+
+def _silver_dataset(silver_path: Path) -> ds.Dataset:
+    """Dataset Arrow de un Silver particionado (directorio) o de un archivo único anterior"""
+    if silver_path.is_dir():
+        partition_schema = pa.schema([SILVER_SCHEMA.field(col) for col in Config.SILVER_PARTITION_COLS])
+        return ds.dataset(silver_path, schema=SILVER_SCHEMA, format='parquet',
+                          partitioning=ds.partitioning(partition_schema, flavor='hive'))
+    return ds.dataset(silver_path, format='parquet')
+
+
+def _silver_filter(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[ds.Expression]:
+    """
+    Filtro InvoiceDate en [start, end) expresado también sobre Year/Month
+    
+    Las condiciones sobre Year/Month permiten descartar particiones enteras
+    sin abrirlas; la condición sobre InvoiceDate recorta dentro del mes.
+    """
+    year, month = ds.field('Year'), ds.field('Month')
+    expression = None
+    if start is not None:
+        start = pd.Timestamp(start)
+        condition = ((year > start.year) | ((year == start.year) & (month >= start.month))) & \
+                    (ds.field('InvoiceDate') >= pa.scalar(start.value, pa.timestamp('ns')))
+        expression = condition
+    if end is not None:
+        end = pd.Timestamp(end)
+        last = end - pd.Timedelta(1, 'ns')
+        condition = ((year < last.year) | ((year == last.year) & (month <= last.month))) & \
+                    (ds.field('InvoiceDate') < pa.scalar(end.value, pa.timestamp('ns')))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def silver_partitions(silver_path: Path, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None) -> List[Path]:
+    """
+    Archivos de un Silver que hay que leer para un rango de fechas
+    
+    Args:
+        silver_path: Dataset (o archivo) Silver
+        start: Inicio del rango de InvoiceDate (incluido)
+        end: Fin del rango de InvoiceDate (excluido)
+        
+    Returns:
+        Rutas de los archivos de las particiones no descartadas, en orden
+    """
+    fragments = _silver_dataset(silver_path).get_fragments(filter=_silver_filter(start, end))
+    return [Path(fragment.path) for fragment in fragments]
+
+
+def silver_num_rows(silver_path: Path) -> int:
+    """Número de filas de un Silver (solo metadatos de los footers)"""
+    return _silver_dataset(silver_path).count_rows()
+
+
+def read_silver(filepath: Path, columns: Optional[List[str]] = None,
+                start: Optional[datetime] = None, end: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Lee un Silver con los códigos de diccionario persistidos
+    
+    Con start/end solo se abren las particiones Year/Month del rango. Cada
+    archivo (y cada row group escrito por chunks) tiene su propio
+    diccionario; al aplicar el diccionario global del archivo
+    .dictionaries.json, el código de cada valor es el mismo en todo el
+    dataset y entre lecturas.
+    
+    Args:
+        filepath: Ruta del dataset Silver (o de un archivo Silver anterior)
+        columns: Columnas a leer (por defecto todas)
+        start: Inicio del rango de InvoiceDate (incluido)
+        end: Fin del rango de InvoiceDate (excluido)
+        
+    Returns:
+        DataFrame Silver con columnas categóricas
+    """
+    table = _silver_dataset(filepath).to_table(columns=columns, filter=_silver_filter(start, end))
+    df = table.to_pandas()
+    
+    dict_path = _dictionaries_path(filepath)
+    if dict_path.exists():
+        with open(dict_path, 'r', encoding='utf-8') as f:
+            dictionaries = json.load(f)
+        for col, values in dictionaries.items():
+            if col in df.columns:
+                df[col] = df[col].astype('category').cat.set_categories(values)
+    
+    # Los snapshots anteriores a la compensación de devoluciones no tienen
+    # esas columnas (se leen nulas): se tratan como ventas sin devoluciones
+    if 'ReturnedQuantity' in df.columns and df['ReturnedQuantity'].isna().any():
+        df['ReturnedQuantity'] = df['ReturnedQuantity'].fillna(0).astype(np.int64)
+    if 'NetTotalPrice' in df.columns and 'TotalPrice' in df.columns:
+        df['NetTotalPrice'] = df['NetTotalPrice'].fillna(df['TotalPrice'])
+    
+    return df
+
+
+def decode_silver(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte las columnas de diccionario de vuelta a strings
+    
+    Args:
+        df: DataFrame Silver con columnas categóricas
+        
+    Returns:
+        Copia con las columnas clave como texto
+    """
+    df_decoded = df.copy()
+    for col in SILVER_DICTIONARY_COLUMNS:
+        if col in df_decoded.columns and isinstance(df_decoded[col].dtype, pd.CategoricalDtype):
+            df_decoded[col] = df_decoded[col].astype(str)
+    return df_decoded
+
+
+# ==================== CAPA SILVER: CUARENTENA ====================
+
+# Columna de partición (Hive) con la regla que rechazó cada fila
+QUARANTINE_REASON_COL = 'Reason'
+
+
+def _rejected_rows(rows: Union[pd.DataFrame, pa.Table], codes: np.ndarray) -> Tuple[pa.Table, np.ndarray]:
+    """
+    Copia solo las filas rechazadas, agrupadas por regla, en una tabla de Arrow
+    
+    Args:
+        rows: Lote de Bronze (DataFrame o tabla)
+        codes: Código de rechazo por fila (silver_rejection_codes)
+        
+    Returns:
+        Tupla (filas rechazadas ordenadas por código, filas por código)
+    """
+    rejected = np.flatnonzero(codes)
+    order = rejected[np.argsort(codes[rejected], kind='stable')]
+    if isinstance(rows, pd.DataFrame):
+        table = pa.Table.from_pandas(rows.iloc[order], schema=BRONZE_SCHEMA, preserve_index=False)
+    else:
+        table = rows.take(pa.array(order)).cast(BRONZE_SCHEMA)
+    return table, np.bincount(codes[order], minlength=len(SILVER_REJECTION_RULES) + 1)
+
+
+class QuarantineWriter:
+    """
+    Escribe las filas rechazadas de uno o varios lotes en un snapshot de cuarentena
+    
+    El snapshot (Config.QUARANTINE_PATH/rejected_data_<versión>) está
+    particionado por regla (Reason=<regla>/part-0.parquet) con las columnas
+    de Bronze sin transformar y sus opciones Parquet. Se escribe en un
+    directorio .tmp que se publica con commit().
+    """
+    
+    def __init__(self):
+        self.path = _new_snapshot_dir(Config.QUARANTINE_PATH, 'rejected_data')
+        self.rows = 0
+        self._tmp_path = self.path.with_suffix('.tmp')
+        self._tmp_path.mkdir(parents=True)
+        self._writers: Dict[str, pq.ParquetWriter] = {}
+    
+    def write(self, rows: Union[pd.DataFrame, pa.Table], codes: np.ndarray) -> None:
+        """Añade las filas con código distinto de 0 a la partición de su regla"""
+        table, counts = _rejected_rows(rows, codes)
+        offset = 0
+        for i, rule in enumerate(SILVER_REJECTION_RULES):
+            count = int(counts[i + 1])
+            if count:
+                if rule not in self._writers:
+                    part_dir = self._tmp_path / f'{QUARANTINE_REASON_COL}={rule}'
+                    part_dir.mkdir()
+                    self._writers[rule] = pq.ParquetWriter(part_dir / 'part-0.parquet', table.schema,
+                                                           **parquet_options('bronze'))
+                self._writers[rule].write_table(table.slice(offset, count))
+            offset += count
+        self.rows += table.num_rows
+    
+    def _close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+    
+    def commit(self) -> Path:
+        """Cierra las particiones y publica el snapshot"""
+        self._close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+    
+    def abort(self) -> None:
+        """Descarta el snapshot a medio escribir"""
+        self._close()
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+
+
+def write_quarantine(rows: Union[pd.DataFrame, pa.Table], codes: np.ndarray,
+                     logger: logging.Logger) -> Optional[Path]:
+    """
+    Guarda las filas rechazadas por transform_silver en la cuarentena
+    
+    Args:
+        rows: Lote de Bronze (DataFrame o tabla)
+        codes: Código de rechazo por fila (silver_rejection_codes)
+        logger: Logger para registro
+        
+    Returns:
+        Ruta del snapshot de cuarentena o None si falla
+    """
+    writer = None
+    try:
+        writer = QuarantineWriter()
+        writer.write(rows, codes)
+        path = writer.commit()
+        logger.info(f"✓ Filas rechazadas en cuarentena: {writer.rows:,} ({path})")
+        return path
+    except Exception as e:
+        logger.error(f"✗ Error guardando cuarentena: {str(e)}")
+        if writer is not None:
+            writer.abort()
+        return None
+
+
+def read_quarantine(filepath: Path, reason: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lee un snapshot de cuarentena para auditoría
+    
+    Args:
+        filepath: Snapshot de cuarentena
+        reason: Regla de SILVER_REJECTION_RULES (None = todas)
+        
+    Returns:
+        DataFrame con las columnas de Bronze y la regla de rechazo (Reason)
+    """
+    dataset = ds.dataset(filepath, format='parquet', partitioning='hive')
+    row_filter = ds.field(QUARANTINE_REASON_COL) == reason if reason is not None else None
+    return dataset.to_table(filter=row_filter).to_pandas()
+
+
+# ==================== CAPA SILVER: DEVOLUCIONES ====================
+
+def cancellation_mask(df: pd.DataFrame) -> np.ndarray:
+    """Filas de Bronze que son devoluciones: factura 'C...', cantidad negativa y precio en rango"""
+    mask = ((df['Quantity'] < 0) &
+            (df['UnitPrice'] >= Config.MIN_UNIT_PRICE) &
+            (df['UnitPrice'] <= Config.MAX_UNIT_PRICE)).to_numpy(copy=True)
+    # El prefijo de la factura solo se comprueba en las pocas filas candidatas
+    candidates = np.flatnonzero(mask)
+    mask[candidates] = df['InvoiceNo'].iloc[candidates].astype(str).str.lstrip().str.startswith('C').to_numpy()
+    return mask
+
+
+def returns_keys(customer_id: np.ndarray, stock_code: pd.Series, unit_price: np.ndarray) -> np.ndarray:
+    """
+    Hash de 64 bits de la clave de casación (CustomerID, StockCode, UnitPrice)
+    
+    StockCode se factoriza y solo se hashean sus valores distintos (las
+    categorías, en un Silver); el hash no depende de si la columna es
+    categórica o texto.
+    """
+    codes, uniques = pd.factorize(stock_code)
+    return _combine_hashes([
+        pd.util.hash_array(np.asarray(customer_id, dtype=np.int64)),
+        np.append(_distinct_value_hashes(uniques), np.uint64(0))[codes],
+        pd.util.hash_array(np.asarray(unit_price, dtype=np.float64))
+    ])
+
+
+def _sale_events(df_sales: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Clave, instante (ns) y unidades de cada línea de venta de Silver"""
+    return (returns_keys(df_sales['CustomerID'].to_numpy(), df_sales['StockCode'],
+                         df_sales['UnitPrice'].to_numpy()),
+            df_sales['InvoiceDate'].to_numpy('datetime64[ns]').view(np.int64),
+            df_sales['Quantity'].to_numpy(np.int64))
+
+
+def _return_events(df_returns: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Clave, instante (ns) y unidades devueltas de cada línea de devolución de Bronze"""
+    return (returns_keys(df_returns['CustomerID'].to_numpy(), df_returns['StockCode'].astype(str).str.strip(),
+                         df_returns['UnitPrice'].to_numpy()),
+            pd.to_datetime(df_returns['InvoiceDate']).to_numpy('datetime64[ns]').view(np.int64),
+            -df_returns['Quantity'].to_numpy(np.int64))
+
+
+def _probe(index: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sondea claves contra un índice ordenado: (posiciones que casan, su posición en el índice)"""
+    if len(index) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pos = np.searchsorted(index, keys)
+    pos[pos == len(index)] = 0
+    matched = np.flatnonzero(index[pos] == keys)
+    return matched, pos[matched]
+
+
+def allocate_returns(sale_keys: np.ndarray, sale_dates: np.ndarray, sale_quantity: np.ndarray,
+                     return_keys: np.ndarray, return_dates: np.ndarray,
+                     return_quantity: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Reparte las unidades devueltas entre las líneas de venta que casan (hash join indexado)
+    
+    Las devoluciones, el lado pequeño, forman el índice (sus claves distintas
+    ordenadas) y las ventas lo sondean con searchsorted: solo siguen las de
+    claves con devoluciones. Por clave, ventas y devoluciones se ordenan por
+    instante (la venta primero en un empate) y cada devolución consume las
+    unidades vendidas más antiguas aún no devueltas (FIFO), nunca ventas
+    posteriores a ella. El consumo acumulado tras cada devolución,
+    C_i = min(C_{i-1} + q_i, S_i) con S_i las unidades vendidas hasta
+    entonces, es D_i + min(0, mín acumulado de S_j - D_j): una suma y un
+    mínimo acumulados por clave, sin recorrer las ventas por devolución.
+    Coste O((n + m) log m) para n ventas y m devoluciones.
+    
+    Args:
+        sale_keys, sale_dates, sale_quantity: Clave, instante y unidades de cada venta
+        return_keys, return_dates, return_quantity: Lo mismo de cada devolución (unidades > 0)
+        
+    Returns:
+        Tupla (unidades devueltas de cada venta, unidades devueltas sin venta que compensar)
+    """
+    returned = np.zeros(len(sale_keys), dtype=np.int64)
+    index = np.unique(return_keys)
+    matched, sale_codes = _probe(index, sale_keys)
+    
+    n_sales = len(matched)
+    key = np.concatenate([sale_codes, np.searchsorted(index, return_keys)])
+    order = np.lexsort((np.r_[np.zeros(n_sales, dtype=np.int8), np.ones(len(return_keys), dtype=np.int8)],
+                        np.concatenate([sale_dates[matched], return_dates]), key))
+    key = key[order]
+    sold = np.concatenate([sale_quantity[matched], np.zeros(len(return_keys), dtype=np.int64)])[order]
+    given_back = np.concatenate([np.zeros(n_sales, dtype=np.int64), return_quantity])[order]
+    
+    by_key = pd.Series(key)
+    cum_sold = pd.Series(sold).groupby(by_key).cumsum().to_numpy()
+    cum_returned = pd.Series(given_back).groupby(by_key).cumsum().to_numpy()
+    slack = np.minimum(pd.Series(cum_sold - cum_returned).groupby(by_key).cummin().to_numpy(), 0)
+    
+    # Consumo final por clave (último evento de cada una)
+    last = np.r_[key[1:] != key[:-1], True] if len(key) else np.zeros(0, dtype=bool)
+    consumed = np.zeros(len(index), dtype=np.int64)
+    consumed[key[last]] = (cum_returned + slack)[last]
+    
+    is_sale = order < n_sales
+    allocation = np.clip(consumed[key] - (cum_sold - sold), 0, sold)
+    returned[matched[order[is_sale]]] = allocation[is_sale]
+    return returned, int(return_quantity.sum() - consumed.sum())
+
+
+def _log_returns(lines: int, returned: np.ndarray, unmatched: int,
+                 value: float, logger: logging.Logger) -> None:
+    """Registra las devoluciones y cuántas se compensaron con sus ventas"""
+    units = int(returned.sum()) + unmatched
+    logger.info(f"Devoluciones (facturas C): {lines:,} líneas, {units:,} unidades; "
+                f"compensadas {units - unmatched:,} ({(units - unmatched) / max(units, 1) * 100:.2f}%) "
+                f"por {value:,.2f}")
+
+
+def match_returns(df_sales: pd.DataFrame, df_returns: pd.DataFrame, logger: logging.Logger) -> np.ndarray:
+    """
+    Casa las devoluciones de Bronze con las ventas de Silver por (CustomerID, StockCode, UnitPrice)
+    
+    Args:
+        df_sales: Ventas de Silver (CustomerID, StockCode, UnitPrice, InvoiceDate, Quantity)
+        df_returns: Devoluciones válidas de Bronze (cancellation_mask, sin duplicados ni CustomerID nulo)
+        logger: Logger para registro
+        
+    Returns:
+        Unidades devueltas de cada venta (ver allocate_returns)
+    """
+    returned, unmatched = allocate_returns(*_sale_events(df_sales), *_return_events(df_returns))
+    _log_returns(len(df_returns), returned, unmatched,
+                 float(returned @ df_sales['UnitPrice'].to_numpy(np.float64)), logger)
+    return returned
+
+
+def match_returns_partitions(paths: List[Path], df_returns: pd.DataFrame,
+                             logger: logging.Logger) -> Dict[Path, np.ndarray]:
+    """
+    match_returns sobre un Silver ya escrito por particiones (modo por chunks)
+    
+    Cada archivo se lee solo con las columnas de la clave y se sondea contra
+    el índice de devoluciones; del reparto solo se guardan las ventas que
+    casan, así que la memoria no crece con el tamaño de Silver.
+    
+    Args:
+        paths: Archivos de las particiones, en orden cronológico
+        df_returns: Devoluciones válidas de Bronze
+        logger: Logger para registro
+        
+    Returns:
+        Diccionario archivo -> unidades devueltas de cada fila (solo archivos con alguna)
+    """
+    if not paths:
+        return {}
+    
+    return_events = _return_events(df_returns)
+    rows, positions, sales = _probe_partitions(paths, np.unique(return_events[0]))
+    keys, dates, quantity, prices = (np.concatenate(column) for column in zip(*sales))
+    returned, unmatched = allocate_returns(keys, dates, quantity, *return_events)
+    _log_returns(len(df_returns), returned, unmatched, float(returned @ prices), logger)
+    return _returned_by_file(paths, rows, positions, returned)
+
+
+def match_returns_incremental(open_sales: List[str], df_sales: pd.DataFrame, df_returns: pd.DataFrame,
+                              logger: logging.Logger) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    match_returns de un delta incremental contra el Silver ya procesado
+    
+    Las devoluciones del delta consumen primero las unidades aún no
+    devueltas de los deltas anteriores, que se buscan en el índice de
+    ventas abiertas del estado (probe_open_sales) sin leer Silver, y después
+    las ventas del propio delta. Como el delta es posterior a la marca de
+    agua, las devoluciones anteriores ya consumieron las unidades más
+    antiguas y el reparto coincide con el de una reconstrucción completa.
+    
+    Args:
+        open_sales: Segmentos del índice de ventas abiertas
+        df_sales: Ventas de Silver del delta
+        df_returns: Devoluciones válidas de Bronze del delta
+        logger: Logger para registro
+        
+    Returns:
+        Tupla (unidades devueltas de cada venta del delta,
+        filas del índice consumidas con sus unidades devueltas en Returned)
+    """
+    return_events = _return_events(df_returns)
+    df_prior = probe_open_sales(open_sales, return_events[0])
+    prior = (df_prior['Key'].to_numpy(np.int64).view(np.uint64), df_prior['InvoiceDate'].to_numpy(np.int64),
+             df_prior['Remaining'].to_numpy(np.int64), df_prior['UnitPrice'].to_numpy(np.float64))
+    delta = _sale_events(df_sales) + (df_sales['UnitPrice'].to_numpy(np.float64),)
+    keys, dates, quantity, prices = (np.concatenate(column) for column in zip(prior, delta))
+    returned, unmatched = allocate_returns(keys, dates, quantity, *return_events)
+    _log_returns(len(df_returns), returned, unmatched, float(returned @ prices), logger)
+    
+    df_prior['Returned'] = returned[:len(df_prior)]
+    return returned[len(df_prior):], df_prior[df_prior['Returned'] > 0].reset_index(drop=True)
+
+
+def _probe_partitions(paths: List[Path],
+                      index: np.ndarray) -> Tuple[List[int], List[np.ndarray], List[List[np.ndarray]]]:
+    """
+    Lee las ventas de cada archivo Silver que casan con el índice de devoluciones
+    
+    Args:
+        paths: Archivos de las particiones
+        index: Claves distintas ordenadas de las devoluciones
+        
+    Returns:
+        Tupla (filas de cada archivo, posiciones que casan en cada archivo,
+        eventos (clave, instante, unidades, precio) de esas ventas por archivo)
+    """
+    columns = ['CustomerID', 'StockCode', 'UnitPrice', 'InvoiceDate', 'Quantity']
+    rows, positions, sales = [], [], []
+    for path in paths:
+        df_sales = pq.read_table(path, columns=columns).to_pandas()
+        events = _sale_events(df_sales) + (df_sales['UnitPrice'].to_numpy(np.float64),)
+        matched, _ = _probe(index, events[0])
+        rows.append(len(df_sales))
+        positions.append(matched)
+        sales.append([values[matched] for values in events])
+    return rows, positions, sales
+
+
+def _returned_by_file(paths: List[Path], rows: List[int], positions: List[np.ndarray],
+                      returned: np.ndarray) -> Dict[Path, np.ndarray]:
+    """Reparte las unidades devueltas de las ventas sondeadas entre sus archivos (solo archivos con alguna)"""
+    by_file = {}
+    offsets = np.cumsum([0] + [len(matched) for matched in positions])
+    for path, n_rows, matched, start in zip(paths, rows, positions, offsets):
+        file_returned = returned[start:start + len(matched)]
+        if file_returned.any():
+            by_file[path] = np.zeros(n_rows, dtype=np.int64)
+            by_file[path][matched] = file_returned
+    return by_file
+
+
+def net_returns(df_clean: pd.DataFrame, returned: np.ndarray) -> pd.DataFrame:
+    """Rellena ReturnedQuantity y NetTotalPrice (importe neto de devoluciones) de un Silver"""
+    df_clean['ReturnedQuantity'] = returned
+    df_clean['NetTotalPrice'] = (df_clean['Quantity'] - returned) * df_clean['UnitPrice']
+    return df_clean
+
+
+# ==================== CAPA SILVER: MODO ARROW ====================
+
+def sorted_unique_strings(values: pa.ChunkedArray) -> pa.Array:
+    """Valores distintos no nulos de una columna de texto (o diccionario), en orden lexicográfico"""
+    if pa.types.is_dictionary(values.type):
+        values = values.cast(values.type.value_type)
+    uniques = pc.drop_null(pc.unique(values))
+    return uniques.take(pc.sort_indices(uniques))
+
+
+def _sorted_dictionary_encode(values: pa.ChunkedArray) -> pa.ChunkedArray:
+    """
+    Codifica como diccionario con los valores ordenados
+    
+    pc.dictionary_encode numera por orden de aparición; con el diccionario
+    ordenado los códigos coinciden con las categorías de pandas
+    (astype('category')), y con ellos el orden de los resultados Gold.
+    """
+    values = values.cast(pa.string())
+    dictionary = sorted_unique_strings(values)
+    return pa.chunked_array([
+        pa.DictionaryArray.from_arrays(pc.index_in(chunk, value_set=dictionary).cast(pa.int32()), dictionary)
+        for chunk in values.chunks
+    ], type=pa.dictionary(pa.int32(), pa.string()))
+
+
+def _first_occurrences(table: pa.Table) -> np.ndarray:
+    """
+    Posiciones de las filas que drop_duplicates conservaría (primera aparición)
+    
+    Se agrupa por todas las columnas con el mínimo índice de fila de cada
+    grupo, en orden original. Los textos se agrupan por sus códigos de
+    diccionario: se hashean enteros y el resultado del group_by no copia
+    los strings.
+    """
+    keys = {}
+    for name in table.column_names:
+        values = table.column(name)
+        if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+            values = pa.chunked_array([chunk.indices for chunk in pc.dictionary_encode(values).chunks],
+                                      type=pa.int32())
+        keys[name] = values
+    keys['__row'] = pa.array(np.arange(table.num_rows, dtype=np.int64))
+    
+    groups = pa.table(keys).group_by(table.column_names, use_threads=False)
+    return np.sort(groups.aggregate([('__row', 'min')]).column('__row_min').to_numpy())
+
+
+def _mask_array(mask: pa.ChunkedArray) -> np.ndarray:
+    """Máscara booleana de NumPy (los nulos cuentan como False)"""
+    return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
+
+
+def profile_quality_arrow(table: pa.Table, duplicated: np.ndarray,
+                          precision: Optional[int] = None) -> Dict:
+    """
+    Perfil de calidad (como profile_quality) con kernels de Arrow
+    
+    Los registros HLL se construyen con los mismos hashes de valores
+    distintos que profile_quality, así que ambos perfiles son combinables.
+    
+    Args:
+        table: Tabla de capa Bronze
+        duplicated: Máscara de duplicados ya calculada
+        precision: Bits de índice del HLL (por defecto Config.QUALITY_HLL_PRECISION)
+        
+    Returns:
+        Perfil de calidad
+    """
+    precision = Config.QUALITY_HLL_PRECISION if precision is None else precision
+    profile = _empty_profile(table.column_names, precision)
+    profile['total_rows'] = table.num_rows
+    profile['duplicates'] = int(duplicated.sum())
+    
+    for col in table.column_names:
+        values = table.column(col)
+        value_hashes = _distinct_value_hashes(pc.drop_null(pc.unique(values)).to_pandas())
+        profile['nulls'][col] = values.null_count
+        profile['registers'][col] = hll_registers(np.zeros(len(value_hashes), dtype=np.int64),
+                                                  value_hashes, 1, precision)[0]
+    
+    profile['missing_invoice'] = profile['nulls']['InvoiceNo']
+    profile['missing_customer'] = profile['nulls']['CustomerID']
+    profile['invalid_dates'] = profile['nulls']['InvoiceDate']
+    profile['negative_quantity'] = pc.sum(pc.less(table.column('Quantity'), 0)).as_py() or 0
+    profile['zero_price'] = pc.sum(pc.equal(table.column('UnitPrice'), 0)).as_py() or 0
+    return profile
+
+
+def _arrow_events(table: pa.Table, stock_codes: np.ndarray,
+                  sign: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Clave, instante (ns) y unidades (por sign) de cada fila de una tabla Arrow"""
+    keys = _combine_hashes([
+        pd.util.hash_array(table.column('CustomerID').cast(pa.int64()).to_numpy()),
+        pd.util.hash_array(stock_codes.astype(np.int64)),
+        pd.util.hash_array(table.column('UnitPrice').cast(pa.float64()).to_numpy())
+    ])
+    return (keys,
+            table.column('InvoiceDate').cast(pa.timestamp('ns')).cast(pa.int64()).to_numpy(),
+            table.column('Quantity').cast(pa.int64()).to_numpy() * sign)
+
+
+def match_returns_arrow(sales: pa.Table, returns: pa.Table, logger: logging.Logger) -> np.ndarray:
+    """
+    match_returns sobre tablas Arrow (modo Arrow), sin convertir a pandas
+    
+    La clave usa los códigos del diccionario ordenado de StockCode de las
+    ventas; el StockCode de cada devolución se busca en ese diccionario con
+    pc.index_in (las que no aparecen no pueden casar con ninguna venta).
+    
+    Args:
+        sales: Ventas de Silver (CustomerID, StockCode como diccionario, UnitPrice,
+            InvoiceDate, Quantity)
+        returns: Devoluciones válidas de Bronze (cancellation, sin duplicados ni CustomerID nulo)
+        logger: Logger para registro
+        
+    Returns:
+        Unidades devueltas de cada venta (ver allocate_returns)
+    """
+    stock = sales.column('StockCode')
+    dictionary = stock.chunk(0).dictionary if stock.num_chunks else pa.array([], type=pa.string())
+    sale_codes = np.concatenate([np.zeros(0, dtype=np.int32)] + [
+        chunk.indices.to_numpy(zero_copy_only=False) for chunk in stock.chunks
+    ])
+    return_codes = pc.fill_null(
+        pc.index_in(pc.utf8_trim_whitespace(returns.column('StockCode')), value_set=dictionary), -1
+    ).to_numpy()
+    
+    returned, unmatched = allocate_returns(*_arrow_events(sales, sale_codes, 1),
+                                           *_arrow_events(returns, return_codes, -1))
+    _log_returns(returns.num_rows, returned, unmatched,
+                 float(returned @ sales.column('UnitPrice').to_numpy()), logger)
+    return returned
+
+
+def transform_silver_arrow(table: pa.Table, logger: logging.Logger,
+                           quarantine: bool = False) -> Optional[pa.Table]:
+    """
+    Limpia y transforma datos para capa Silver con kernels de Arrow (modo Arrow)
+    
+    Aplica las mismas reglas que transform_silver (duplicados, CustomerID,
+    cantidades y precios, columnas derivadas y normalización de textos)
+    con pyarrow.compute, sin pasar por strings de Python.
+    
+    Args:
+        table: Tabla de capa Bronze
+        logger: Logger para registro
+        quarantine: Guardar las filas rechazadas en la cuarentena (write_quarantine)
+        
+    Returns:
+        Tabla con SILVER_SCHEMA o None si falla
+    """
+    logger.info("\nETAPA 2: TRANSFORMACIÓN Y LIMPIEZA (SILVER LAYER, MODO ARROW)")
+    logger.info("-" * 60)
+    
+    try:
+        initial_rows = table.num_rows
+        
+        # 1. Localizar duplicados y validar calidad inicial
+        logger.info("Validando calidad de datos...")
+        duplicated = np.ones(initial_rows, dtype=bool)
+        duplicated[_first_occurrences(table)] = False
+        log_quality_profile(profile_quality_arrow(table, duplicated), logger)
+        
+        # 2-4. Duplicados, CustomerID y valores en una sola máscara (una sola
+        # copia de las filas que quedan)
+        price_valid = pc.and_(pc.greater_equal(table.column('UnitPrice'), Config.MIN_UNIT_PRICE),
+                              pc.less_equal(table.column('UnitPrice'), Config.MAX_UNIT_PRICE))
+        codes, rejections = silver_rejection_codes(
+            duplicated,
+            _mask_array(pc.is_valid(table.column('CustomerID'))),
+            _mask_array(pc.and_(pc.greater(table.column('Quantity'), Config.MIN_QUANTITY), price_valid))
+        )
+        _log_rejections(rejections, logger)
+        if quarantine:
+            write_quarantine(table, codes, logger)
+        cancellation = _mask_array(pc.and_(
+            pc.starts_with(pc.utf8_ltrim_whitespace(table.column('InvoiceNo')), 'C'),
+            pc.and_(pc.less(table.column('Quantity'), 0), price_valid)
+        ))
+        returns = table.take(pa.array(np.flatnonzero((codes == REJECTED_INVALID_VALUES) & cancellation)))
+        table = table.take(pa.array(np.flatnonzero(codes == 0)))
+        
+        # 5-6. Crear columnas derivadas y normalizar datos
+        dates = table.column('InvoiceDate').cast(pa.timestamp('ns'))
+        columns = {
+            'InvoiceNo': pc.utf8_trim_whitespace(table.column('InvoiceNo')),
+            'StockCode': pc.utf8_trim_whitespace(table.column('StockCode')),
+            'Description': pc.utf8_upper(pc.utf8_trim_whitespace(table.column('Description'))),
+            'Quantity': table.column('Quantity'),
+            'InvoiceDate': dates,
+            'UnitPrice': table.column('UnitPrice'),
+            'CustomerID': table.column('CustomerID').cast(pa.int64()),
+            'Country': pc.utf8_trim_whitespace(table.column('Country')),
+            'TotalPrice': pc.multiply(table.column('Quantity').cast(pa.float64()), table.column('UnitPrice')),
+            'Year': pc.year(dates),
+            'Month': pc.month(dates),
+            'DayOfWeek': pc.day_of_week(dates),
+            'Hour': pc.hour(dates)
+        }
+        for col in SILVER_DICTIONARY_COLUMNS:
+            columns[col] = _sorted_dictionary_encode(columns[col])
+        
+        # 7. Compensar las devoluciones (facturas C) con sus ventas
+        sales = pa.table({col: columns[col] for col in ['CustomerID', 'StockCode', 'UnitPrice',
+                                                        'InvoiceDate', 'Quantity']})
+        returned = pa.array(match_returns_arrow(sales, returns, logger))
+        columns['ReturnedQuantity'] = returned
+        columns['NetTotalPrice'] = pc.multiply(pc.subtract(columns['Quantity'], returned).cast(pa.float64()),
+                                               columns['UnitPrice'])
+        table_clean = pa.table([columns[field.name].cast(field.type) for field in SILVER_SCHEMA],
+                               schema=SILVER_SCHEMA)
+        
+        # 8. Resumen de transformación
+        final_rows = table_clean.num_rows
+        logger.info(f"\n✓ Transformación completada:")
+        logger.info(f"  - Registros iniciales: {initial_rows:,}")
+        logger.info(f"  - Registros finales: {final_rows:,}")
+        logger.info(f"  - Registros eliminados: {initial_rows - final_rows:,} ({(initial_rows-final_rows)/initial_rows*100:.2f}%)")
+        logger.info(f"  - Columnas nuevas: Year, Month, DayOfWeek, Hour, TotalPrice, ReturnedQuantity, NetTotalPrice")
+        
+        return table_clean
+        
+    except Exception as e:
+        logger.error(f"✗ Error en transformación Silver (Arrow): {str(e)}")
+        return None
+
+
+# ==================== CAPA SILVER: BÚSQUEDA POR CLAVE ====================
+
+_XXH_PRIMES = (11400714785074694791, 14029467366897019727, 1609587929392839161,
+               9650029242287828579, 2870177450012600261)
+_UINT64_MASK = (1 << 64) - 1
+
+# Constantes del filtro de Bloom por bloques de Parquet (split block bloom filter)
+_BLOOM_SALTS = (0x47b6137b, 0x44974d91, 0x8824ad5b, 0xa2b7289d,
+                0x705495c7, 0x2df1424b, 0x9efc4947, 0x5c6bfb31)
+
+
+def _rotl64(value: int, bits: int) -> int:
+    return ((value << bits) | (value >> (64 - bits))) & _UINT64_MASK
+
+
+def _xxh64_round(acc: int, lane: int) -> int:
+    p1, p2 = _XXH_PRIMES[:2]
+    return (_rotl64((acc + lane * p2) & _UINT64_MASK, 31) * p1) & _UINT64_MASK
+
+
+def xxhash64(data: bytes, seed: int = 0) -> int:
+    """
+    XXH64 de un valor (el hash que usan los filtros de Bloom de Parquet)
+    
+    Implementación directa de la especificación: solo se calcula para el
+    valor buscado, no para columnas enteras.
+    """
+    p1, p2, p3, p4, p5 = _XXH_PRIMES
+    length, pos = len(data), 0
+    
+    if length >= 32:
+        acc = [(seed + p1 + p2) & _UINT64_MASK, (seed + p2) & _UINT64_MASK,
+               seed, (seed - p1) & _UINT64_MASK]
+        while pos + 32 <= length:
+            for i in range(4):
+                acc[i] = _xxh64_round(acc[i], int.from_bytes(data[pos:pos + 8], 'little'))
+                pos += 8
+        h = (_rotl64(acc[0], 1) + _rotl64(acc[1], 7) + _rotl64(acc[2], 12) + _rotl64(acc[3], 18)) & _UINT64_MASK
+        for value in acc:
+            h = ((h ^ _xxh64_round(0, value)) * p1 + p4) & _UINT64_MASK
+    else:
+        h = (seed + p5) & _UINT64_MASK
+    
+    h = (h + length) & _UINT64_MASK
+    while pos + 8 <= length:
+        h ^= _xxh64_round(0, int.from_bytes(data[pos:pos + 8], 'little'))
+        h = (_rotl64(h, 27) * p1 + p4) & _UINT64_MASK
+        pos += 8
+    if pos + 4 <= length:
+        h ^= (int.from_bytes(data[pos:pos + 4], 'little') * p1) & _UINT64_MASK
+        h = (_rotl64(h, 23) * p2 + p3) & _UINT64_MASK
+        pos += 4
+    while pos < length:
+        h ^= (data[pos] * p5) & _UINT64_MASK
+        h = (_rotl64(h, 11) * p1) & _UINT64_MASK
+        pos += 1
+    
+    h ^= h >> 33
+    h = (h * p2) & _UINT64_MASK
+    h ^= h >> 29
+    h = (h * p3) & _UINT64_MASK
+    return h ^ (h >> 32)
+
+
+def _read_varint(buffer: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _bloom_filter_bitset(buffer: bytes) -> bytes:
+    """
+    Bitset de un filtro de Bloom de Parquet (cabecera Thrift compacta + bits)
+    
+    La cabecera (BloomFilterHeader) solo tiene numBytes (i32) y tres
+    structs vacíos que identifican algoritmo, hash y compresión (solo
+    existen BLOCK, XXHASH y UNCOMPRESSED).
+    """
+    pos, num_bytes, depth = 0, None, 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        if byte == 0:                      # fin de struct
+            if depth == 0:
+                break
+            depth -= 1
+            continue
+        field_type = byte & 0x0F
+        if field_type == 5:                # i32 (zigzag)
+            value, pos = _read_varint(buffer, pos)
+            if depth == 0 and byte >> 4 == 1:
+                num_bytes = (value >> 1) ^ -(value & 1)
+        elif field_type == 12:             # struct anidado
+            depth += 1
+        else:
+            raise ValueError(f"Cabecera de filtro de Bloom no soportada (tipo {field_type})")
+    if num_bytes is None:
+        raise ValueError("Cabecera de filtro de Bloom sin numBytes")
+    return buffer[pos:pos + num_bytes]
+
+
+def bloom_filter_might_contain(bitset: bytes, value_hash: int) -> bool:
+    """
+    Consulta un filtro de Bloom por bloques de Parquet
+    
+    Args:
+        bitset: Bits del filtro (bloques de 32 bytes)
+        value_hash: XXH64 del valor en codificación PLAIN
+        
+    Returns:
+        False si el valor seguro no está; True si puede estar
+    """
+    num_blocks = len(bitset) // 32
+    block = (((value_hash >> 32) * num_blocks) >> 32) * 32
+    key = value_hash & 0xFFFFFFFF
+    for i, salt in enumerate(_BLOOM_SALTS):
+        word = int.from_bytes(bitset[block + 4 * i:block + 4 * i + 4], 'little')
+        if not word & (1 << (((key * salt) & 0xFFFFFFFF) >> 27)):
+            return False
+    return True
+
+
+def _plain_bytes(value) -> bytes:
+    """Codificación PLAIN de Parquet de un valor de búsqueda (enteros INT64 o texto)"""
+    if isinstance(value, (int, np.integer)):
+        return int(value).to_bytes(8, 'little', signed=True)
+    return str(value).encode('utf-8')
+
+
+def _row_group_might_contain(metadata: pq.FileMetaData, file_obj, row_group: int,
+                             column_index: int, value) -> bool:
+    """Descarta un row group por estadísticas min/max o por filtro de Bloom"""
+    chunk = metadata.row_group(row_group).column(column_index)
+    stats = chunk.statistics
+    if stats is not None and stats.has_min_max and not stats.min <= value <= stats.max:
+        return False
+    if chunk.bloom_filter_offset is None or not chunk.bloom_filter_length:
+        return True
+    file_obj.seek(chunk.bloom_filter_offset)
+    bitset = _bloom_filter_bitset(file_obj.read(chunk.bloom_filter_length))
+    return bloom_filter_might_contain(bitset, xxhash64(_plain_bytes(value)))
+
+
+def lookup_silver(silver_path: Path, column: str, value,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Lee solo las filas de Silver con column == value (búsqueda puntual)
+    
+    Para cada row group se consultan primero las estadísticas min/max y
+    luego el filtro de Bloom de la columna, leyendo solo el footer y unos
+    pocos bytes del filtro; únicamente los row groups que pueden contener
+    el valor se leen y filtran. Pensado para CustomerID e InvoiceNo
+    (Config.SILVER_BLOOM_FILTER_COLUMNS); con otras columnas, o en
+    particiones sin filtro (modo por chunks sin
+    Config.SILVER_CHUNKED_BLOOM_FILTERS), solo se usan las estadísticas.
+    
+    La poda se detiene en el row group: aunque Silver escribe el índice de
+    páginas, aquí no se usa para saltar páginas, así que cada row group
+    candidato se lee entero. El coste de una búsqueda depende por tanto del
+    row_group_size de Config.PARQUET_SETTINGS['silver'].
+    
+    Args:
+        silver_path: Dataset (o archivo) Silver
+        column: Columna de búsqueda, p. ej. 'CustomerID' o 'InvoiceNo'
+        value: Valor buscado
+        columns: Columnas a devolver (por defecto todas)
+        
+    Returns:
+        DataFrame Silver con las filas encontradas (las columnas categóricas
+        solo llevan los valores leídos, sin el diccionario global)
+    """
+    dataset = _silver_dataset(silver_path)
+    if pa.types.is_integer(dataset.schema.field(column).type):
+        value = int(value)
+    else:
+        value = str(value)
+    
+    selected = []
+    for fragment in dataset.get_fragments():
+        metadata = fragment.metadata
+        column_index = fragment.physical_schema.get_field_index(column)
+        with open(fragment.path, 'rb') as file_obj:
+            row_groups = [i for i in range(metadata.num_row_groups)
+                          if _row_group_might_contain(metadata, file_obj, i, column_index, value)]
+        if row_groups:
+            selected.append(fragment.subset(row_group_ids=row_groups))
+    
+    candidates = ds.FileSystemDataset(selected, dataset.schema, dataset.format)
+    table = candidates.to_table(columns=columns, filter=ds.field(column) == value)
+    return _compact_dictionaries(table).to_pandas()
+
+
+# ==================== CAPA SILVER: MODO POR CHUNKS ====================
+
+class RowHashSet:
+    """
+    Conjunto de hashes de fila (uint64) para deduplicar entre chunks
+    
+    Se guarda como niveles de arrays ordenados que se fusionan al crecer
+    (estilo LSM): 8 bytes por fila distinta y búsquedas con searchsorted,
+    sin estructuras Python por elemento.
+    """
+    
+    def __init__(self):
+        self._levels: List[np.ndarray] = []
+    
+    def __len__(self) -> int:
+        return sum(len(level) for level in self._levels)
+    
+    def _contains(self, hashes: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(hashes), dtype=bool)
+        for level in self._levels:
+            pos = np.searchsorted(level, hashes)
+            pos[pos == len(level)] = 0
+            found |= level[pos] == hashes
+        return found
+    
+    def add_new(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Registra los hashes y devuelve la máscara de los que no se habían visto
+        
+        Dentro del mismo lote solo se considera nueva la primera aparición,
+        igual que drop_duplicates(keep='first').
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        is_new = ~pd.Series(hashes).duplicated().to_numpy()
+        if self._levels:
+            is_new &= ~self._contains(hashes)
+        
+        level = np.sort(hashes[is_new])
+        while self._levels and len(self._levels[-1]) <= len(level):
+            level = np.union1d(self._levels.pop(), level)
+        if len(level):
+            self._levels.append(level)
+        return is_new
+
+
+def _clean_row_group(bronze_path: str, index: int,
+                     keep_raw: bool = False) -> Tuple[Dict, np.ndarray, np.ndarray, np.ndarray,
+                                                      pa.Table, pd.DataFrame, Optional[pa.Table]]:
+    """
+    Limpia un row group de Bronze (función de nivel módulo para poder ejecutarse en workers)
+    
+    Args:
+        bronze_path: Snapshot Bronze de entrada
+        index: Índice del row group
+        keep_raw: Devolver también el row group crudo (para la cuarentena)
+        
+    Returns:
+        Tupla (perfil de calidad sin duplicados, hash de cada fila cruda,
+        máscara de CustomerID presente, máscara de valores en rango, tabla
+        Silver de las filas que cumplen ambas, devoluciones con CustomerID
+        indexadas por posición en el chunk, row group crudo o None)
+    """
+    raw = pq.ParquetFile(bronze_path).read_row_group(index)
+    chunk = raw.to_pandas()
+    profile, hashes = profile_quality(chunk)
+    customer_valid = chunk['CustomerID'].notna().to_numpy()
+    values_valid = _valid_values_mask(chunk).to_numpy()
+    df_clean = _derive_silver_columns(chunk[customer_valid & values_valid])
+    return (profile, hashes, customer_valid, values_valid,
+            pa.Table.from_pandas(df_clean, schema=SILVER_SCHEMA, preserve_index=False),
+            chunk[customer_valid & cancellation_mask(chunk)], raw if keep_raw else None)
+
+
+def _map_row_groups(func: Callable, path: Path, num_row_groups: int, workers: int) -> Iterator:
+    """
+    Aplica func(path, índice) a cada row group y produce los resultados en orden
+    
+    Con varios workers se reparten en un ProcessPoolExecutor manteniendo como
+    máximo 2 * workers row groups en vuelo, para que la memoria siga acotada
+    aunque el consumidor sea más lento.
+    """
+    return _map_tasks(func, [(str(path), i) for i in range(num_row_groups)], workers)
+
+
+def _map_tasks(func: Callable, tasks: List[Tuple], workers: int) -> Iterator:
+    """Aplica func(*args) a cada tarea y produce los resultados en orden (ver _map_row_groups)"""
+    if workers <= 1:
+        for args in tasks:
+            yield func(*args)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for args in tasks:
+            pending.append(pool.submit(func, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def transform_silver_chunked(bronze_path: Path, logger: logging.Logger,
+                             workers: Optional[int] = None, quarantine: bool = False) -> Optional[Path]:
+    """
+    Transforma Bronze a Silver row group a row group con memoria acotada
+    
+    Cada row group de Bronze se limpia con las mismas reglas que
+    transform_silver (en paralelo si workers > 1), se deduplica en orden
+    contra un RowHashSet global y se añade a la partición Year/Month que le
+    corresponde (un ParquetWriter abierto por partición), de modo que nunca
+    hay más que unos pocos chunks en memoria.
+    
+    Args:
+        bronze_path: Snapshot Bronze de entrada
+        logger: Logger para registro
+        workers: Procesos para limpiar row groups (por defecto Config.SILVER_WORKERS, 0 = todos los núcleos)
+        quarantine: Guardar las filas rechazadas en la cuarentena (un snapshot
+            para todo el Bronze, escrito a medida que se procesan los chunks)
+        
+    Returns:
+        Ruta del dataset Silver escrito o None si falla
+    """
+    logger.info("\nETAPA 2: TRANSFORMACIÓN POR CHUNKS (SILVER LAYER)")
+    logger.info("-" * 60)
+    
+    workers = Config.SILVER_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    tmp_path = quarantine_writer = None
+    
+    try:
+        start = time.perf_counter()
+        num_row_groups = pq.ParquetFile(bronze_path).num_row_groups
+        filepath = _new_silver_path()
+        tmp_path = filepath.with_suffix('.tmp')
+        tmp_path.mkdir(parents=True)
+        
+        seen = RowHashSet()
+        profile = _empty_profile(BRONZE_SCHEMA.names, Config.QUALITY_HLL_PRECISION)
+        rejections = {rule: 0 for rule in SILVER_REJECTION_RULES}
+        returns = []
+        final_rows = 0
+        if quarantine:
+            quarantine_writer = QuarantineWriter()
+        dictionaries = {col: set() for col in SILVER_DICTIONARY_COLUMNS}
+        writers = {}
+        
+        try:
+            clean = functools.partial(_clean_row_group, keep_raw=quarantine)
+            for chunk_profile, hashes, customer_valid, values_valid, table, chunk_returns, raw in \
+                    _map_row_groups(clean, bronze_path, num_row_groups, workers):
+                # La deduplicación se hace aquí, en orden, para conservar keep='first'
+                duplicated = mark_duplicates(chunk_profile, hashes, seen)
+                profile = merge_quality_profiles(profile, chunk_profile)
+                codes, chunk_rejections = silver_rejection_codes(duplicated, customer_valid, values_valid)
+                rejections = {rule: rejections[rule] + chunk_rejections[rule] for rule in rejections}
+                if quarantine_writer is not None:
+                    quarantine_writer.write(raw, codes)
+                returns.append(chunk_returns[~duplicated[chunk_returns.index.to_numpy()]])
+                
+                table = table.filter(pa.array((codes == 0)[customer_valid & values_valid]))
+                final_rows += table.num_rows
+                for values, part in _split_partitions(table):
+                    if values not in writers:
+                        part_dir = tmp_path / _partition_dir(values)
+                        part_dir.mkdir(parents=True, exist_ok=True)
+                        writers[values] = pq.ParquetWriter(part_dir / 'part-0.parquet', part.schema,
+                                                           **parquet_options('silver'))
+                    writers[values].write_table(part, row_group_size=parquet_row_group_size('silver'))
+                
+                # Acumular los valores presentes para el diccionario global
+                for col in SILVER_DICTIONARY_COLUMNS:
+                    for chunk in table.column(col).chunks:
+                        dictionaries[col].update(chunk.dictionary.take(pc.unique(chunk.indices)).to_pylist())
+        finally:
+            for writer in writers.values():
+                writer.close()
+        
+        # Las devoluciones pueden casar con ventas de chunks anteriores: se
+        # reparten sobre las particiones ya escritas
+        partition_files = [tmp_path / _partition_dir(values) / 'part-0.parquet' for values in sorted(writers)]
+        returned = match_returns_partitions(partition_files, pd.concat(returns), logger) if returns else {}
+        
+        # El clustering, los filtros de Bloom y las devoluciones necesitan la
+        # partición completa: se reescriben solo los archivos que lo
+        # requieren (memoria acotada por la partición más grande)
+        rewrite_all = Config.SILVER_CLUSTER_BY or (Config.SILVER_CHUNKED_BLOOM_FILTERS
+                                                   and Config.SILVER_BLOOM_FILTER_COLUMNS)
+        for path in partition_files:
+            if rewrite_all or path in returned:
+                _rewrite_partition_file(path, returned.get(path))
+        
+        quarantine_path = quarantine_writer.commit() if quarantine_writer is not None else None
+        _write_silver_dictionaries(filepath, {col: sorted(values) for col, values in dictionaries.items()})
+        os.replace(tmp_path, filepath)
+        elapsed = time.perf_counter() - start
+        initial_rows = profile['total_rows']
+        
+        log_quality_profile(profile, logger)
+        _log_rejections(rejections, logger)
+        if quarantine_path is not None:
+            logger.info(f"✓ Filas rechazadas en cuarentena: {quarantine_writer.rows:,} ({quarantine_path})")
+        logger.info("✓ Transformación por chunks completada:")
+        logger.info(f"  - Row groups procesados: {num_row_groups} ({workers} worker(s))")
+        logger.info(f"  - Registros iniciales: {initial_rows:,}")
+        logger.info(f"  - Registros finales: {final_rows:,}")
+        logger.info(f"  - Particiones ({'/'.join(Config.SILVER_PARTITION_COLS)}): {len(writers)}")
+        if Config.SILVER_CLUSTER_BY:
+            logger.info(f"  - Clustering ({Config.SILVER_CLUSTER_ORDER}): {', '.join(Config.SILVER_CLUSTER_BY)}")
+        logger.info(f"  - Velocidad: {initial_rows / max(elapsed, 1e-9):,.0f} filas/s")
+        logger.info(f"✓ Datos guardados en: {filepath}")
+        
+        return filepath
+        
+    except Exception as e:
+        logger.error(f"✗ Error en transformación Silver por chunks: {str(e)}")
+        if tmp_path is not None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        if quarantine_writer is not None:
+            quarantine_writer.abort()
+        return None
+
+
+# ==================== CAPA GOLD: AGREGACIÓN ====================
+
+def aggregate_sales_by_country(df: pd.DataFrame, logger: logging.Logger) -> Optional[pd.DataFrame]:
+    """
+    Agrega ventas por país
+    
+    Args:
+        df: DataFrame de capa Silver
+        logger: Logger para registro
+        
+    Returns:
+        DataFrame agregado
+    """
+    try:
+        logger.info("Creando agregación: Ventas por País")
+        
+        df_country = df.groupby('Country', observed=True).agg({
+            'InvoiceNo': 'nunique',
+            'CustomerID': 'nunique',
+            'Quantity': 'sum',
+            'TotalPrice': 'sum',
+            'NetTotalPrice': 'sum'
+        }).reset_index()
+        
+        df_country.columns = ['Country', 'TotalOrders', 'UniqueCustomers', 
+                              'TotalQuantity', 'TotalRevenue', 'NetRevenue']
+        
+        df_country['AvgOrderValue'] = df_country['TotalRevenue'] / df_country['TotalOrders']
+        df_country = df_country.sort_values('TotalRevenue', ascending=False)
+        
+        logger.info(f"  ✓ Agregación completada: {len(df_country)} países")
+        
+        return df_country
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en agregación por país: {str(e)}")
+        return None
+
+
+def aggregate_sales_by_time(df: pd.DataFrame, logger: logging.Logger) -> Optional[pd.DataFrame]:
+    """
+    Agrega ventas por período temporal
+    
+    Args:
+        df: DataFrame de capa Silver
+        logger: Logger para registro
+        
+    Returns:
+        DataFrame agregado
+    """
+    try:
+        logger.info("Creando agregación: Ventas por Período")
+        
+        df['YearMonth'] = df['InvoiceDate'].dt.to_period('M').astype(str)
+        
+        df_time = df.groupby('YearMonth').agg({
+            'InvoiceNo': 'nunique',
+            'CustomerID': 'nunique',
+            'TotalPrice': ['sum', 'mean'],
+            'Quantity': 'sum',
+            'NetTotalPrice': 'sum'
+        }).reset_index()
+        
+        df_time.columns = ['YearMonth', 'TotalOrders', 'UniqueCustomers', 
+                          'TotalRevenue', 'AvgOrderValue', 'TotalQuantity', 'NetRevenue']
+        df_time = df_time[['YearMonth', 'TotalOrders', 'UniqueCustomers', 'TotalRevenue',
+                           'NetRevenue', 'AvgOrderValue', 'TotalQuantity']]
+        
+        logger.info(f"  ✓ Agregación completada: {len(df_time)} períodos")
+        
+        return df_time
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en agregación temporal: {str(e)}")
+        return None
+
+
+def aggregate_top_products(df: pd.DataFrame, logger: logging.Logger, top_n: int = 50) -> Optional[pd.DataFrame]:
+    """
+    Identifica productos más vendidos
+    
+    Args:
+        df: DataFrame de capa Silver
+        logger: Logger para registro
+        top_n: Número de productos top
+        
+    Returns:
+        DataFrame con top productos
+    """
+    try:
+        logger.info(f"Creando agregación: Top {top_n} Productos")
+        
+        df_products = df.groupby(['StockCode', 'Description'], observed=True).agg({
+            'Quantity': 'sum',
             'TotalPrice': 'sum',
+            'NetTotalPrice': 'sum',
+            'InvoiceNo': 'nunique',
+            'CustomerID': 'nunique'
+        }).reset_index()
+        
+        df_products.columns = ['StockCode', 'Description', 'TotalQuantitySold', 
+                               'TotalRevenue', 'NetRevenue', 'TotalOrders', 'UniqueCustomers']
+        
+        # Top-K sin ordenar el catálogo completo; derivadas solo del top
+        df_products = df_products.iloc[top_k_indices(df_products['TotalRevenue'].to_numpy(), top_n)].copy()
+        df_products['AvgPricePerUnit'] = df_products['TotalRevenue'] / df_products['TotalQuantitySold']
+        df_products['AvgQuantityPerOrder'] = df_products['TotalQuantitySold'] / df_products['TotalOrders']
+        
+        logger.info(f"  ✓ Top productos identificados")
+        
+        return df_products
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en agregación de productos: {str(e)}")
+        return None
+
+
+def rfm_scores(values: np.ndarray, levels: int, higher_is_better: bool = True) -> np.ndarray:
+    """
+    Puntúa cada valor de 1 a levels según los cuantiles de la propia distribución
+    
+    Los cortes se calculan una sola vez con np.quantile y cada valor se ubica
+    con una búsqueda binaria; los empates caen siempre en el mismo nivel (un
+    corte repetido deja niveles vacíos en lugar de repartir clientes iguales).
+    
+    Args:
+        values: Valor por cliente
+        levels: Número de niveles (5 = quintiles)
+        higher_is_better: Si False, los valores bajos reciben la puntuación alta
+        
+    Returns:
+        Array int8 con la puntuación de cada valor
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int8)
+    cuts = np.quantile(values, np.arange(1, levels) / levels)
+    bins = np.searchsorted(cuts, values, side='left')
+    scores = bins + 1 if higher_is_better else levels - bins
+    return scores.astype(np.int8)
+
+
+def derive_customer_metrics(df_customers: pd.DataFrame, levels: Optional[int] = None) -> pd.DataFrame:
+    """
+    Completa el agregado por cliente con métricas derivadas, segmento y RFM
+    
+    Se aplica igual sobre el agregado de pandas, el del motor unificado y el
+    combinado de los parciales, de modo que las puntuaciones salen de los
+    totales finales por cliente en todos los modos (en chunks o incremental no
+    hay pasadas extra sobre Silver). La recencia se mide en días hasta la
+    última compra del conjunto; frecuencia = pedidos, valor = gasto neto.
+    
+    Args:
+        df_customers: CustomerID, TotalOrders, TotalSpent, NetSpent, TotalItems,
+            FirstPurchase y LastPurchase por cliente
+        levels: Niveles de puntuación RFM (por defecto Config.RFM_LEVELS)
+        
+    Returns:
+        DataFrame con AvgOrderValue, CustomerLifetime, Segment, Recency,
+        RecencyScore, FrequencyScore, MonetaryScore y RFMScore añadidos
+    """
+    levels = levels or Config.RFM_LEVELS
+    df_customers = df_customers.copy()
+    df_customers['AvgOrderValue'] = df_customers['TotalSpent'] / df_customers['TotalOrders']
+    df_customers['CustomerLifetime'] = (df_customers['LastPurchase'] - df_customers['FirstPurchase']).dt.days
+    
+    # Crear segmentos
+    df_customers['Segment'] = pd.cut(
+        df_customers['TotalSpent'],
+        bins=[0, 1000, 5000, float('inf')],
+        labels=['Low Value', 'Medium Value', 'High Value']
+    )
+    
+    # Puntuación RFM
+    recency = (df_customers['LastPurchase'].max() - df_customers['LastPurchase']).dt.days
+    r = rfm_scores(recency.to_numpy(), levels, higher_is_better=False)
+    f = rfm_scores(df_customers['TotalOrders'].to_numpy(), levels)
+    m = rfm_scores(df_customers['NetSpent'].to_numpy(), levels)
+    df_customers['Recency'] = recency.astype('int64')
+    df_customers['RecencyScore'] = r
+    df_customers['FrequencyScore'] = f
+    df_customers['MonetaryScore'] = m
+    df_customers['RFMScore'] = (r.astype(np.int64) * 100 + f.astype(np.int64) * 10 + m).astype(str)
+    return df_customers
+
+
+def aggregate_customer_segments(df: pd.DataFrame, logger: logging.Logger) -> Optional[pd.DataFrame]:
+    """
+    Crea segmentación de clientes basada en comportamiento de compra
+    
+    Args:
+        df: DataFrame de capa Silver
+        logger: Logger para registro
+        
+    Returns:
+        DataFrame con segmentos de clientes
+    """
+    try:
+        logger.info("Creando agregación: Segmentación de Clientes")
+        
+        df_customers = df.groupby('CustomerID').agg({
             'InvoiceNo': 'nunique',
-            'CustomerID': 'nunique'
+            'TotalPrice': 'sum',
+            'NetTotalPrice': 'sum',
+            'Quantity': 'sum',
+            'InvoiceDate': ['min', 'max']
         }).reset_index()
         
-        df_products.columns = ['StockCode', 'Description', 'TotalQuantitySold', 
-                               'TotalRevenue', 'TotalOrders', 'UniqueCustomers']
+        df_customers.columns = ['CustomerID', 'TotalOrders', 'TotalSpent', 'NetSpent',
+                               'TotalItems', 'FirstPurchase', 'LastPurchase']
+        
+        # Calcular métricas derivadas
+        df_customers = derive_customer_metrics(df_customers)
+        
+        logger.info(f"  ✓ {len(df_customers)} clientes segmentados")
+        
+        return df_customers
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en segmentación de clientes: {str(e)}")
+        return None
+
+
+def aggregate_customer_cohorts(df: pd.DataFrame, df_customers: pd.DataFrame,
+                               logger: logging.Logger) -> Optional[pd.DataFrame]:
+    """
+    Crea la retención mensual por cohorte (mes de la primera compra)
+    
+    Args:
+        df: DataFrame de capa Silver
+        df_customers: Segmentación de clientes (aporta FirstPurchase)
+        logger: Logger para registro
+        
+    Returns:
+        DataFrame con una fila por cohorte y meses desde la primera compra
+    """
+    try:
+        logger.info("Creando agregación: Cohortes de Clientes")
+        
+        first = df_customers.set_index('CustomerID')['FirstPurchase']
+        first_month = first.dt.year * 12 + first.dt.month - 1
+        cohort = df['CustomerID'].map(first_month).astype('int64')
+        month = df['InvoiceDate'].dt.year * 12 + df['InvoiceDate'].dt.month - 1
+        
+        df_cohorts = df.assign(Cohort=cohort, MonthsSinceFirst=month - cohort).groupby(
+            ['Cohort', 'MonthsSinceFirst']
+        ).agg(
+            ActiveCustomers=('CustomerID', 'nunique'),
+            TotalRevenue=('TotalPrice', 'sum'),
+            NetRevenue=('NetTotalPrice', 'sum')
+        ).reset_index()
+        
+        df_cohorts['CohortSize'] = df_cohorts.groupby('Cohort')['ActiveCustomers'].transform('first')
+        df_cohorts['RetentionRate'] = df_cohorts['ActiveCustomers'] / df_cohorts['CohortSize']
+        df_cohorts['CohortMonth'] = _year_month_labels(df_cohorts['Cohort'].to_numpy())
+        df_cohorts = df_cohorts[['CohortMonth', 'MonthsSinceFirst', 'ActiveCustomers', 'CohortSize',
+                                 'RetentionRate', 'TotalRevenue', 'NetRevenue']]
+        
+        logger.info(f"  ✓ {df_cohorts['CohortMonth'].nunique()} cohortes")
+        
+        return df_cohorts
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en cohortes de clientes: {str(e)}")
+        return None
+
+
+# ==================== CAPA GOLD: MOTOR UNIFICADO ====================
+
+# Rankings de productos (tabla Gold -> medida por la que se ordena), todos
+# seleccionados sobre la misma agregación por producto
+PRODUCT_RANKINGS = {
+    'top_products': 'TotalRevenue',
+    'top_products_by_quantity': 'TotalQuantitySold',
+    'top_products_by_orders': 'TotalOrders'
+}
+
+# Tablas Gold que produce el pipeline
+GOLD_TABLES = ['sales_by_country', 'sales_by_time', *PRODUCT_RANKINGS, 'customer_segments',
+               'customer_cohorts']
+
+
+def top_k_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Posiciones de los k valores mayores, de mayor a menor, sin ordenar todo
+    
+    np.partition localiza el umbral del k-ésimo valor en O(n) y solo se
+    ordenan los candidatos que lo alcanzan. Todos los empates con el umbral
+    entran como candidatos y se ordenan de forma estable, así que los
+    empates (también los que quedan cortados en la posición k) se resuelven
+    por la posición más baja: el resultado es exactamente
+    sort_values(ascending=False, kind='stable').head(k).
+    
+    Args:
+        values: Medida por la que se ordena
+        k: Número de posiciones a devolver
+        
+    Returns:
+        Array de posiciones (como mucho k)
+    """
+    values = np.asarray(values)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= len(values):
+        candidates = np.arange(len(values))
+    else:
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        candidates = np.flatnonzero(values >= threshold)
+    order = np.argsort(-values[candidates], kind='stable')[:k]
+    return candidates[order]
+
+
+def select_top_products(df_products: pd.DataFrame, top_n: int) -> Dict[str, pd.DataFrame]:
+    """
+    Selecciona todos los rankings de productos en una sola pasada
+    
+    Cada ranking de PRODUCT_RANKINGS se elige con top_k_indices sobre la
+    agregación por producto y las columnas derivadas se calculan solo para
+    la unión de productos seleccionados.
+    
+    Args:
+        df_products: Agregación por producto (StockCode, Description,
+            TotalQuantitySold, TotalRevenue, NetRevenue, TotalOrders, UniqueCustomers)
+        top_n: Productos por ranking
+        
+    Returns:
+        Diccionario tabla de ranking -> DataFrame ordenado
+    """
+    selected = {
+        name: top_k_indices(df_products[column].to_numpy(), top_n)
+        for name, column in PRODUCT_RANKINGS.items()
+    }
+    rows = np.unique(np.concatenate(list(selected.values())))
+    
+    df_top = df_products.iloc[rows][['StockCode', 'Description', 'TotalQuantitySold',
+                                     'TotalRevenue', 'NetRevenue', 'TotalOrders', 'UniqueCustomers']]
+    df_top['AvgPricePerUnit'] = df_top['TotalRevenue'] / df_top['TotalQuantitySold']
+    df_top['AvgQuantityPerOrder'] = df_top['TotalQuantitySold'] / df_top['TotalOrders']
+    
+    return {name: df_top.iloc[np.searchsorted(rows, positions)] for name, positions in selected.items()}
+
+
+def _factorize(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Códigos enteros ordenados (uniques ordenados) de una columna clave"""
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), np.asarray(uniques)
+
+
+def _count_distinct(group_codes: np.ndarray, key_codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    nunique de key por grupo sobre códigos enteros
+    
+    Cada par (grupo, clave) se codifica en un único int64 y se cuentan los
+    pares distintos por grupo, sin hashear strings.
+    """
+    n_keys = int(key_codes.max()) + 1 if len(key_codes) else 1
+    pairs = pd.unique(group_codes * n_keys + key_codes)
+    return np.bincount(pairs // n_keys, minlength=n_groups)
+
+
+def _group_sum(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Suma por grupo con bincount (conserva enteros si la columna es entera)"""
+    sums = np.bincount(codes, weights=values, minlength=n_groups)
+    return sums.round().astype(np.int64) if np.issubdtype(values.dtype, np.integer) else sums
+
+
+def _group_min_max(codes: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mínimo y máximo por grupo (códigos 0..n-1 todos presentes) con reduceat"""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    sorted_values = values[order]
+    return np.minimum.reduceat(sorted_values, starts), np.maximum.reduceat(sorted_values, starts)
+
+
+def _month_numbers(dates: pd.Series) -> np.ndarray:
+    """Número de mes absoluto (año * 12 + mes - 1) de cada fecha"""
+    return dates.dt.year.to_numpy(np.int64) * 12 + dates.dt.month.to_numpy(np.int64) - 1
+
+
+def _year_month_labels(month_numbers: np.ndarray) -> np.ndarray:
+    """Etiquetas 'YYYY-MM' de números de mes absolutos"""
+    return np.array([f'{m // 12:04d}-{m % 12 + 1:02d}' for m in month_numbers], dtype=object)
+
+
+def build_customer_cohorts(customer: np.ndarray, month: np.ndarray, first_month: np.ndarray,
+                           revenue: np.ndarray, net_revenue: np.ndarray) -> pd.DataFrame:
+    """
+    Retención mensual por cohorte sobre códigos enteros
+    
+    Cada fila cae en la celda (cohorte, meses desde la primera compra),
+    codificada como un único entero en una rejilla densa, y clientes activos
+    e importes se cuentan con bincount sin joins ni pivotes. Sirve igual para
+    filas de Silver que para los pares (cliente, mes) de los parciales.
+    
+    Args:
+        customer: Código de cliente (0..n-1) de cada fila
+        month: Número de mes absoluto de cada fila
+        first_month: Número de mes de la primera compra de cada cliente
+        revenue: Importe bruto de cada fila
+        net_revenue: Importe neto de devoluciones de cada fila
+        
+    Returns:
+        DataFrame ordenado por CohortMonth y MonthsSinceFirst
+    """
+    cohort = first_month[customer]
+    first_cohort = int(cohort.min()) if len(cohort) else 0
+    n_ages = int((month - cohort).max()) + 1 if len(cohort) else 1
+    n_cells = (int(cohort.max()) - first_cohort + 1) * n_ages if len(cohort) else 0
+    cell = (cohort - first_cohort) * n_ages + month - cohort
+    
+    active = _count_distinct(cell, customer, n_cells)
+    present = np.flatnonzero(active)
+    cohort_size = active[present - present % n_ages]
+    return pd.DataFrame({
+        'CohortMonth': _year_month_labels(present // n_ages + first_cohort),
+        'MonthsSinceFirst': present % n_ages,
+        'ActiveCustomers': active[present],
+        'CohortSize': cohort_size,
+        'RetentionRate': active[present] / cohort_size,
+        'TotalRevenue': _group_sum(cell, revenue, n_cells)[present],
+        'NetRevenue': _group_sum(cell, net_revenue, n_cells)[present]
+    })
+
+
+def build_gold_tables(df: pd.DataFrame, logger: logging.Logger,
+                      top_n: int = 50) -> Dict[str, Optional[pd.DataFrame]]:
+    """
+    Construye las tablas Gold a partir de códigos enteros compartidos
+    
+    Las columnas clave (InvoiceNo, CustomerID, Country, producto, mes) se
+    factorizan una sola vez y todas las sumas y nunique se calculan con
+    bincount / np.unique sobre esos códigos. Produce exactamente los mismos
+    esquemas que aggregate_sales_by_country, aggregate_sales_by_time,
+    aggregate_top_products y aggregate_customer_segments.
+    
+    Args:
+        df: DataFrame de capa Silver
+        logger: Logger para registro
+        top_n: Número de productos top
+        
+    Returns:
+        Diccionario nombre de tabla -> DataFrame (None si falla)
+    """
+    try:
+        logger.info("Creando agregaciones Gold (motor unificado)")
+        start = time.perf_counter()
+        
+        # Factorizar claves una sola vez
+        invoice, _ = _factorize(df['InvoiceNo'])
+        customer, customer_ids = _factorize(df['CustomerID'])
+        country, countries = _factorize(df['Country'])
+        
+        dates = df['InvoiceDate']
+        month_number = _month_numbers(dates)
+        month, month_numbers = _factorize(pd.Series(month_number))
+        year_months = _year_month_labels(month_numbers)
+        
+        stock, stock_codes = _factorize(df['StockCode'])
+        description, descriptions = _factorize(df['Description'])
+        product, product_keys = _factorize(pd.Series(stock * len(descriptions) + description))
+        
+        quantity = df['Quantity'].to_numpy()
+        revenue = df['TotalPrice'].to_numpy(np.float64)
+        net_revenue = df['NetTotalPrice'].to_numpy(np.float64)
+        
+        # Ventas por país
+        n = len(countries)
+        df_country = pd.DataFrame({
+            'Country': countries,
+            'TotalOrders': _count_distinct(country, invoice, n),
+            'UniqueCustomers': _count_distinct(country, customer, n),
+            'TotalQuantity': _group_sum(country, quantity, n),
+            'TotalRevenue': _group_sum(country, revenue, n),
+            'NetRevenue': _group_sum(country, net_revenue, n)
+        })
+        df_country['AvgOrderValue'] = df_country['TotalRevenue'] / df_country['TotalOrders']
+        df_country = df_country.sort_values('TotalRevenue', ascending=False)
+        
+        # Ventas por período
+        n = len(year_months)
+        df_time = pd.DataFrame({
+            'YearMonth': year_months,
+            'TotalOrders': _count_distinct(month, invoice, n),
+            'UniqueCustomers': _count_distinct(month, customer, n),
+            'TotalRevenue': _group_sum(month, revenue, n),
+            'NetRevenue': _group_sum(month, net_revenue, n),
+            'AvgOrderValue': _group_sum(month, revenue, n) / np.bincount(month, minlength=n),
+            'TotalQuantity': _group_sum(month, quantity, n)
+        })
+        
+        # Top productos
+        n = len(product_keys)
+        product_keys = product_keys.astype(np.int64)
+        df_products = pd.DataFrame({
+            'StockCode': stock_codes[product_keys // len(descriptions)],
+            'Description': descriptions[product_keys % len(descriptions)],
+            'TotalQuantitySold': _group_sum(product, quantity, n),
+            'TotalRevenue': _group_sum(product, revenue, n),
+            'NetRevenue': _group_sum(product, net_revenue, n),
+            'TotalOrders': _count_distinct(product, invoice, n),
+            'UniqueCustomers': _count_distinct(product, customer, n)
+        })
+        product_rankings = select_top_products(df_products, top_n)
+        
+        # Segmentación de clientes
+        n = len(customer_ids)
+        first, last = _group_min_max(customer, dates.to_numpy())
+        df_customers = pd.DataFrame({
+            'CustomerID': customer_ids,
+            'TotalOrders': _count_distinct(customer, invoice, n),
+            'TotalSpent': _group_sum(customer, revenue, n),
+            'NetSpent': _group_sum(customer, net_revenue, n),
+            'TotalItems': _group_sum(customer, quantity, n),
+            'FirstPurchase': first,
+            'LastPurchase': last
+        })
+        df_customers = derive_customer_metrics(df_customers)
+        
+        # Cohortes de clientes (mes de FirstPurchase de cada código de cliente)
+        first_month = _month_numbers(df_customers['FirstPurchase'])
+        df_cohorts = build_customer_cohorts(customer, month_number, first_month, revenue, net_revenue)
+        
+        logger.info(f"  ✓ {len(df_country)} países, {len(df_time)} períodos, "
+                    f"top {top_n} de {len(df_products)} productos ({len(product_rankings)} rankings), "
+                    f"{len(df_customers)} clientes, {df_cohorts['CohortMonth'].nunique()} cohortes "
+                    f"({time.perf_counter() - start:.2f} s)")
+        
+        return {
+            'sales_by_country': df_country,
+            'sales_by_time': df_time,
+            **product_rankings,
+            'customer_segments': df_customers,
+            'customer_cohorts': df_cohorts
+        }
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en motor Gold unificado: {str(e)}")
+        return {name: None for name in GOLD_TABLES}
+
+
+# ==================== SKETCHES DE CARDINALIDAD (HYPERLOGLOG) ====================
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Número de bits significativos de cada entero uint64 (0 para el 0)"""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+def hll_registers(group_codes: np.ndarray, key_hashes: np.ndarray,
+                  n_groups: int, precision: int) -> np.ndarray:
+    """
+    Construye los registros HyperLogLog de cada grupo
+    
+    Los `precision` bits altos del hash eligen el registro y el resto
+    aporta el rango (posición del primer 1); cada registro guarda el máximo.
+    
+    Args:
+        group_codes: Código de grupo (0..n_groups-1) de cada fila
+        key_hashes: Hash uint64 de la clave de cada fila
+        n_groups: Número de grupos
+        precision: Bits de índice (2**precision registros por grupo)
+        
+    Returns:
+        Matriz uint8 (n_groups, 2**precision)
+    """
+    key_hashes = np.asarray(key_hashes, dtype=np.uint64)
+    tail_bits = 64 - precision
+    index = (key_hashes >> np.uint64(tail_bits)).astype(np.int64)
+    tail = key_hashes & np.uint64((1 << tail_bits) - 1)
+    rank = (tail_bits + 1 - _bit_length(tail)).astype(np.uint8)
+    
+    registers = np.zeros((n_groups, 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers, (np.asarray(group_codes, dtype=np.int64), index), rank)
+    return registers
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """
+    Estima la cardinalidad de cada fila de registros HyperLogLog
+    
+    Usa el estimador armónico con corrección de rango bajo (linear
+    counting); con hashes de 64 bits no hace falta la de rango alto.
+    
+    Args:
+        registers: Matriz uint8 (grupos, 2**precision)
+        
+    Returns:
+        Array float con la cardinalidad estimada por grupo
+    """
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    estimate[small] = m * np.log(m / zeros[small])
+    return estimate
+
+
+def hll_relative_error(precision: int) -> float:
+    """Error estándar relativo de HyperLogLog (1.04 / sqrt(2**precision))"""
+    return 1.04 / np.sqrt(1 << precision)
+
+
+def _hll_frame(groups: pd.DataFrame, registers: np.ndarray) -> pd.DataFrame:
+    """Sketch HLL como DataFrame: columnas de grupo + registros serializados"""
+    return groups.reset_index(drop=True).assign(Registers=[row.tobytes() for row in registers])
+
+
+def _hll_matrix(frame: pd.DataFrame) -> np.ndarray:
+    """Registros de un sketch HLL serializado como matriz uint8"""
+    if len(frame) == 0:
+        return np.zeros((0, 0), dtype=np.uint8)
+    return np.vstack([np.frombuffer(row, dtype=np.uint8) for row in frame['Registers']])
+
+
+def _group_codes(frame: pd.DataFrame, groups: List[str]) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Código de grupo por fila y valores de grupo en el orden de los códigos"""
+    codes = frame.groupby(groups, observed=True, sort=False).ngroup().to_numpy()
+    first_rows = np.unique(codes, return_index=True)[1]
+    return codes, frame[groups].iloc[first_rows]
+
+
+def _hll_sketch(frame: pd.DataFrame, groups: List[str], key_hashes: np.ndarray,
+                precision: int) -> pd.DataFrame:
+    """Sketch HLL por grupo de un lote"""
+    codes, keys = _group_codes(frame, groups)
+    return _hll_frame(keys, hll_registers(codes, key_hashes, len(keys), precision))
+
+
+def _exact_frame(groups: pd.DataFrame, codes: np.ndarray, key_hashes: np.ndarray) -> pd.DataFrame:
+    """
+    Sketch exacto como DataFrame: columnas de grupo + hashes distintos
+    
+    Cada grupo se guarda una sola vez con su array uint64 de hashes de la
+    clave (columna list<uint64> en Parquet, cuyos valores se codifican con
+    diccionario). Ocupa 8 bytes por par (grupo, clave) distinto: es O(pares
+    distintos), no O(filas), y en tablas con miles de grupos pequeños
+    (productos, clientes) es menor que un HLL útil, que cuesta 2**p bytes
+    por grupo aunque el grupo tenga una sola clave.
+    
+    Args:
+        groups: Valores de grupo en el orden de los códigos
+        codes: Código de grupo de cada par
+        key_hashes: Hash de 64 bits de la clave de cada par
+        
+    Returns:
+        DataFrame con las columnas de grupo y KeyHashes
+    """
+    # Pares distintos como un único int64 (grupo, código denso del hash)
+    key_codes, uniques = pd.factorize(key_hashes)
+    n_keys = max(len(uniques), 1)
+    pairs = np.sort(pd.unique(codes * n_keys + key_codes))
+    codes, key_hashes = pairs // n_keys, np.asarray(uniques, dtype=np.uint64)[pairs % n_keys]
+    
+    arrays = np.empty(len(groups), dtype=object)
+    # Sin grupos np.split devolvería igualmente un tramo (vacío)
+    bounds = np.searchsorted(codes, np.arange(1, len(groups)))
+    for i, values in enumerate(np.split(key_hashes, bounds) if len(groups) else []):
+        arrays[i] = values
+    return groups.reset_index(drop=True).assign(KeyHashes=arrays)
+
+
+def _exact_pairs(frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Número de hashes de cada fila de un sketch exacto y todos los hashes concatenados"""
+    sizes = np.fromiter((len(values) for values in frame['KeyHashes']), dtype=np.int64, count=len(frame))
+    key_hashes = np.concatenate([np.zeros(0, dtype=np.uint64)] + list(frame['KeyHashes'])).astype(np.uint64)
+    return sizes, key_hashes
+
+
+def _merge_distinct_sketches(frames: List[pd.DataFrame], groups: List[str]) -> pd.DataFrame:
+    """
+    Combina sketches de distintos de la misma clave
+    
+    Los sketches exactos (hashes distintos por grupo) se unen; si alguno es
+    HLL, los exactos se convierten a HLL con la misma precisión y los
+    registros se combinan con el máximo elemento a elemento.
+    """
+    hll_frames = [f for f in frames if 'Registers' in f.columns]
+    if not hll_frames:
+        stacked = pd.concat(frames, ignore_index=True)
+        codes, keys = _group_codes(stacked, groups)
+        sizes, key_hashes = _exact_pairs(stacked)
+        return _exact_frame(keys, np.repeat(codes, sizes), key_hashes)
+    
+    widths = {len(registers) for f in hll_frames for registers in f['Registers'].iloc[:1]}
+    if len(widths) > 1:
+        raise ValueError(f"Sketches HLL con precisiones distintas: {sorted(widths)} registros")
+    if not widths:
+        # Solo sketches HLL vacíos: no aportan nada a los exactos
+        exact = [f for f in frames if 'Registers' not in f.columns]
+        return _merge_distinct_sketches(exact, groups) if exact else hll_frames[0]
+    precision = int(widths.pop()).bit_length() - 1
+    
+    converted = [f if 'Registers' in f.columns else _exact_to_hll(f, groups, precision) for f in frames]
+    stacked = pd.concat(converted, ignore_index=True)
+    codes, keys = _group_codes(stacked, groups)
+    registers = np.zeros((len(keys), 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers, codes, _hll_matrix(stacked))
+    return _hll_frame(keys, registers)
+
+
+def _exact_to_hll(frame: pd.DataFrame, groups: List[str], precision: int) -> pd.DataFrame:
+    """Convierte un sketch exacto (un grupo por fila) en registros HLL"""
+    sizes, key_hashes = _exact_pairs(frame)
+    codes = np.repeat(np.arange(len(frame)), sizes)
+    return _hll_frame(frame[groups], hll_registers(codes, key_hashes, len(frame), precision))
+
+
+def _distinct_counts(sketch: pd.DataFrame, groups: List[str], out: str) -> pd.DataFrame:
+    """Conteo de distintos por grupo desde un sketch exacto o HLL"""
+    if 'Registers' in sketch.columns:
+        counts = np.rint(hll_estimate(_hll_matrix(sketch))).astype(np.int64) if len(sketch) else []
+    else:
+        counts = _exact_pairs(sketch)[0]
+    return sketch[groups].reset_index(drop=True).assign(**{out: counts})
+
+
+# ==================== CAPA GOLD: AGREGADOS PARCIALES ====================
+
+# Agregados parciales por tabla Gold: columnas de grupo, medidas aditivas
+# (y mín/máx), claves sobre las que se cuentan distintos y si admiten
+# conteo aproximado (HLL); state_groups (por defecto groups) reparte el estado
+# incremental en buckets
+GOLD_PARTIAL_SPECS = {
+    'sales_by_country': {
+        'groups': ['Country'],
+        'sums': {'Quantity': 'TotalQuantity', 'TotalPrice': 'TotalRevenue', 'NetTotalPrice': 'NetRevenue'},
+        'distinct': {'InvoiceNo': 'TotalOrders', 'CustomerID': 'UniqueCustomers'},
+        'approx': True
+    },
+    'sales_by_time': {
+        'groups': ['YearMonth'],
+        'sums': {'TotalPrice': 'TotalRevenue', 'NetTotalPrice': 'NetRevenue', 'Quantity': 'TotalQuantity',
+                 'Lines': 'Lines'},
+        'distinct': {'InvoiceNo': 'TotalOrders', 'CustomerID': 'UniqueCustomers'},
+        'approx': True
+    },
+    'top_products': {
+        'groups': ['StockCode', 'Description'],
+        'sums': {'Quantity': 'TotalQuantitySold', 'TotalPrice': 'TotalRevenue', 'NetTotalPrice': 'NetRevenue'},
+        'distinct': {'InvoiceNo': 'TotalOrders', 'CustomerID': 'UniqueCustomers'}
+    },
+    'customer_segments': {
+        'groups': ['CustomerID'],
+        'sums': {'TotalPrice': 'TotalSpent', 'NetTotalPrice': 'NetSpent', 'Quantity': 'TotalItems'},
+        'distinct': {'InvoiceNo': 'TotalOrders'},
+        'min': {'InvoiceDate': 'FirstPurchase'},
+        'max': {'InvoiceDate': 'LastPurchase'}
+    },
+    # Base de customer_cohorts: importes por cliente y mes (la cohorte depende
+    # de la primera compra, que solo se conoce tras combinar todos los lotes).
+    # El estado incremental se reparte por mes: un delta solo toca meses nuevos
+    'customer_months': {
+        'groups': ['CustomerID', 'YearMonth'],
+        'sums': {'TotalPrice': 'TotalRevenue', 'NetTotalPrice': 'NetRevenue'},
+        'distinct': {},
+        'state_groups': ['YearMonth']
+    }
+}
+
+
+def _plain_values(series: pd.Series) -> pd.Series:
+    """Convierte una columna categórica en su tipo de valores (para combinar lotes)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(series.cat.categories.dtype)
+    return series
+
+
+def build_gold_partials(df: pd.DataFrame,
+                        hll_precision: Optional[int] = None) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """
+    Calcula los agregados parciales (combinables) de un lote de Silver
+    
+    Por tabla se guardan las medidas por grupo (sumas, conteo de líneas,
+    mín/máx de fechas) y, por cada conteo de distintos, un sketch exacto:
+    por grupo, los hashes de 64 bits distintos de la clave (_exact_frame). Con
+    hll_precision, las tablas que lo admiten guardan en su lugar registros
+    HyperLogLog de tamaño fijo por grupo. Dos lotes cualesquiera se combinan
+    con merge_gold_partials sin volver a leer Silver.
+    
+    Args:
+        df: DataFrame de capa Silver (lote completo, row group o delta)
+        hll_precision: Bits de índice HLL (None = conteo exacto)
+        
+    Returns:
+        Diccionario tabla -> {'measures': DataFrame, <clave>: DataFrame (grupo, KeyHashes | Registers)}
+    """
+    work = df[['InvoiceNo', 'StockCode', 'Description', 'Quantity', 'InvoiceDate',
+               'CustomerID', 'Country', 'TotalPrice', 'NetTotalPrice']].assign(
+        YearMonth=df['InvoiceDate'].dt.to_period('M').astype(str),
+        Lines=1
+    )
+    key_hashes = {
+        key: pd.util.hash_pandas_object(work[key], index=False).to_numpy()
+        for key in ['InvoiceNo', 'CustomerID']
+    }
+    
+    partials = {}
+    for table, spec in GOLD_PARTIAL_SPECS.items():
+        aggregations = {out: (col, 'sum') for col, out in spec['sums'].items()}
+        aggregations.update({out: (col, 'min') for col, out in spec.get('min', {}).items()})
+        aggregations.update({out: (col, 'max') for col, out in spec.get('max', {}).items()})
+        measures = work.groupby(spec['groups'], observed=True).agg(**aggregations).reset_index()
+        
+        partials[table] = {'measures': measures}
+        if spec['distinct'] and not (hll_precision and spec.get('approx')):
+            # Los códigos de grupo se calculan una vez por tabla para todas las claves
+            codes, keys = _group_codes(work, spec['groups'])
+        for key in spec['distinct']:
+            if hll_precision and spec.get('approx'):
+                partials[table][key] = _hll_sketch(work, spec['groups'], key_hashes[key], hll_precision)
+                continue
+            partials[table][key] = _exact_frame(keys, codes, key_hashes[key])
+        
+        for part in partials[table].values():
+            for col in spec['groups']:
+                part[col] = _plain_values(part[col])
+    
+    return partials
+
+
+def merge_gold_partials(*partials: Dict[str, Dict[str, pd.DataFrame]]) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """
+    Combina cualquier número de agregados parciales (asociativo y conmutativo)
+    
+    Sumas y conteos se suman, mín/máx se combinan y los sketches de
+    distintos se unen (los HLL con el máximo por registro). El resultado
+    no depende del orden ni de cómo se agrupen los lotes (row groups en
+    paralelo, estado previo + delta...).
+    
+    Args:
+        *partials: Agregados parciales a combinar
+        
+    Returns:
+        Agregados parciales combinados
+    """
+    return {table: _merge_table_partials(table, [p[table] for p in partials]) for table in GOLD_PARTIAL_SPECS}
+
+
+def _merge_table_partials(table: str, parts: List[Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    """Combina los agregados parciales de una sola tabla Gold"""
+    spec = GOLD_PARTIAL_SPECS[table]
+    measures = pd.concat([p['measures'] for p in parts], ignore_index=True)
+    agg = {out: 'sum' for out in spec['sums'].values()}
+    agg.update({out: 'min' for out in spec.get('min', {}).values()})
+    agg.update({out: 'max' for out in spec.get('max', {}).values()})
+    merged = {'measures': measures.groupby(spec['groups']).agg(agg).reset_index()}
+    
+    for key in spec['distinct']:
+        merged[key] = _merge_distinct_sketches([p[key] for p in parts], spec['groups'])
+    
+    return merged
+
+
+def _silver_row_group_partials(silver_file: str, index: int,
+                               hll_precision: Optional[int] = None) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """Agregados parciales de un row group de un archivo Silver (ejecutable en workers)"""
+    return build_gold_partials(pq.ParquetFile(silver_file).read_row_group(index).to_pandas(), hll_precision)
+
+
+def build_gold_partials_chunked(silver_path: Path, logger: logging.Logger,
+                                workers: Optional[int] = None,
+                                hll_precision: Optional[int] = None) -> Optional[Dict[str, Dict[str, pd.DataFrame]]]:
+    """
+    Calcula los agregados parciales de un archivo Silver row group a row group
+    
+    Cada row group de cada partición produce sus parciales (en paralelo si
+    workers > 1) y se combinan por tandas de Config.GOLD_MERGE_FANIN, de
+    modo que Gold se construye sin cargar Silver completo en memoria.
+    
+    Args:
+        silver_path: Archivo Silver
+        logger: Logger para registro
+        workers: Procesos (por defecto Config.SILVER_WORKERS, 0 = todos los núcleos)
+        hll_precision: Bits de índice HLL (None = conteo exacto)
+        
+    Returns:
+        Agregados parciales combinados o None si falla
+    """
+    workers = Config.SILVER_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    
+    try:
+        logger.info("Creando agregados parciales Gold por row group")
+        start = time.perf_counter()
+        tasks = [
+            (str(silver_file), i)
+            for silver_file in silver_partitions(silver_path)
+            for i in range(pq.ParquetFile(silver_file).num_row_groups)
+        ]
+        num_row_groups = len(tasks)
+        
+        pending = []
+        row_group_partials = functools.partial(_silver_row_group_partials, hll_precision=hll_precision)
+        for partial in _map_tasks(row_group_partials, tasks, workers):
+            pending.append(partial)
+            if len(pending) >= Config.GOLD_MERGE_FANIN:
+                pending = [merge_gold_partials(*pending)]
+        
+        partials = (merge_gold_partials(*pending) if pending
+                    else build_gold_partials(read_silver(silver_path), hll_precision))
+        logger.info(f"  ✓ {num_row_groups} row groups combinados ({time.perf_counter() - start:.2f} s)")
+        return partials
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en agregados parciales Gold: {str(e)}")
+        return None
+
+
+def finalize_gold_partials(partials: Dict[str, Dict[str, pd.DataFrame]],
+                           top_n: int = 50) -> Dict[str, pd.DataFrame]:
+    """
+    Convierte los agregados parciales en las tablas Gold finales
+    
+    Args:
+        partials: Agregados parciales combinados
+        top_n: Número de productos top
+        
+    Returns:
+        Diccionario tabla -> DataFrame con el mismo esquema que build_gold_tables
+    """
+    finals = {}
+    approx = {}
+    for table, spec in GOLD_PARTIAL_SPECS.items():
+        df_table = partials[table]['measures'].copy()
+        for key, out in spec['distinct'].items():
+            sketch = partials[table][key]
+            df_table = df_table.merge(_distinct_counts(sketch, spec['groups'], out),
+                                      on=spec['groups'], how='left')
+            if 'Registers' in sketch.columns and len(sketch):
+                approx.setdefault(table, {})[out] = len(sketch['Registers'].iloc[0])
+        finals[table] = df_table.sort_values(spec['groups']).reset_index(drop=True)
+    
+    df_country = finals['sales_by_country']
+    df_country['AvgOrderValue'] = df_country['TotalRevenue'] / df_country['TotalOrders']
+    df_country = df_country[['Country', 'TotalOrders', 'UniqueCustomers',
+                             'TotalQuantity', 'TotalRevenue', 'NetRevenue', 'AvgOrderValue']]
+    
+    df_time = finals['sales_by_time']
+    df_time['AvgOrderValue'] = df_time['TotalRevenue'] / df_time['Lines']
+    df_time = df_time[['YearMonth', 'TotalOrders', 'UniqueCustomers',
+                       'TotalRevenue', 'NetRevenue', 'AvgOrderValue', 'TotalQuantity']]
+    
+    # Los rankings se eligen sobre los totales combinados (exactos), no por lote
+    product_rankings = select_top_products(finals['top_products'], top_n)
+    
+    df_customers = derive_customer_metrics(
+        finals['customer_segments'][['CustomerID', 'TotalOrders', 'TotalSpent', 'NetSpent',
+                                     'TotalItems', 'FirstPurchase', 'LastPurchase']]
+    )
+    
+    df_months = finals['customer_months']
+    customer, customer_ids = _factorize(df_months['CustomerID'])
+    first = df_customers['FirstPurchase'].iloc[
+        np.searchsorted(df_customers['CustomerID'].to_numpy(), customer_ids)
+    ]
+    year_month = df_months['YearMonth'].str
+    df_cohorts = build_customer_cohorts(
+        customer,
+        year_month[:4].astype(np.int64).to_numpy() * 12 + year_month[5:7].astype(np.int64).to_numpy() - 1,
+        _month_numbers(first),
+        df_months['TotalRevenue'].to_numpy(np.float64),
+        df_months['NetRevenue'].to_numpy(np.float64)
+    )
+    
+    gold_tables = {
+        'sales_by_country': df_country.sort_values('TotalRevenue', ascending=False),
+        'sales_by_time': df_time,
+        **product_rankings,
+        'customer_segments': df_customers,
+        'customer_cohorts': df_cohorts
+    }
+    
+    # Cotas de error de los conteos aproximados (se guardan en los metadatos Parquet)
+    for table, columns in approx.items():
+        registers = set(columns.values()).pop()
+        relative_error = hll_relative_error(registers.bit_length() - 1)
+        gold_tables[table].attrs['approx_distinct'] = {
+            'algorithm': 'HyperLogLog',
+            'columns': sorted(columns),
+            'precision': registers.bit_length() - 1,
+            'registers': registers,
+            'relative_standard_error': round(float(relative_error), 6),
+            'error_bound_95': round(float(2 * relative_error), 6)
+        }
+    
+    return gold_tables
+
+
+# ==================== PROCESAMIENTO INCREMENTAL ====================
+
+def load_watermark() -> Optional[Dict]:
+    """
+    Lee la marca de agua del procesamiento incremental
+    
+    Returns:
+        Diccionario con max_invoice_date, bronze_snapshot, silver_files,
+        gold_state y open_sales, o None si nunca se ejecutó en modo incremental
+    """
+    watermark_file = Config.STATE_PATH / 'watermark.json'
+    if not watermark_file.exists():
+        return None
+    with open(watermark_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_watermark(watermark: Dict) -> None:
+    """Publica la marca de agua de forma atómica (confirma el estado Gold referenciado)"""
+    watermark_file = Config.STATE_PATH / 'watermark.json'
+    tmp_file = watermark_file.with_suffix('.json.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(tmp_file, watermark_file)
+
+
+def _state_buckets(frame: pd.DataFrame, table: str, buckets: int) -> np.ndarray:
+    """Bucket del estado incremental de cada grupo (hash estable de state_groups)"""
+    spec = GOLD_PARTIAL_SPECS[table]
+    hashes = pd.util.hash_pandas_object(frame[spec.get('state_groups', spec['groups'])], index=False)
+    return (hashes.to_numpy() % np.uint64(buckets)).astype(np.int64)
+
+
+def _state_bucket_dir(table: str, name: str) -> Path:
+    """Directorio de una versión de bucket del estado Gold"""
+    return Config.STATE_PATH / 'gold_state' / table / name
+
+
+def _read_state_bucket(table: str, name: str) -> Dict[str, pd.DataFrame]:
+    """Lee los agregados parciales de un bucket del estado"""
+    bucket_dir = _state_bucket_dir(table, name)
+    return {
+        part: pd.read_parquet(bucket_dir / f'{part}.parquet')
+        for part in ['measures'] + list(GOLD_PARTIAL_SPECS[table]['distinct'])
+    }
+
+
+def _save_gold_state(delta: Dict[str, Dict[str, pd.DataFrame]],
+                     state: Optional[Dict] = None) -> Tuple[Dict, Dict[str, Dict[str, pd.DataFrame]]]:
+    """
+    Combina un delta con el estado incremental reescribiendo solo los buckets que toca
+    
+    El estado de cada tabla se reparte en buckets por hash de sus columnas
+    de grupo (Config.GOLD_STATE_BUCKETS, fijado al crear el estado). Cada
+    versión de bucket es un directorio inmutable con un Parquet por parte
+    (medidas y sketches). Solo los buckets con grupos del delta se combinan
+    con él y se escriben en un directorio nuevo; el resto sigue
+    referenciado sin reescribirse.
+    
+    Args:
+        delta: Agregados parciales del delta
+        state: Manifiesto del estado anterior (None = primera ejecución)
+        
+    Returns:
+        Tupla (manifiesto nuevo {'buckets': n, 'tables': {tabla: {bucket: directorio}}},
+        agregados parciales completos del estado nuevo)
+    """
+    buckets = state['buckets'] if state else Config.GOLD_STATE_BUCKETS
+    version = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    tables, partials = {}, {}
+    for table, parts in delta.items():
+        previous = state['tables'][table] if state else {}
+        stored = {name: _read_state_bucket(table, bucket_dir) for name, bucket_dir in previous.items()}
+        touched = {
+            f'{bucket:03d}'
+            for frame in parts.values()
+            for bucket in pd.unique(_state_buckets(frame, table, buckets)).tolist()
+        }
+        if not previous:
+            # Un bucket aunque el delta venga vacío: toda tabla tiene estado
+            touched = touched or {'000'}
         
-        df_products['AvgPricePerUnit'] = df_products['TotalRevenue'] / df_products['TotalQuantitySold']
-        df_products['AvgQuantityPerOrder'] = df_products['TotalQuantitySold'] / df_products['TotalOrders']
-        df_products = df_products.sort_values('TotalRevenue', ascending=False).head(top_n)
+        # Los buckets tocados se combinan con el delta de una vez y se vuelven a repartir
+        merged = _merge_table_partials(table, [stored.pop(name) for name in sorted(touched & stored.keys())] + [parts])
+        tables[table] = dict(previous)
+        for name in touched:
+            tables[table][name] = f'{name}_{version}'
+            _state_bucket_dir(table, tables[table][name]).mkdir(parents=True)
+        for part, frame in merged.items():
+            ids = _state_buckets(frame, table, buckets)
+            order = np.argsort(ids, kind='stable')
+            bounds = np.searchsorted(ids[order], np.arange(buckets + 1))
+            for name in touched:
+                rows = order[bounds[int(name)]:bounds[int(name) + 1]]
+                frame.take(rows).to_parquet(_state_bucket_dir(table, tables[table][name]) / f'{part}.parquet',
+                                            index=False)
         
-        logger.info(f"  ✓ Top productos identificados")
+        partials[table] = _concat_state_buckets(table, list(stored.values()) + [merged])
+    
+    return {'buckets': buckets, 'tables': tables}, partials
+
+
+def _concat_state_buckets(table: str, buckets: List[Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    """
+    Une los buckets de una tabla en sus agregados parciales
+    
+    Los buckets tienen grupos disjuntos, así que basta concatenarlos; solo
+    si conviven buckets exactos y HLL (deltas con --approx-distinct sobre un
+    estado exacto) los sketches se unifican en HLL.
+    """
+    spec = GOLD_PARTIAL_SPECS[table]
+    measures = pd.concat([bucket['measures'] for bucket in buckets], ignore_index=True)
+    partials = {'measures': measures.sort_values(spec['groups'], ignore_index=True)}
+    for key in spec['distinct']:
+        frames = [bucket[key] for bucket in buckets]
+        if len({'Registers' in frame.columns for frame in frames}) > 1:
+            partials[key] = _merge_distinct_sketches(frames, spec['groups'])
+        else:
+            partials[key] = pd.concat(frames, ignore_index=True)
+    return partials
+
+
+def _load_gold_state(state: Dict) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """Lee el estado incremental completo como agregados parciales"""
+    return {
+        table: _concat_state_buckets(table, [_read_state_bucket(table, name)
+                                             for _, name in sorted(state['tables'][table].items())])
+        for table in GOLD_PARTIAL_SPECS
+    }
+
+
+def _prune_gold_state(state: Dict) -> None:
+    """Borra las versiones de bucket que no referencia el manifiesto (reemplazadas o de ejecuciones fallidas)"""
+    state_root = Config.STATE_PATH / 'gold_state'
+    if not state_root.exists():
+        return
+    for table_dir in state_root.iterdir():
+        keep = set(state['tables'].get(table_dir.name, {}).values())
+        for bucket_dir in table_dir.iterdir():
+            if bucket_dir.name not in keep:
+                shutil.rmtree(bucket_dir, ignore_errors=True)
+
+
+# Columnas del índice de ventas abiertas: clave de casación (hash como
+# int64), instante (ns), unidades aún no devueltas, precio y ubicación de la
+# fila en Silver (posición en silver_files, partición relativa y fila)
+OPEN_SALES_COLUMNS = {
+    'Key': np.int64, 'InvoiceDate': np.int64, 'Remaining': np.int64, 'UnitPrice': np.float64,
+    'Snapshot': np.int64, 'Partition': object, 'Row': np.int64
+}
+
+
+def _open_sales_path(name: str) -> Path:
+    """Archivo de un segmento del índice de ventas abiertas"""
+    return Config.STATE_PATH / 'open_sales' / f'{name}.parquet'
+
+
+def _write_open_sales(df_open: pd.DataFrame) -> List[str]:
+    """
+    Escribe segmentos inmutables del índice de ventas abiertas
+    
+    Solo guarda las filas con unidades por devolver, en tramos de hasta
+    Config.OPEN_SALES_SEGMENT_ROWS filas en el orden recibido (cronológico).
+    Cada segmento se ordena por clave en row groups de
+    Config.OPEN_SALES_ROW_GROUP_ROWS filas, para que las estadísticas
+    mín/máx de Key acoten qué row groups hay que leer.
+    
+    Returns:
+        Nombres de los segmentos (ninguno si no queda ninguna venta abierta)
+    """
+    df_open = df_open.loc[df_open['Remaining'] > 0, list(OPEN_SALES_COLUMNS)]
+    segments = []
+    for start in range(0, len(df_open), Config.OPEN_SALES_SEGMENT_ROWS):
+        path = _new_snapshot_dir(Config.STATE_PATH / 'open_sales', 'open_sales').with_suffix('.parquet')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df_segment = df_open.iloc[start:start + Config.OPEN_SALES_SEGMENT_ROWS].sort_values('Key', kind='stable')
+        df_segment.to_parquet(path, index=False, row_group_size=Config.OPEN_SALES_ROW_GROUP_ROWS)
+        segments.append(path.stem)
+    return segments
+
+
+def build_open_sales(silver_path: Path, snapshot: int) -> List[str]:
+    """
+    Segmento del índice de ventas abiertas con las ventas de un Silver delta
+    
+    Args:
+        silver_path: Dataset Silver del delta
+        snapshot: Posición del dataset en silver_files de la marca de agua
         
-        return df_products
+    Returns:
+        Nombres de los segmentos nuevos
+    """
+    frames = []
+    for path in silver_partitions(silver_path):
+        df_sales = pq.read_table(path, columns=['CustomerID', 'StockCode', 'UnitPrice', 'InvoiceDate',
+                                                'Quantity', 'ReturnedQuantity']).to_pandas()
+        keys, dates, quantity = _sale_events(df_sales)
+        frames.append(pd.DataFrame({
+            'Key': keys.view(np.int64),
+            'InvoiceDate': dates,
+            'Remaining': quantity - df_sales['ReturnedQuantity'].to_numpy(np.int64),
+            'UnitPrice': df_sales['UnitPrice'].to_numpy(np.float64),
+            'Snapshot': snapshot,
+            'Partition': path.relative_to(silver_path).as_posix(),
+            'Row': np.arange(len(df_sales))
+        }))
+    return _write_open_sales(pd.concat(frames, ignore_index=True)) if frames else []
+
+
+def probe_open_sales(segments: List[str], keys: np.ndarray) -> pd.DataFrame:
+    """
+    Ventas abiertas del índice con alguna de las claves dadas
+    
+    Cada segmento está ordenado por clave, así que de cada uno solo se leen
+    los row groups cuyo rango [mín, máx] de Key contiene alguna clave: el
+    coste depende de las devoluciones del delta y no del historial.
+    
+    Args:
+        segments: Segmentos del índice (marca de agua)
+        keys: Claves de casación de las devoluciones (returns_keys)
         
-    except Exception as e:
-        logger.error(f"  ✗ Error en agregación de productos: {str(e)}")
+    Returns:
+        Filas del índice que casan, con su segmento (Segment) y su posición
+        en él (Position)
+    """
+    index = np.unique(np.asarray(keys, dtype=np.uint64).view(np.int64))
+    frames = []
+    for name in segments if len(index) else []:
+        parquet_file = pq.ParquetFile(_open_sales_path(name))
+        key_column = parquet_file.schema_arrow.get_field_index('Key')
+        groups, positions, offset = [], [], 0
+        for i in range(parquet_file.metadata.num_row_groups):
+            row_group = parquet_file.metadata.row_group(i)
+            stats = row_group.column(key_column).statistics
+            if (stats is None or not stats.has_min_max or
+                    np.searchsorted(index, stats.min) < np.searchsorted(index, stats.max, side='right')):
+                groups.append(i)
+                positions.append(np.arange(offset, offset + row_group.num_rows))
+            offset += row_group.num_rows
+        if not groups:
+            continue
+        df_open = parquet_file.read_row_groups(groups).to_pandas()
+        matched, _ = _probe(index, df_open['Key'].to_numpy())
+        frames.append(df_open.iloc[matched].assign(Segment=name, Position=np.concatenate(positions)[matched]))
+    
+    if not frames:
+        empty = {col: np.zeros(0, dtype=dtype) for col, dtype in OPEN_SALES_COLUMNS.items()}
+        return pd.DataFrame({**empty, 'Segment': np.zeros(0, dtype=object), 'Position': np.zeros(0, dtype=np.int64)})
+    return pd.concat(frames, ignore_index=True)
+
+
+def _consume_open_sales(segments: List[str], df_consumed: pd.DataFrame) -> List[str]:
+    """
+    Descuenta del índice las unidades que han consumido las devoluciones de un delta
+    
+    Solo se reescriben (en un segmento nuevo) los segmentos con alguna venta
+    consumida; los que se quedan sin ventas abiertas desaparecen.
+    """
+    updated = []
+    for name in segments:
+        df_segment = df_consumed[df_consumed['Segment'] == name]
+        if df_segment.empty:
+            updated.append(name)
+            continue
+        df_open = pd.read_parquet(_open_sales_path(name))
+        remaining = df_open['Remaining'].to_numpy(np.int64, copy=True)
+        np.subtract.at(remaining, df_segment['Position'].to_numpy(), df_segment['Returned'].to_numpy())
+        updated += _write_open_sales(df_open.assign(Remaining=remaining))
+    return updated
+
+
+def _prune_open_sales(segments: List[str]) -> None:
+    """Borra los segmentos del índice de ventas abiertas que no referencia la marca de agua"""
+    keep = set(segments)
+    for path in (Config.STATE_PATH / 'open_sales').glob('*.parquet'):
+        if path.stem not in keep:
+            path.unlink(missing_ok=True)
+
+
+def _consumed_by_file(silver_path: Path, df_consumed: pd.DataFrame) -> Dict[Path, np.ndarray]:
+    """Unidades devueltas adicionales de cada fila de los archivos de un Silver (filas consumidas del índice)"""
+    extra = {}
+    for partition, df_partition in df_consumed.groupby('Partition'):
+        path = silver_path / partition
+        extra[path] = np.zeros(pq.ParquetFile(path).metadata.num_rows, dtype=np.int64)
+        np.add.at(extra[path], df_partition['Row'].to_numpy(), df_partition['Returned'].to_numpy())
+    return extra
+
+
+def _revise_silver_snapshot(silver_path: Path, extra: Dict[Path, np.ndarray]) -> Path:
+    """
+    Nueva versión de un Silver con devoluciones adicionales (copy-on-write)
+    
+    Los archivos afectados se reescriben con su ReturnedQuantity y
+    NetTotalPrice corregidos y el resto se enlaza (hard link) sin copiarse.
+    El snapshot anterior no se modifica: la marca de agua sigue
+    apuntando a él hasta el commit, así que un fallo a mitad no deja
+    devoluciones aplicadas dos veces.
+    
+    Args:
+        silver_path: Dataset Silver anterior
+        extra: Archivo -> unidades devueltas adicionales de cada fila
+        
+    Returns:
+        Ruta del dataset nuevo
+    """
+    target = _new_silver_path()
+    tmp_path = target.with_suffix('.tmp')
+    tmp_path.mkdir(parents=True)
+    for path in silver_partitions(silver_path):
+        destination = tmp_path / path.relative_to(silver_path)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if path in extra:
+            returned = pq.read_table(path, columns=['ReturnedQuantity']).column(0).to_numpy() + extra[path]
+            _rewrite_partition_file(path, returned, target=destination)
+        else:
+            try:
+                os.link(path, destination)
+            except OSError:
+                shutil.copy2(path, destination)
+    shutil.copy2(_dictionaries_path(silver_path), _dictionaries_path(target))
+    os.replace(tmp_path, target)
+    return target
+
+
+def _returns_correction_partials(extra: Dict[Path, np.ndarray],
+                                 hll_precision: Optional[int] = None) -> Optional[Dict[str, Dict[str, pd.DataFrame]]]:
+    """
+    Agregados parciales que descuentan devoluciones adicionales de filas ya agregadas
+    
+    Solo llevan el importe neto devuelto (negativo) en NetTotalPrice; el
+    resto de medidas son cero y las filas ya están en los sketches de
+    distintos y en los mín/máx del estado, así que combinarlos con
+    merge_gold_partials solo corrige NetRevenue / NetSpent.
+    
+    Args:
+        extra: Archivo Silver -> unidades devueltas adicionales de cada fila
+        hll_precision: Bits de índice HLL (los mismos que el delta)
+        
+    Returns:
+        Agregados parciales de corrección o None si no hay ninguna
+    """
+    frames = []
+    for path, returned in extra.items():
+        rows = np.flatnonzero(returned)
+        df_rows = pq.read_table(path).take(pa.array(rows)).to_pandas()
+        df_rows['NetTotalPrice'] = -returned[rows] * df_rows['UnitPrice'].to_numpy(np.float64)
+        frames.append(df_rows.assign(Quantity=0, TotalPrice=0.0))
+    if not frames:
         return None
+    
+    df_rows = pd.concat([frame.astype({col: str for col in SILVER_DICTIONARY_COLUMNS}) for frame in frames],
+                        ignore_index=True)
+    partials = build_gold_partials(df_rows, hll_precision)
+    partials['sales_by_time']['measures']['Lines'] = 0
+    return partials
 
 
-def aggregate_customer_segments(df: pd.DataFrame, logger: logging.Logger) -> Optional[pd.DataFrame]:
+def run_incremental(bronze_path: Path, logger: logging.Logger, top_n: int = 50,
+                    hll_precision: Optional[int] = None,
+                    quarantine: bool = False) -> Optional[Dict[str, pd.DataFrame]]:
     """
-    Crea segmentación de clientes basada en comportamiento de compra
+    Procesa solo las facturas posteriores a la marca de agua
+    
+    Silver recibe únicamente las filas nuevas (un archivo delta más) y Gold se
+    actualiza combinando los agregados parciales del delta con los buckets
+    del estado guardado que toca (_save_gold_state). La primera ejecución
+    procesa todo e inicializa el estado. La marca de agua se publica al
+    final: si el proceso falla antes, la siguiente ejecución repite el mismo
+    delta sobre el estado anterior.
     
     Args:
-        df: DataFrame de capa Silver
+        bronze_path: Snapshot Bronze a procesar
         logger: Logger para registro
+        top_n: Número de productos top
+        hll_precision: Bits de índice HLL para los deltas (None = conteo exacto;
+            un estado exacto se convierte a HLL al combinarse con un delta HLL)
+        quarantine: Guardar las filas rechazadas del delta en la cuarentena
         
     Returns:
-        DataFrame con segmentos de clientes
+        Tablas Gold actualizadas o None si falla
     """
+    logger.info("\nETAPA 2-3: PROCESAMIENTO INCREMENTAL (SILVER + GOLD)")
+    logger.info("-" * 60)
+    
     try:
-        logger.info("Creando agregación: Segmentación de Clientes")
+        watermark = load_watermark()
+        after = pd.Timestamp(watermark['max_invoice_date']) if watermark else None
         
-        df_customers = df.groupby('CustomerID').agg({
-            'InvoiceNo': 'nunique',
-            'TotalPrice': 'sum',
-            'Quantity': 'sum',
-            'InvoiceDate': ['min', 'max']
-        }).reset_index()
+        if watermark and watermark['bronze_snapshot'] == bronze_path.name:
+            logger.info("✓ Snapshot Bronze ya procesado, sin datos nuevos")
+            return finalize_gold_partials(_load_gold_state(watermark['gold_state']), top_n)
         
-        df_customers.columns = ['CustomerID', 'TotalOrders', 'TotalSpent', 
-                               'TotalItems', 'FirstPurchase', 'LastPurchase']
+        df_delta = read_bronze(bronze_path, logger, after=after)
+        if df_delta is None:
+            return None
+        logger.info(f"Marca de agua: {after if after is not None else 'ninguna (carga completa)'}")
+        logger.info(f"Filas nuevas en Bronze: {len(df_delta):,}")
         
-        # Calcular métricas derivadas
-        df_customers['AvgOrderValue'] = df_customers['TotalSpent'] / df_customers['TotalOrders']
-        df_customers['CustomerLifetime'] = (df_customers['LastPurchase'] - df_customers['FirstPurchase']).dt.days
-        
-        # Crear segmentos
-        df_customers['Segment'] = pd.cut(
-            df_customers['TotalSpent'],
-            bins=[0, 1000, 5000, float('inf')],
-            labels=['Low Value', 'Medium Value', 'High Value']
-        )
+        silver_files = list(watermark['silver_files']) if watermark else []
+        state = watermark['gold_state'] if watermark else None
+        open_sales = list(watermark.get('open_sales', [])) if watermark else []
+        partials = None
         
-        logger.info(f"  ✓ {len(df_customers)} clientes segmentados")
+        if watermark and 'open_sales' not in watermark:
+            # Estado anterior al índice de ventas abiertas: se construye una sola vez
+            open_sales = [segment for i, name in enumerate(silver_files)
+                          for segment in build_open_sales(Config.SILVER_PATH / name, i)]
         
-        return df_customers
+        if len(df_delta) > 0:
+            # Las devoluciones del delta también casan con ventas de deltas
+            # anteriores, que se buscan en el índice de ventas abiertas
+            consumed_sales = []
+            df_clean = transform_silver(df_delta, logger, quarantine=quarantine,
+                                        open_sales=open_sales, consumed_sales=consumed_sales)
+            if df_clean is None:
+                return None
+            silver_path = load_silver(df_clean, logger)
+            if silver_path is None:
+                return None
+            
+            prior_returned = {}
+            df_consumed = consumed_sales[0] if consumed_sales else None
+            for snapshot, df_snapshot in (df_consumed.groupby('Snapshot') if df_consumed is not None else []):
+                name = silver_files[snapshot]
+                extra = _consumed_by_file(Config.SILVER_PATH / name, df_snapshot)
+                revised = _revise_silver_snapshot(Config.SILVER_PATH / name, extra)
+                silver_files[snapshot] = revised.name
+                prior_returned.update(extra)
+                logger.info(f"✓ Devoluciones sobre ventas anteriores: {name} -> {revised.name}")
+            silver_files.append(silver_path.name)
+            
+            if df_consumed is not None:
+                open_sales = _consume_open_sales(open_sales, df_consumed)
+            open_sales += build_open_sales(silver_path, len(silver_files) - 1)
+            
+            delta_partials = build_gold_partials(df_clean, hll_precision)
+            correction = _returns_correction_partials(prior_returned, hll_precision)
+            delta_partials = merge_gold_partials(delta_partials, correction) if correction else delta_partials
+            state, partials = _save_gold_state(delta_partials, state)
+            after = max(after, df_delta['InvoiceDate'].max()) if after is not None else df_delta['InvoiceDate'].max()
+        
+        if state is None:
+            logger.error("✗ No hay datos para inicializar el estado incremental")
+            return None
+        
+        _save_watermark({
+            'max_invoice_date': pd.Timestamp(after).isoformat(),
+            'bronze_snapshot': bronze_path.name,
+            'silver_files': silver_files,
+            'gold_state': state,
+            'open_sales': open_sales,
+            'updated_at': datetime.now().isoformat(timespec='seconds')
+        })
+        
+        # Eliminar versiones de bucket y segmentos que ya no referencia la marca de agua
+        _prune_gold_state(state)
+        _prune_open_sales(open_sales)
+        
+        logger.info(f"✓ Estado incremental actualizado ({len(silver_files)} archivo(s) Silver)")
+        return finalize_gold_partials(partials if partials is not None else _load_gold_state(state), top_n)
         
     except Exception as e:
-        logger.error(f"  ✗ Error en segmentación de clientes: {str(e)}")
+        logger.error(f"✗ Error en procesamiento incremental: {str(e)}")
+        return None
+
+
+# ==================== CAPA GOLD: ALMACENAMIENTO Y CATÁLOGO ====================
+
+# Clave de metadatos Parquet con los atributos de cada tabla Gold
+GOLD_METADATA_KEY = b'gold_metadata'
+
+# Archivos Gold con versión: <tabla>_<YYYYmmdd_HHMMSS>[_<n>].parquet
+GOLD_FILE_PATTERN = re.compile(r'^(?P<table>.+)_(?P<version>\d{8}_\d{6}(?:_\d+)?)\.parquet$')
+
+
+def load_gold_manifest(gold_path: Optional[Path] = None) -> Optional[Dict]:
+    """
+    Lee el catálogo (manifiesto) de la capa Gold
+    
+    Args:
+        gold_path: Directorio Gold (por defecto Config.GOLD_PATH)
+        
+    Returns:
+        Diccionario con 'version', 'updated_at' y 'tables' (tabla -> archivo,
+        versión, filas, esquema, sha256) o None si no existe
+    """
+    manifest_file = (gold_path or Config.GOLD_PATH) / Config.GOLD_MANIFEST_FILE
+    if not manifest_file.exists():
         return None
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_gold_manifest(manifest: Dict) -> None:
+    """Publica el catálogo Gold de forma atómica"""
+    manifest_file = Config.GOLD_PATH / Config.GOLD_MANIFEST_FILE
+    tmp_file = manifest_file.with_suffix('.json.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, manifest_file)
+    _fsync_directory(manifest_file.parent)
+
+
+def resolve_gold_table(table_name: str, gold_path: Optional[Path] = None,
+                       manifest: Optional[Dict] = None) -> Optional[Path]:
+    """
+    Resuelve el archivo vigente de una tabla Gold
+    
+    Consulta el catálogo (una lectura, sin listar el directorio). Si no hay
+    catálogo, o no registra la tabla, busca la versión más reciente por el
+    nombre del archivo.
+    
+    Args:
+        table_name: Nombre de la tabla
+        gold_path: Directorio Gold (por defecto Config.GOLD_PATH)
+        manifest: Catálogo ya leído (para resolver varias tablas del mismo snapshot)
+        
+    Returns:
+        Ruta del archivo o None si la tabla no existe
+    """
+    gold_path = gold_path or Config.GOLD_PATH
+    manifest = manifest if manifest is not None else load_gold_manifest(gold_path)
+    entry = (manifest or {}).get('tables', {}).get(table_name)
+    if entry is not None:
+        return gold_path / entry['file']
+    
+    versions = [
+        (match.group('version'), path)
+        for path in gold_path.glob(f'{table_name}_*.parquet')
+        if (match := GOLD_FILE_PATTERN.match(path.name)) and match.group('table') == table_name
+    ]
+    return max(versions)[1] if versions else None
+
+
+def read_gold_snapshot(tables: Optional[List[str]] = None, gold_path: Optional[Path] = None,
+                       verify: bool = False) -> Dict[str, pd.DataFrame]:
+    """
+    Lee varias tablas Gold de un mismo snapshot del catálogo
+    
+    El catálogo se lee una sola vez, así que todas las tablas corresponden
+    a la misma publicación aunque load_gold escriba otra mientras tanto.
+    
+    Args:
+        tables: Tablas a leer (por defecto todas las del catálogo)
+        gold_path: Directorio Gold (por defecto Config.GOLD_PATH)
+        verify: Comprobar el SHA-256 registrado de cada archivo
+        
+    Returns:
+        Diccionario tabla -> DataFrame
+    """
+    gold_path = gold_path or Config.GOLD_PATH
+    manifest = load_gold_manifest(gold_path) or {'tables': {}}
+    snapshot = {}
+    for name in tables or sorted(manifest['tables']):
+        path = resolve_gold_table(name, gold_path, manifest)
+        if path is None:
+            raise FileNotFoundError(f"Tabla Gold no encontrada: {name}")
+        entry = manifest['tables'].get(name)
+        if verify and entry is not None and _file_sha256(path) != entry['sha256']:
+            raise ValueError(f"Checksum distinto del catálogo: {path.name}")
+        snapshot[name] = pd.read_parquet(path)
+    return snapshot
+
+
+def read_gold_metadata(filepath: Path) -> Dict:
+    """
+    Lee los metadatos de una tabla Gold (solo el footer del Parquet)
+    
+    Args:
+        filepath: Archivo Gold
+        
+    Returns:
+        Diccionario de metadatos (vacío si la tabla no tiene)
+    """
+    metadata = pq.read_schema(filepath).metadata or {}
+    raw = metadata.get(GOLD_METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def _fsync_directory(path: Path) -> None:
+    """Persiste en disco las entradas (renombrados) de un directorio, si el SO lo permite"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _new_gold_version() -> str:
+    """Versión Gold nueva (timestamp) que no colisiona con archivos existentes"""
+    version = datetime.now().strftime('%Y%m%d_%H%M%S')
+    candidate, suffix = version, 0
+    while any(Config.GOLD_PATH.glob(f'*_{candidate}.parquet*')):
+        suffix += 1
+        candidate = f'{version}_{suffix}'
+    return candidate
+
+
+def _gold_arrow_table(df: pd.DataFrame) -> pa.Table:
+    """Tabla Arrow de una tabla Gold con sus atributos en los metadatos Parquet"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if df.attrs:
+        # Metadatos de la tabla (p. ej. cotas de error de conteos aproximados)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            GOLD_METADATA_KEY: json.dumps(df.attrs).encode('utf-8')
+        })
+    return table
 
 
 def load_gold(dataframes: Dict[str, pd.DataFrame], logger: logging.Logger) -> bool:
     """
-    Guarda tablas agregadas en capa Gold
+    Guarda tablas agregadas en capa Gold como una única transacción
+    
+    Todas las tablas se escriben primero en archivos temporales con fsync,
+    después se renombran a <tabla>_<versión>.parquet (nombres nuevos que el
+    catálogo aún no referencia) y por último se reemplaza el catálogo de
+    forma atómica: ese reemplazo es el punto de commit. Si algo falla antes,
+    se borran los archivos de la versión y el catálogo sigue apuntando a la
+    anterior, así que los lectores ven todas las tablas nuevas o ninguna, sin
+    bloquearse nunca.
     
     Args:
         dataframes: Diccionario con DataFrames agregados
         logger: Logger para registro
         
     Returns:
-        True si se guardó exitosamente
+        True si se publicaron todas las tablas
     """
     logger.info("\nETAPA 3: AGREGACIÓN Y ALMACENAMIENTO (GOLD LAYER)")
     logger.info("-" * 60)
     
+    staged = []
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        missing = [name for name, df in dataframes.items() if df is None]
+        if missing:
+            logger.error(f"✗ Tablas Gold sin datos: {', '.join(missing)} (no se publica ninguna)")
+            return False
+        
+        version = _new_gold_version()
+        manifest = load_gold_manifest() or {'tables': {}}
+        entries = {}
         
+        # 1) Escribir cada tabla en un temporal y forzarla a disco
         for name, df in dataframes.items():
-            if df is not None:
-                filepath = Config.GOLD_PATH / f'{name}_{timestamp}.parquet'
-                df.to_parquet(filepath, index=False, compression='snappy')
-                logger.info(f"✓ Guardado: {name} ({len(df)} registros)")
+            filepath = Config.GOLD_PATH / f'{name}_{version}.parquet'
+            tmp_path = filepath.with_suffix('.parquet.tmp')
+            staged.append((tmp_path, filepath))
+            
+            table = _gold_arrow_table(df)
+            with open(tmp_path, 'wb') as f:
+                pq.write_table(table, f, row_group_size=parquet_row_group_size('gold'),
+                               **parquet_options('gold'))
+                f.flush()
+                os.fsync(f.fileno())
+            
+            entries[name] = {
+                'file': filepath.name,
+                'version': version,
+                'rows': len(df),
+                'schema': {field.name: str(field.type) for field in table.schema},
+                'sha256': _file_sha256(tmp_path)
+            }
+            logger.info(f"✓ Preparado: {name} ({len(df)} registros)")
+        
+        # 2) Publicar los archivos con su nombre final (aún sin referenciar)
+        for tmp_path, filepath in staged:
+            os.replace(tmp_path, filepath)
+        _fsync_directory(Config.GOLD_PATH)
+        
+        # 3) Commit: reemplazo atómico del catálogo
+        manifest['tables'].update(entries)
+        manifest['version'] = version
+        manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        _save_gold_manifest(manifest)
+        logger.info(f"✓ Gold publicado: {len(entries)} tablas, versión {version}")
         
         return True
         
     except Exception as e:
-        logger.error(f"✗ Error guardando Gold: {str(e)}")
+        for tmp_path, filepath in staged:
+            tmp_path.unlink(missing_ok=True)
+            filepath.unlink(missing_ok=True)
+        logger.error(f"✗ Error guardando Gold (sin cambios publicados): {str(e)}")
         return False
 
 
+# ==================== RETENCIÓN DE SNAPSHOTS ====================
+
+# Snapshots con versión de cada capa (los sidecars comparten versión con su
+# Parquet; Silver es un directorio particionado o, en snapshots anteriores, un archivo)
+BRONZE_FILE_PATTERN = re.compile(r'^raw_data_(?P<version>\d{8}_\d{6})\.parquet$')
+SILVER_FILE_PATTERN = re.compile(
+    r'^clean_data_(?P<version>\d{8}_\d{6}(?:_\d+)?)(?:\.parquet|\.dictionaries\.json)?$'
+)
+QUARANTINE_FILE_PATTERN = re.compile(r'^rejected_data_(?P<version>\d{8}_\d{6}(?:_\d+)?)$')
+
+
+def select_retained_versions(versions: List[str], keep_last: int, keep_days: int,
+                             keep_monthly: int, now: Optional[datetime] = None) -> set:
+    """
+    Aplica la política de retención a un conjunto de versiones (timestamps)
+    
+    Una versión se conserva si la mantiene cualquiera de las reglas: las
+    keep_last más recientes, las de los últimos keep_days días o la más
+    reciente de cada uno de los últimos keep_monthly meses.
+    
+    Args:
+        versions: Versiones 'YYYYmmdd_HHMMSS[...]'
+        keep_last: Número de versiones más recientes a conservar (mínimo 1)
+        keep_days: Días de antigüedad conservados (0 = regla desactivada)
+        keep_monthly: Meses con una versión conservada (0 = regla desactivada)
+        now: Instante de referencia (por defecto ahora)
+        
+    Returns:
+        Conjunto de versiones a conservar
+    """
+    ordered = sorted(set(versions), reverse=True)
+    keep = set(ordered[:max(keep_last, 1)])
+    
+    if keep_days:
+        cutoff = ((now or datetime.now()) - timedelta(days=keep_days)).strftime('%Y%m%d_%H%M%S')
+        keep.update(v for v in ordered if v >= cutoff)
+    
+    if keep_monthly:
+        newest_per_month = {}
+        for version in ordered:
+            newest_per_month.setdefault(version[:6], version)
+        keep.update(list(newest_per_month.values())[:keep_monthly])
+    
+    return keep
+
+
+def _layer_snapshots(path: Path, pattern: re.Pattern) -> Dict[str, List[Path]]:
+    """Archivos (o directorios) de una capa agrupados por versión (listado sin stat)"""
+    snapshots = {}
+    if not path.exists():
+        return snapshots
+    with os.scandir(path) as entries:
+        for entry in entries:
+            match = pattern.match(entry.name)
+            if match:
+                snapshots.setdefault(match.group('version'), []).append(path / entry.name)
+    return snapshots
+
+
+def _disk_usage(path: Path) -> int:
+    """Bytes ocupados por un archivo o un directorio completo"""
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+    return path.stat().st_size
+
+
+def _remove_path(path: Path) -> None:
+    """Elimina un archivo o un directorio completo"""
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _referenced_files() -> set:
+    """Archivos referenciados por el catálogo Gold y la marca de agua incremental"""
+    referenced = set()
+    manifest = load_gold_manifest()
+    if manifest:
+        referenced.update(Config.GOLD_PATH / entry['file'] for entry in manifest['tables'].values())
+    
+    watermark = load_watermark()
+    if watermark:
+        referenced.add(Config.BRONZE_PATH / watermark['bronze_snapshot'])
+        for name in watermark['silver_files']:
+            silver_path = Config.SILVER_PATH / name
+            referenced.update([silver_path, _dictionaries_path(silver_path)])
+    return referenced
+
+
+def _unreferenced_cache_files(stale_before: float) -> List[Path]:
+    """
+    Archivos de la caché de fuentes que ya no referencia su índice
+    
+    Cada cambio de la fuente deja una copia completa <sha256>.<ext>; solo se
+    conserva la versión vigente de cada fuente del índice (más los
+    temporales de descargas en curso).
+    
+    Args:
+        stale_before: Marca de tiempo antes de la cual un .tmp se da por abandonado
+        
+    Returns:
+        Lista de archivos a eliminar
+    """
+    cache_dir = Config.BRONZE_PATH / Config.SOURCE_CACHE_DIR
+    if not cache_dir.exists():
+        return []
+    hashes = {entry.get('sha256') for entry in _load_cache_index().values()}
+    return [
+        p for p in cache_dir.iterdir()
+        if p.name != 'index.json' and (
+            p.stat().st_mtime < stale_before if p.suffix == '.tmp'
+            else p.name.split('.', 1)[0] not in hashes
+        )
+    ]
+
+
+def collect_garbage(logger: logging.Logger, keep_last: Optional[int] = None,
+                    keep_days: Optional[int] = None, keep_monthly: Optional[int] = None,
+                    dry_run: bool = False) -> Optional[Dict[str, int]]:
+    """
+    Elimina snapshots Bronze, Silver, de cuarentena y Gold que no retiene la política
+    
+    La política (Config.RETENTION_*) se aplica por capa sobre las versiones
+    del nombre de archivo. Nunca se borra un archivo referenciado por el
+    catálogo Gold o por la marca de agua (snapshot Bronze y deltas Silver
+    del modo incremental). También se limpian temporales (.tmp, archivos o
+    directorios) abandonados por ejecuciones interrumpidas y las copias de
+    la caché de fuentes que ya no apunta su índice.
+    
+    Args:
+        logger: Logger para registro
+        keep_last: Versiones más recientes a conservar por capa
+        keep_days: Días de antigüedad conservados
+        keep_monthly: Meses con una versión conservada
+        dry_run: Solo informar, sin borrar
+        
+    Returns:
+        Diccionario capa -> archivos o directorios eliminados, o None si falla
+    """
+    keep_last = Config.RETENTION_KEEP_LAST if keep_last is None else keep_last
+    keep_days = Config.RETENTION_KEEP_DAYS if keep_days is None else keep_days
+    keep_monthly = Config.RETENTION_KEEP_MONTHLY if keep_monthly is None else keep_monthly
+    
+    try:
+        logger.info("\nRETENCIÓN DE SNAPSHOTS")
+        logger.info("-" * 60)
+        referenced = _referenced_files()
+        stale_before = time.time() - Config.RETENTION_TMP_MAX_AGE
+        removed = {}
+        
+        layers = {
+            'bronze': (Config.BRONZE_PATH, BRONZE_FILE_PATTERN),
+            'silver': (Config.SILVER_PATH, SILVER_FILE_PATTERN),
+            'quarantine': (Config.QUARANTINE_PATH, QUARANTINE_FILE_PATTERN),
+            'gold': (Config.GOLD_PATH, GOLD_FILE_PATTERN)
+        }
+        for layer, (path, pattern) in layers.items():
+            snapshots = _layer_snapshots(path, pattern)
+            keep = select_retained_versions(list(snapshots), keep_last, keep_days, keep_monthly)
+            
+            doomed = [
+                filepath
+                for version, files in snapshots.items() if version not in keep
+                for filepath in files if filepath not in referenced
+            ]
+            if path.exists():
+                doomed += [p for p in path.glob('*.tmp') if p.stat().st_mtime < stale_before]
+            
+            freed = 0
+            for filepath in doomed:
+                freed += _disk_usage(filepath)
+                if not dry_run:
+                    _remove_path(filepath)
+            
+            removed[layer] = len(doomed)
+            logger.info(f"  {'(simulación) ' if dry_run else ''}{layer}: {len(snapshots)} versiones, "
+                        f"{len(doomed)} archivos eliminados ({freed / 1024**2:.1f} MB)")
+        
+        doomed = _unreferenced_cache_files(stale_before)
+        freed = sum(_disk_usage(filepath) for filepath in doomed)
+        if not dry_run:
+            for filepath in doomed:
+                _remove_path(filepath)
+        removed['source_cache'] = len(doomed)
+        logger.info(f"  {'(simulación) ' if dry_run else ''}source_cache: "
+                    f"{len(doomed)} archivos eliminados ({freed / 1024**2:.1f} MB)")
+        
+        return removed
+        
+    except Exception as e:
+        logger.error(f"  ✗ Error en retención de snapshots: {str(e)}")
+        return None
+
+
 # ==================== ORQUESTACIÓN PRINCIPAL ====================
 
-def main() -> bool:
+def run_bronze_stage(args: argparse.Namespace, logger: logging.Logger) -> Optional[Path]:
+    """
+    Garantiza un snapshot Bronze, reutilizándolo cuando la fuente no cambió
+    
+    Args:
+        args: Opciones de línea de comandos
+        logger: Logger para registro
+        
+    Returns:
+        Ruta del snapshot Bronze a procesar o None si falla
+    """
+    if args.from_bronze:
+        bronze_path = find_bronze_snapshot()
+        if bronze_path is None:
+            logger.error("✗ No hay snapshots Bronze válidos para reanudar")
+            return None
+        logger.info("ETAPA 1: REANUDANDO DESDE BRONZE")
+        return bronze_path
+    
+    if not args.force_extract:
+        fetched = fetch_source(logger, args.source)
+        bronze_path = find_bronze_snapshot(fetched[1]) if fetched else None
+        if bronze_path is not None:
+            logger.info("ETAPA 1: FUENTE SIN CAMBIOS, REANUDANDO DESDE BRONZE")
+            return bronze_path
+    
+    if args.streaming:
+        return extract_to_bronze_streaming(logger, args.source)
+    
+    df_raw = extract_data(logger, args.source)
+    if df_raw is None or not load_bronze(df_raw, logger):
+        return None
+    return find_bronze_snapshot(df_raw.attrs['source_sha256'])
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Interpreta los argumentos de línea de comandos
+    
+    Args:
+        argv: Lista de argumentos (por defecto sys.argv)
+        
+    Returns:
+        Namespace con las opciones del pipeline
+    """
+    parser = argparse.ArgumentParser(description='Pipeline ETL Medallion para E-commerce')
+    parser.add_argument('--source', default=None,
+                        help='URL o ruta local del dataset (por defecto Config.DATASET_URL)')
+    parser.add_argument('--from-bronze', action='store_true',
+                        help='Reanudar desde el último snapshot Bronze sin consultar la fuente')
+    parser.add_argument('--force-extract', action='store_true',
+                        help='Volver a extraer aunque exista un Bronze de la misma fuente')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Extraer el Excel por lotes directamente a Bronze (memoria acotada)')
+    parser.add_argument('--chunked', action='store_true',
+                        help='Transformar Silver por row groups de Bronze (memoria acotada)')
+    parser.add_argument('--arrow', action='store_true',
+                        help='Transformar Silver con tablas y kernels Arrow (sin strings de Python)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Procesar solo facturas posteriores a la marca de agua y combinar Gold')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos para el modo por chunks (0 = todos los núcleos; implica --chunked si > 1)')
+    parser.add_argument('--approx-distinct', action='store_true',
+                        help='Contar pedidos y clientes únicos por país y mes con HyperLogLog')
+    parser.add_argument('--hll-precision', type=int, default=None,
+                        help='Bits de índice HLL (4-18, por defecto Config.HLL_PRECISION)')
+    parser.add_argument('--no-gc', action='store_true',
+                        help='No aplicar la política de retención de snapshots al terminar')
+    parser.add_argument('--no-quarantine', action='store_true',
+                        help='No guardar las filas rechazadas por Silver en data/quarantine')
+    parser.add_argument('--benchmark-storage', action='store_true',
+                        help='Comparar tamaño y tiempos de escritura/lectura de opciones Parquet por capa')
+    parser.add_argument('--benchmark-extract', action='store_true',
+                        help='Comparar filas/s y memoria pico de la extracción clásica y streaming')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> bool:
     """
     Función principal que orquesta el pipeline ETL completo
     
+    Args:
+        argv: Argumentos de línea de comandos (por defecto sys.argv)
+        
     Returns:
         True si el pipeline se ejecutó exitosamente
     """
+    args = parse_args(argv)
     logger = setup_logging()
     
     try:
+        if args.benchmark_extract:
+            return bool(benchmark_extraction(logger, args.source))
+        if args.benchmark_storage:
+            return benchmark_storage(logger) is not None
+        
+        hll_precision = None
+        if args.approx_distinct or Config.APPROX_DISTINCT:
+            hll_precision = args.hll_precision or Config.HLL_PRECISION
+            if not 4 <= hll_precision <= 18:
+                logger.error(f"✗ Precisión HLL fuera de rango (4-18): {hll_precision}")
+                return False
+            logger.info(f"Conteo aproximado de distintos: HLL p={hll_precision} "
+                        f"(error estándar ±{hll_relative_error(hll_precision):.2%})")
+        
         # EXTRACCIÓN (Bronze)
-        df_raw = extract_data(logger)
-        if df_raw is None:
+        bronze_path = run_bronze_stage(args, logger)
+        if bronze_path is None:
             logger.error("Pipeline abortado: Error en extracción")
             return False
         
-        load_bronze(df_raw, logger)
+        # MODO INCREMENTAL (Silver delta + Gold combinado)
+        if args.incremental:
+            gold_tables = run_incremental(bronze_path, logger, hll_precision=hll_precision,
+                                          quarantine=not args.no_quarantine)
+            if gold_tables is None:
+                logger.error("Pipeline abortado: Error en procesamiento incremental")
+                return False
+            if not load_gold(gold_tables, logger):
+                logger.error("Pipeline abortado: Error publicando Gold")
+                return False
+            if not args.no_gc:
+                collect_garbage(logger)
+            logger.info("\n" + "="*60)
+            logger.info("PIPELINE ETL INCREMENTAL COMPLETADO EXITOSAMENTE")
+            logger.info("="*60)
+            return True
         
-        # TRANSFORMACIÓN (Silver)
-        df_clean = transform_silver(df_raw, logger)
-        if df_clean is None:
-            logger.error("Pipeline abortado: Error en transformación")
-            return False
-        
-        load_silver(df_clean, logger)
+        # TRANSFORMACIÓN (Silver) Y AGREGACIÓN (Gold)
+        if args.chunked or (args.workers is not None and args.workers != 1):
+            # Silver y Gold por row groups: nunca se carga Silver completo
+            silver_path = transform_silver_chunked(bronze_path, logger, args.workers,
+                                                   quarantine=not args.no_quarantine)
+            if silver_path is None:
+                logger.error("Pipeline abortado: Error en transformación")
+                return False
+            
+            partials = build_gold_partials_chunked(silver_path, logger, args.workers, hll_precision)
+            gold_tables = (finalize_gold_partials(partials) if partials is not None
+                           else {name: None for name in GOLD_TABLES})
+            processed_rows = silver_num_rows(silver_path)
+        else:
+            if args.arrow:
+                table_raw = read_bronze_table(bronze_path, logger)
+                table_clean = (transform_silver_arrow(table_raw, logger, quarantine=not args.no_quarantine)
+                               if table_raw is not None else None)
+                # Gold trabaja sobre códigos: las columnas de diccionario pasan
+                # a pandas como categóricas, sin crear strings de Python
+                df_clean = table_clean.to_pandas() if table_clean is not None else None
+            else:
+                df_raw = read_bronze(bronze_path, logger)
+                df_clean = (transform_silver(df_raw, logger, quarantine=not args.no_quarantine)
+                            if df_raw is not None else None)
+            if df_clean is None:
+                logger.error("Pipeline abortado: Error en transformación")
+                return False
+            
+            if load_silver(table_clean if args.arrow else df_clean, logger) is None:
+                logger.error("Pipeline abortado: Error guardando Silver")
+                return False
+            if hll_precision:
+                # Los conteos aproximados se calculan con los sketches combinables
+                gold_tables = finalize_gold_partials(build_gold_partials(df_clean, hll_precision))
+            else:
+                gold_tables = build_gold_tables(df_clean, logger)
+            processed_rows = len(df_clean)
         
-        # AGREGACIÓN (Gold)
-        gold_tables = {
-            'sales_by_country': aggregate_sales_by_country(df_clean, logger),
-            'sales_by_time': aggregate_sales_by_time(df_clean, logger),
-            'top_products': aggregate_top_products(df_clean, logger),
-            'customer_segments': aggregate_customer_segments(df_clean, logger)
-        }
+        if not load_gold(gold_tables, logger):
+            logger.error("Pipeline abortado: Error publicando Gold")
+            return False
         
-        load_gold(gold_tables, logger)
+        # RETENCIÓN (después del commit Gold: el catálogo ya apunta a lo nuevo)
+        if not args.no_gc:
+            collect_garbage(logger)
         
         # RESUMEN FINAL
         logger.info("\n" + "="*60)
         logger.info("PIPELINE ETL COMPLETADO EXITOSAMENTE")
         logger.info("="*60)
-        logger.info(f"Registros procesados: {len(df_clean):,}")
+        logger.info(f"Registros procesados: {processed_rows:,}")
         logger.info(f"Tablas Gold generadas: {len([t for t in gold_tables.values() if t is not None])}")
         logger.info("="*60)
         
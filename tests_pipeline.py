@@ -6,9 +6,50 @@ Descripción: Suite de pruebas para validar transformaciones y calidad de datos
 """
 
 import unittest
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import http.server
+import io
+import functools
+from unittest import mock
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
+from pathlib import Path
+
+import main
+from main import Config
+
+
+class PipelineTestCase(unittest.TestCase):
+    """Base para pruebas que escriben en disco: redirige las rutas de Config a un directorio temporal"""
+    
+    PATH_ATTRS = ['BASE_PATH', 'BRONZE_PATH', 'SILVER_PATH', 'QUARANTINE_PATH', 'GOLD_PATH', 'STATE_PATH',
+                  'LOGS_PATH']
+    
+    def setUp(self):
+        """Crear directorio temporal y apuntar Config a él"""
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self._saved_paths = {attr: getattr(Config, attr) for attr in self.PATH_ATTRS}
+        Config.BASE_PATH = self.tmp_dir
+        Config.BRONZE_PATH = self.tmp_dir / 'data' / 'bronze'
+        Config.SILVER_PATH = self.tmp_dir / 'data' / 'silver'
+        Config.QUARANTINE_PATH = self.tmp_dir / 'data' / 'quarantine'
+        Config.GOLD_PATH = self.tmp_dir / 'data' / 'gold'
+        Config.STATE_PATH = self.tmp_dir / 'data' / 'state'
+        Config.LOGS_PATH = self.tmp_dir / 'logs'
+        Config.create_directories()
+        self.logger = logging.getLogger('ETL_Tests')
+    
+    def tearDown(self):
+        """Restaurar Config y eliminar el directorio temporal"""
+        for attr, value in self._saved_paths.items():
+            setattr(Config, attr, value)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
 
 
 class TestDataQuality(unittest.TestCase):
@@ -191,6 +232,1258 @@ class TestPipelineIntegration(unittest.TestCase):
         self.assertEqual(len(expected_tables), 4)
 
 
+class _CountingHandler(http.server.SimpleHTTPRequestHandler):
+    """Servidor HTTP local que registra los códigos de respuesta"""
+    
+    status_codes = []
+    fail_with = None
+    truncate = False
+    
+    def log_request(self, code='-', size='-'):
+        self.status_codes.append(int(code))
+    
+    def send_head(self):
+        if self.fail_with:
+            self.send_error(self.fail_with)
+            return None
+        if self.truncate:
+            # Anuncia el archivo completo pero corta la conexión a la mitad
+            body = (Path(self.directory) / 'Online Retail.xlsx').read_bytes()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            return io.BytesIO(body[:len(body) // 2])
+        return super().send_head()
+
+
+class TestSourceCache(PipelineTestCase):
+    """Pruebas de la caché local de la fuente"""
+    
+    def setUp(self):
+        super().setUp()
+        self.source_dir = self.tmp_dir / 'source'
+        self.source_dir.mkdir()
+        self.source_file = self.source_dir / 'Online Retail.xlsx'
+        self.source_file.write_bytes(b'contenido-v1')
+    
+    def test_local_file_cached_by_hash(self):
+        """Verificar que una fuente local se guarda por hash y se reutiliza"""
+        path1, sha1 = main.fetch_source(self.logger, str(self.source_file))
+        path2, sha2 = main.fetch_source(self.logger, str(self.source_file))
+        
+        self.assertEqual(sha1, sha2)
+        self.assertEqual(path1, path2)
+        self.assertEqual(path1.name, f'{sha1}.xlsx')
+        self.assertEqual(path1.read_bytes(), b'contenido-v1')
+    
+    def test_local_file_change_detected(self):
+        """Verificar que un cambio en la fuente genera una nueva entrada"""
+        _, sha1 = main.fetch_source(self.logger, str(self.source_file))
+        self.source_file.write_bytes(b'contenido-v2-mas-largo')
+        path2, sha2 = main.fetch_source(self.logger, self.source_file.as_uri())
+        
+        self.assertNotEqual(sha1, sha2)
+        self.assertEqual(path2.read_bytes(), b'contenido-v2-mas-largo')
+    
+    def test_http_conditional_download(self):
+        """Verificar que la segunda descarga HTTP usa validadores y no re-descarga"""
+        _CountingHandler.status_codes = []
+        handler = functools.partial(_CountingHandler, directory=str(self.source_dir))
+        server = http.server.HTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/Online%20Retail.xlsx'
+            path1, sha1 = main.fetch_source(self.logger, url)
+            path2, sha2 = main.fetch_source(self.logger, url)
+        finally:
+            server.shutdown()
+            server.server_close()
+        
+        self.assertEqual(_CountingHandler.status_codes, [200, 304])
+        self.assertEqual((path1, sha1), (path2, sha2))
+        self.assertEqual(path1.read_bytes(), b'contenido-v1')
+    
+    def test_http_error_falls_back_to_cache(self):
+        """Verificar que un error HTTP (503) usa la caché si existe y falla si no"""
+        _CountingHandler.status_codes = []
+        handler = functools.partial(_CountingHandler, directory=str(self.source_dir))
+        server = http.server.HTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/Online%20Retail.xlsx'
+            _CountingHandler.fail_with = 503
+            self.assertIsNone(main.fetch_source(self.logger, url))
+            _CountingHandler.fail_with = None
+            path1, sha1 = main.fetch_source(self.logger, url)
+            _CountingHandler.fail_with = 503
+            path2, sha2 = main.fetch_source(self.logger, url)
+        finally:
+            _CountingHandler.fail_with = None
+            server.shutdown()
+            server.server_close()
+        
+        self.assertEqual(_CountingHandler.status_codes, [503, 200, 503])
+        self.assertEqual((path1, sha1), (path2, sha2))
+        self.assertEqual(path2.read_bytes(), b'contenido-v1')
+    
+    def test_truncated_download_falls_back_to_cache(self):
+        """Verificar que un cuerpo truncado no queda en caché ni como temporal y usa la versión anterior"""
+        _CountingHandler.status_codes = []
+        handler = functools.partial(_CountingHandler, directory=str(self.source_dir))
+        server = http.server.HTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/Online%20Retail.xlsx'
+            _CountingHandler.truncate = True
+            self.assertIsNone(main.fetch_source(self.logger, url))
+            _CountingHandler.truncate = False
+            path1, sha1 = main.fetch_source(self.logger, url)
+            _CountingHandler.truncate = True
+            path2, sha2 = main.fetch_source(self.logger, url)
+        finally:
+            _CountingHandler.truncate = False
+            server.shutdown()
+            server.server_close()
+        
+        self.assertEqual(_CountingHandler.status_codes, [200, 200, 200])
+        self.assertEqual((path1, sha1), (path2, sha2))
+        self.assertEqual(path2.read_bytes(), b'contenido-v1')
+        cache_dir = Config.BRONZE_PATH / Config.SOURCE_CACHE_DIR
+        self.assertEqual(sorted(p.name for p in cache_dir.iterdir()), sorted(['index.json', path1.name]))
+
+
+def write_sample_xlsx(path: Path) -> pd.DataFrame:
+    """Escribe un Excel pequeño con la estructura del dataset Online Retail"""
+    from openpyxl import Workbook
+    
+    rows = [
+        [536365, '85123A', 'WHITE HANGING HEART', 6, datetime(2010, 12, 1, 8, 26), 2.55, 17850, 'United Kingdom'],
+        [536365, 71053, 'WHITE METAL LANTERN', 6, datetime(2010, 12, 1, 8, 26), 3.39, 17850, 'United Kingdom'],
+        ['C536379', 'D', 'Discount', -1, datetime(2010, 12, 1, 9, 41), 27.5, 14527, 'United Kingdom'],
+        [536414, 22139, None, 56, datetime(2010, 12, 1, 11, 52), 0.0, None, 'United Kingdom'],
+        [536370, 22728, 'ALARM CLOCK BAKELIKE PINK', 24, datetime(2010, 12, 1, 8, 45), 3.75, 12583, 'France']
+    ]
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Online Retail')
+    sheet.append(list(main.BRONZE_SCHEMA.names))
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return pd.DataFrame(rows, columns=main.BRONZE_SCHEMA.names)
+
+
+class TestStreamingExtraction(PipelineTestCase):
+    """Pruebas de la extracción en streaming hacia Bronze"""
+    
+    def setUp(self):
+        super().setUp()
+        self.source_file = self.tmp_dir / 'sample.xlsx'
+        write_sample_xlsx(self.source_file)
+    
+    def test_streaming_matches_classic_bronze(self):
+        """Verificar que streaming produce el mismo Bronze que read_excel + load_bronze"""
+        streaming_path = main.extract_to_bronze_streaming(self.logger, str(self.source_file), batch_rows=2)
+        df_streaming = pd.read_parquet(streaming_path)
+        
+        df_classic = main.extract_data(self.logger, str(self.source_file))
+        df_classic = main._prepare_bronze_frame(df_classic)
+        
+        self.assertEqual(pq.ParquetFile(streaming_path).metadata.num_row_groups, 3)
+        pd.testing.assert_frame_equal(df_streaming, df_classic, check_dtype=False)
+    
+    def test_missing_columns_fail(self):
+        """Verificar que una hoja sin las columnas esperadas no deja archivos parciales"""
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.active.append(['InvoiceNo', 'Quantity'])
+        workbook.active.append(['1', 2])
+        bad_file = self.tmp_dir / 'bad.xlsx'
+        workbook.save(bad_file)
+        
+        self.assertIsNone(main.extract_to_bronze_streaming(self.logger, str(bad_file)))
+        self.assertEqual(list(Config.BRONZE_PATH.glob('raw_data_*')), [])
+
+
+class TestBronzeResume(PipelineTestCase):
+    """Pruebas de reanudación desde snapshots Bronze"""
+    
+    def setUp(self):
+        super().setUp()
+        self.source_file = self.tmp_dir / 'sample.xlsx'
+        write_sample_xlsx(self.source_file)
+    
+    def test_snapshot_matched_by_source_hash(self):
+        """Verificar que el snapshot se localiza por el hash de la fuente"""
+        df_raw = main.extract_data(self.logger, str(self.source_file))
+        main.load_bronze(df_raw, self.logger)
+        (Config.BRONZE_PATH / 'raw_data_99999999_999999.parquet.tmp').write_bytes(b'parcial')
+        
+        snapshot = main.find_bronze_snapshot(df_raw.attrs['source_sha256'])
+        self.assertIsNotNone(snapshot)
+        self.assertIsNone(main.find_bronze_snapshot('0' * 64))
+        
+        df_bronze = main.read_bronze(snapshot, self.logger)
+        self.assertEqual(df_bronze.attrs['source_sha256'], df_raw.attrs['source_sha256'])
+        self.assertEqual(len(df_bronze), len(df_raw))
+    
+    def test_main_skips_extraction_when_source_unchanged(self):
+        """Verificar que una segunda ejecución reutiliza Bronze en lugar del Excel"""
+        self.assertTrue(main.main(['--source', str(self.source_file)]))
+        self.assertTrue(main.main(['--source', str(self.source_file)]))
+        self.assertEqual(len(list(Config.BRONZE_PATH.glob('raw_data_*.parquet'))), 1)
+        
+        self.assertTrue(main.main(['--from-bronze']))
+        self.assertEqual(len(list(Config.BRONZE_PATH.glob('raw_data_*.parquet'))), 1)
+    
+    def test_failed_write_leaves_no_tmp_file(self):
+        """Verificar que un fallo al escribir Bronze borra el archivo temporal"""
+        def failing_write(table, path, **kwargs):
+            Path(path).write_bytes(b'parcial')
+            raise OSError('disco lleno')
+        
+        df_raw = main.extract_data(self.logger, str(self.source_file))
+        with mock.patch.object(main.pq, 'write_table', side_effect=failing_write):
+            self.assertFalse(main.load_bronze(df_raw, self.logger))
+        self.assertEqual(list(Config.BRONZE_PATH.glob('raw_data_*')), [])
+
+
+def make_bronze_frame() -> pd.DataFrame:
+    """DataFrame con tipos Bronze: duplicados, nulos, cancelaciones y precios fuera de rango"""
+    base = datetime(2010, 12, 1, 8, 26)
+    return pd.DataFrame({
+        'InvoiceNo': ['536365', '536365', '536366', '536365', 'C536379', '536367', '536368', '536369'],
+        'StockCode': ['85123A', '71053', '84406B', '85123A', 'D', '22752', '22728', '22728'],
+        'Description': [' white hanging heart ', 'WHITE METAL LANTERN', 'CREAM CUPID HEARTS',
+                        ' white hanging heart ', 'Discount', 'SET 7 BABUSHKA', 'ALARM CLOCK', 'ALARM CLOCK'],
+        'Quantity': [6, 6, 8, 6, -1, 2, 24, 3],
+        'InvoiceDate': [base, base, base + timedelta(days=1), base, base + timedelta(days=2),
+                        base + timedelta(days=40), base + timedelta(days=41), base + timedelta(days=45)],
+        'UnitPrice': [2.55, 3.39, 2.75, 2.55, 27.5, 7.65, 3.75, 15000.0],
+        'CustomerID': [17850.0, 17850.0, np.nan, 17850.0, 14527.0, 13047.0, 12583.0, 12583.0],
+        'Country': ['United Kingdom ', 'United Kingdom ', 'United Kingdom', 'United Kingdom ',
+                    'United Kingdom', 'United Kingdom', 'France', 'France']
+    })
+
+
+class TestChunkedSilver(PipelineTestCase):
+    """Pruebas del motor Silver por chunks"""
+    
+    def setUp(self):
+        super().setUp()
+        self.df_bronze = make_bronze_frame()
+        self.bronze_path = Config.BRONZE_PATH / 'raw_data_20250101_000000.parquet'
+        self.df_bronze.to_parquet(self.bronze_path, index=False, row_group_size=2)
+    
+    def test_row_hash_set_dedup(self):
+        """Verificar que RowHashSet solo marca como nueva la primera aparición"""
+        seen = main.RowHashSet()
+        first = seen.add_new(np.array([1, 2, 2, 3], dtype=np.uint64))
+        second = seen.add_new(np.array([3, 4, 1, 5, 5], dtype=np.uint64))
+        
+        self.assertEqual(first.tolist(), [True, True, False, True])
+        self.assertEqual(second.tolist(), [False, True, False, True, False])
+        self.assertEqual(len(seen), 5)
+    
+    def test_chunked_matches_in_memory(self):
+        """Verificar que el resultado por chunks es idéntico a transform_silver"""
+        expected = main.transform_silver(self.df_bronze, self.logger).reset_index(drop=True)
+        silver_path = main.transform_silver_chunked(self.bronze_path, self.logger)
+        result = main.read_silver(silver_path)
+        
+        self.assertEqual(pq.ParquetFile(self.bronze_path).metadata.num_row_groups, 4)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        self.assertEqual(len(result), 4)
+    
+    def test_parallel_matches_serial(self):
+        """Verificar que repartir row groups entre procesos no cambia el resultado"""
+        serial = main.read_silver(main.transform_silver_chunked(self.bronze_path, self.logger, workers=1))
+        parallel = main.read_silver(main.transform_silver_chunked(self.bronze_path, self.logger, workers=2))
+        
+        pd.testing.assert_frame_equal(parallel, serial)
+
+
+class TestGoldEngine(unittest.TestCase):
+    """Pruebas del motor Gold unificado"""
+    
+    def setUp(self):
+        self.logger = logging.getLogger('ETL_Tests')
+        self.df_silver = main.transform_silver(make_bronze_frame(), self.logger)
+    
+    def test_matches_individual_aggregations(self):
+        """Verificar que el motor unificado reproduce las agregaciones individuales"""
+        fused = main.build_gold_tables(self.df_silver, self.logger, top_n=2)
+        df_strings = main.decode_silver(self.df_silver)
+        expected = {
+            'sales_by_country': main.aggregate_sales_by_country(df_strings, self.logger),
+            'sales_by_time': main.aggregate_sales_by_time(df_strings, self.logger),
+            'top_products': main.aggregate_top_products(df_strings, self.logger, top_n=2),
+            'customer_segments': main.aggregate_customer_segments(df_strings, self.logger)
+        }
+        expected['customer_cohorts'] = main.aggregate_customer_cohorts(
+            df_strings, expected['customer_segments'], self.logger
+        )
+        
+        self.assertEqual(sorted(fused), sorted(main.GOLD_TABLES))
+        for name, df_expected in expected.items():
+            pd.testing.assert_frame_equal(
+                fused[name].reset_index(drop=True), df_expected.reset_index(drop=True),
+                check_dtype=False, obj=name
+            )
+    
+    def test_count_distinct(self):
+        """Verificar nunique por grupo sobre códigos enteros"""
+        groups = np.array([0, 0, 0, 1, 1, 2])
+        keys = np.array([5, 5, 3, 5, 1, 0])
+        self.assertEqual(main._count_distinct(groups, keys, 3).tolist(), [2, 2, 1])
+
+
+class TestSilverDictionaries(PipelineTestCase):
+    """Pruebas de las columnas clave codificadas como diccionario en Silver"""
+    
+    def test_round_trip_with_persisted_dictionaries(self):
+        """Verificar que Silver guarda diccionarios y se puede volver a texto"""
+        df_raw = make_bronze_frame()
+        df_silver = main.transform_silver(df_raw, self.logger)
+        silver_path = main.load_silver(df_silver, self.logger)
+        
+        df_read = main.read_silver(silver_path)
+        for col in main.SILVER_DICTIONARY_COLUMNS:
+            self.assertIsInstance(df_read[col].dtype, pd.CategoricalDtype)
+            self.assertTrue(main._dictionaries_path(silver_path).exists())
+        
+        self.assertEqual(df_read['StockCode'].cat.codes.tolist(), [3, 2, 1, 0])
+        decoded = main.decode_silver(df_read)
+        self.assertEqual(decoded['InvoiceNo'].tolist(), ['536365', '536365', '536367', '536368'])
+        self.assertEqual(decoded['Description'].iloc[0], 'WHITE HANGING HEART')
+
+
+class TestIncrementalProcessing(PipelineTestCase):
+    """Pruebas del modo incremental con marca de agua"""
+    
+    def setUp(self):
+        super().setUp()
+        self.df_bronze = make_bronze_frame()
+        self.first_snapshot = Config.BRONZE_PATH / 'raw_data_20250101_000000.parquet'
+        self.second_snapshot = Config.BRONZE_PATH / 'raw_data_20250102_000000.parquet'
+        cutoff = self.df_bronze['InvoiceDate'].min() + timedelta(days=2)
+        self.df_bronze[self.df_bronze['InvoiceDate'] <= cutoff].to_parquet(self.first_snapshot, index=False)
+        self.df_bronze.to_parquet(self.second_snapshot, index=False)
+    
+    def test_delta_merge_matches_full_rebuild(self):
+        """Verificar que procesar por deltas produce las mismas tablas Gold"""
+        main.run_incremental(self.first_snapshot, self.logger)
+        incremental = main.run_incremental(self.second_snapshot, self.logger)
+        
+        df_silver = main.transform_silver(self.df_bronze, self.logger)
+        full = main.build_gold_tables(df_silver, self.logger)
+        for name in main.GOLD_TABLES:
+            pd.testing.assert_frame_equal(
+                incremental[name].reset_index(drop=True), full[name].reset_index(drop=True),
+                check_dtype=False, obj=name
+            )
+        
+        watermark = main.load_watermark()
+        self.assertEqual(len(watermark['silver_files']), 2)
+        self.assertEqual(pd.Timestamp(watermark['max_invoice_date']), self.df_bronze['InvoiceDate'].max())
+    
+    def test_same_snapshot_is_not_reprocessed(self):
+        """Verificar que un snapshot ya procesado no genera otro delta Silver"""
+        first = main.run_incremental(self.second_snapshot, self.logger)
+        second = main.run_incremental(self.second_snapshot, self.logger)
+        
+        self.assertEqual(len(main.load_watermark()['silver_files']), 1)
+        pd.testing.assert_frame_equal(second['sales_by_country'], first['sales_by_country'])
+    
+    def test_untouched_state_buckets_are_not_rewritten(self):
+        """Verificar que un delta solo reescribe los buckets de estado de los grupos que toca"""
+        main.run_incremental(self.first_snapshot, self.logger)
+        before = main.load_watermark()['gold_state']['tables']
+        state_root = Config.STATE_PATH / 'gold_state'
+        mtimes = {path: path.stat().st_mtime_ns for path in state_root.rglob('*.parquet')}
+        
+        main.run_incremental(self.second_snapshot, self.logger)
+        after = main.load_watermark()['gold_state']['tables']
+        
+        first_date = pd.read_parquet(self.first_snapshot)['InvoiceDate'].max()
+        df_delta = main.transform_silver(self.df_bronze[self.df_bronze['InvoiceDate'] > first_date], self.logger)
+        delta = main.build_gold_partials(df_delta)
+        untouched = 0
+        for table, buckets in after.items():
+            touched = {f'{bucket:03d}'
+                       for bucket in main._state_buckets(delta[table]['measures'], table, Config.GOLD_STATE_BUCKETS)}
+            for name, bucket_dir in buckets.items():
+                if name in touched:
+                    self.assertNotEqual(bucket_dir, before[table].get(name), f'{table}/{name}')
+                    continue
+                untouched += 1
+                self.assertEqual(bucket_dir, before[table][name], f'{table}/{name}')
+                for path in (state_root / table / bucket_dir).glob('*.parquet'):
+                    self.assertEqual(path.stat().st_mtime_ns, mtimes[path])
+            # Las versiones reemplazadas se eliminan tras publicar la marca de agua
+            self.assertEqual(sorted(p.name for p in (state_root / table).iterdir()), sorted(buckets.values()))
+        self.assertGreater(untouched, 0)
+
+
+class TestGoldPartials(PipelineTestCase):
+    """Pruebas de los agregados parciales combinables"""
+    
+    def setUp(self):
+        super().setUp()
+        self.df_silver = main.transform_silver(make_bronze_frame(), self.logger).reset_index(drop=True)
+    
+    def assert_gold_equal(self, left, right):
+        for name in main.GOLD_TABLES:
+            pd.testing.assert_frame_equal(
+                left[name].reset_index(drop=True), right[name].reset_index(drop=True),
+                check_dtype=False, obj=name
+            )
+    
+    def test_merge_is_associative_and_commutative(self):
+        """Verificar que el orden y la agrupación de los lotes no cambian el resultado"""
+        a, b, c = (main.build_gold_partials(self.df_silver.iloc[[i]]) for i in [0, 1, 2])
+        d = main.build_gold_partials(self.df_silver.iloc[[3]])
+        empty = main.build_gold_partials(self.df_silver.iloc[[]])
+        
+        left = main.finalize_gold_partials(main.merge_gold_partials(main.merge_gold_partials(a, b), c, d, empty))
+        right = main.finalize_gold_partials(main.merge_gold_partials(d, main.merge_gold_partials(c, b, a)))
+        full = main.build_gold_tables(self.df_silver, self.logger)
+        
+        self.assert_gold_equal(left, right)
+        self.assert_gold_equal(left, full)
+    
+    def test_chunked_partials_match_in_memory(self):
+        """Verificar Gold por row groups de Silver frente al motor en memoria"""
+        bronze_path = Config.BRONZE_PATH / 'raw_data_20250101_000000.parquet'
+        make_bronze_frame().to_parquet(bronze_path, index=False, row_group_size=3)
+        silver_path = main.transform_silver_chunked(bronze_path, self.logger)
+        
+        partials = main.build_gold_partials_chunked(silver_path, self.logger)
+        self.assert_gold_equal(main.finalize_gold_partials(partials),
+                               main.build_gold_tables(self.df_silver, self.logger))
+
+
+class TestApproxDistinct(PipelineTestCase):
+    """Pruebas del conteo aproximado de distintos con HyperLogLog"""
+    
+    def setUp(self):
+        super().setUp()
+        self.df_silver = main.transform_silver(make_bronze_frame(), self.logger).reset_index(drop=True)
+    
+    def test_estimate_within_error_bound(self):
+        """Verificar la estimación HLL y que combinar equivale a unir los conjuntos"""
+        rng = np.random.default_rng(0)
+        hashes = rng.integers(0, 2**63, size=100_000, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        groups = np.zeros(len(hashes), dtype=np.int64)
+        
+        full = main.hll_registers(groups, hashes, 1, 12)
+        halves = np.maximum(main.hll_registers(groups[:50_000], hashes[:50_000], 1, 12),
+                            main.hll_registers(groups[50_000:], hashes[50_000:], 1, 12))
+        np.testing.assert_array_equal(full, halves)
+        
+        estimate = main.hll_estimate(full)[0]
+        self.assertLess(abs(estimate - 100_000) / 100_000, 4 * main.hll_relative_error(12))
+    
+    def test_approx_partials_merge_and_finalize(self):
+        """Verificar que los sketches HLL se combinan con parciales exactos"""
+        approx = main.build_gold_partials(self.df_silver.iloc[:2], hll_precision=10)
+        exact = main.build_gold_partials(self.df_silver.iloc[2:])
+        self.assertIn('Registers', approx['sales_by_country']['CustomerID'].columns)
+        self.assertIn('KeyHashes', approx['top_products']['CustomerID'].columns)
+        
+        gold = main.finalize_gold_partials(main.merge_gold_partials(approx, exact))
+        full = main.build_gold_tables(self.df_silver, self.logger)
+        # Con pocos distintos la corrección de rango bajo da el valor exacto
+        for name in ['sales_by_country', 'sales_by_time']:
+            pd.testing.assert_frame_equal(gold[name].reset_index(drop=True),
+                                          full[name].reset_index(drop=True),
+                                          check_dtype=False, obj=name)
+        self.assertEqual(gold['sales_by_country'].attrs['approx_distinct']['precision'], 10)
+        self.assertNotIn('approx_distinct', gold['top_products'].attrs)
+        
+        with self.assertRaises(ValueError):
+            main.merge_gold_partials(approx, main.build_gold_partials(self.df_silver, hll_precision=12))
+    
+    def test_error_bounds_in_gold_metadata(self):
+        """Verificar que las cotas de error se guardan en los metadatos Parquet"""
+        gold = main.finalize_gold_partials(main.build_gold_partials(self.df_silver, hll_precision=14))
+        self.assertTrue(main.load_gold(gold, self.logger))
+        
+        country_file = next(Config.GOLD_PATH.glob('sales_by_country_*.parquet'))
+        metadata = main.read_gold_metadata(country_file)['approx_distinct']
+        self.assertEqual(metadata['columns'], ['TotalOrders', 'UniqueCustomers'])
+        self.assertAlmostEqual(metadata['relative_standard_error'], 1.04 / 128, places=6)
+        
+        products_file = next(Config.GOLD_PATH.glob('top_products_*.parquet'))
+        self.assertEqual(main.read_gold_metadata(products_file), {})
+
+
+class TestTopProducts(PipelineTestCase):
+    """Pruebas de la selección top-K de productos"""
+    
+    def test_top_k_matches_full_sort(self):
+        """Verificar top_k_indices frente a ordenar todo (incluidos empates)"""
+        values = np.array([5.0, 1.0, 7.0, 5.0, 3.0, 7.0, 5.0])
+        expected = pd.Series(values).sort_values(ascending=False, kind='stable').index.to_numpy()
+        for k in [0, 1, 3, 4, 7, 10]:
+            np.testing.assert_array_equal(main.top_k_indices(values, k), expected[:k])
+        
+        # Empates cortados en la posición k: entran los de posición más baja
+        self.assertEqual(main.top_k_indices(values, 3).tolist(), [2, 5, 0])
+        self.assertEqual(main.top_k_indices(values, 4).tolist(), [2, 5, 0, 3])
+        
+        rng = np.random.default_rng(7)
+        for _ in range(20):
+            values = rng.integers(0, 5, 50).astype(np.float64)
+            expected = pd.Series(values).sort_values(ascending=False, kind='stable').index.to_numpy()
+            k = int(rng.integers(1, 50))
+            np.testing.assert_array_equal(main.top_k_indices(values, k), expected[:k])
+    
+    def test_rankings_in_memory_and_partials(self):
+        """Verificar los tres rankings en el motor unificado y desde parciales"""
+        df_silver = main.transform_silver(make_bronze_frame(), self.logger).reset_index(drop=True)
+        gold = main.build_gold_tables(df_silver, self.logger, top_n=2)
+        from_partials = main.finalize_gold_partials(main.merge_gold_partials(
+            main.build_gold_partials(df_silver.iloc[:2]), main.build_gold_partials(df_silver.iloc[2:])
+        ), top_n=2)
+        
+        for name, column in main.PRODUCT_RANKINGS.items():
+            self.assertEqual(len(gold[name]), 2)
+            self.assertTrue(gold[name][column].is_monotonic_decreasing)
+            pd.testing.assert_frame_equal(gold[name].reset_index(drop=True),
+                                          from_partials[name].reset_index(drop=True),
+                                          check_dtype=False, obj=name)
+        # Empates: se conserva el orden de producto (StockCode)
+        self.assertEqual(gold['top_products_by_quantity']['StockCode'].tolist(), ['22728', '71053'])
+        self.assertEqual(gold['top_products_by_orders']['StockCode'].tolist(), ['22728', '22752'])
+
+
+class TestGoldCatalog(PipelineTestCase):
+    """Pruebas del catálogo (manifiesto) de la capa Gold"""
+    
+    def setUp(self):
+        super().setUp()
+        df_silver = main.transform_silver(make_bronze_frame(), self.logger)
+        self.gold = main.build_gold_tables(df_silver, self.logger)
+    
+    def test_manifest_resolves_current_version(self):
+        """Verificar que los lectores usan el catálogo y no el archivo más nuevo"""
+        self.assertTrue(main.load_gold(self.gold, self.logger))
+        manifest = main.load_gold_manifest()
+        self.assertEqual(sorted(manifest['tables']), sorted(main.GOLD_TABLES))
+        
+        entry = manifest['tables']['sales_by_country']
+        self.assertEqual(entry['rows'], len(self.gold['sales_by_country']))
+        self.assertEqual(entry['schema']['TotalOrders'], 'int64')
+        
+        # Un archivo posterior sin publicar (escritura en curso) no se resuelve
+        (Config.GOLD_PATH / 'sales_by_country_29991231_235959.parquet').write_bytes(b'parcial')
+        self.assertEqual(main.resolve_gold_table('sales_by_country').name, entry['file'])
+        
+        snapshot = main.read_gold_snapshot(verify=True)
+        self.assertEqual(len(snapshot['customer_segments']), len(self.gold['customer_segments']))
+        
+        (Config.GOLD_PATH / entry['file']).write_bytes(b'modificado')
+        with self.assertRaises(ValueError):
+            main.read_gold_snapshot(['sales_by_country'], verify=True)
+    
+    def test_fallback_without_manifest(self):
+        """Verificar la búsqueda por nombre cuando no hay catálogo"""
+        for version in ['20250101_000000', '20250102_000000']:
+            for name in ['top_products', 'top_products_by_quantity']:
+                self.gold[name].to_parquet(Config.GOLD_PATH / f'{name}_{version}.parquet')
+        
+        self.assertIsNone(main.load_gold_manifest())
+        self.assertEqual(main.resolve_gold_table('top_products').name,
+                         'top_products_20250102_000000.parquet')
+        self.assertIsNone(main.resolve_gold_table('sales_by_time'))
+
+
+class TestGoldTransactions(PipelineTestCase):
+    """Pruebas de la publicación atómica de todas las tablas Gold"""
+    
+    def setUp(self):
+        super().setUp()
+        df_silver = main.transform_silver(make_bronze_frame(), self.logger)
+        self.gold = main.build_gold_tables(df_silver, self.logger)
+    
+    def test_failed_write_publishes_nothing(self):
+        """Verificar que un fallo a mitad de escritura deja la versión anterior intacta"""
+        self.assertTrue(main.load_gold(self.gold, self.logger))
+        manifest = main.load_gold_manifest()
+        files = sorted(p.name for p in Config.GOLD_PATH.iterdir())
+        
+        broken = dict(self.gold)
+        broken['top_products'] = pd.DataFrame({'StockCode': [object(), 1]})
+        self.assertFalse(main.load_gold(broken, self.logger))
+        
+        broken['top_products'] = None
+        self.assertFalse(main.load_gold(broken, self.logger))
+        
+        self.assertEqual(main.load_gold_manifest(), manifest)
+        self.assertEqual(sorted(p.name for p in Config.GOLD_PATH.iterdir()), files)
+    
+    def test_consecutive_commits_get_distinct_versions(self):
+        """Verificar que dos commits seguidos no sobrescriben archivos publicados"""
+        self.assertTrue(main.load_gold(self.gold, self.logger))
+        first = main.load_gold_manifest()
+        self.assertTrue(main.load_gold(self.gold, self.logger))
+        second = main.load_gold_manifest()
+        
+        self.assertNotEqual(first['version'], second['version'])
+        for name, entry in first['tables'].items():
+            self.assertTrue((Config.GOLD_PATH / entry['file']).exists())
+            self.assertEqual(main.resolve_gold_table(name).name, second['tables'][name]['file'])
+        self.assertEqual(list(Config.GOLD_PATH.glob('*.tmp')), [])
+
+
+class TestRetention(PipelineTestCase):
+    """Pruebas de la política de retención de snapshots"""
+    
+    def test_retention_rules(self):
+        """Verificar keep_last, keep_days y keep_monthly por separado y combinadas"""
+        versions = ['20250115_100000', '20250120_100000', '20250210_100000',
+                    '20250305_100000', '20250306_100000', '20250307_100000']
+        now = datetime(2025, 3, 8)
+        
+        self.assertEqual(main.select_retained_versions(versions, 2, 0, 0, now),
+                         {'20250307_100000', '20250306_100000'})
+        self.assertEqual(main.select_retained_versions(versions, 1, 5, 0, now),
+                         {'20250305_100000', '20250306_100000', '20250307_100000'})
+        self.assertEqual(main.select_retained_versions(versions, 1, 0, 3, now),
+                         {'20250307_100000', '20250210_100000', '20250120_100000'})
+        self.assertEqual(main.select_retained_versions(versions, 0, 0, 0, now), {'20250307_100000'})
+    
+    def test_garbage_collection_keeps_referenced(self):
+        """Verificar que el GC respeta catálogo, marca de agua y temporales recientes"""
+        old, mid, new = '20240101_000000', '20240201_000000', '20240301_000000'
+        for version in [old, mid, new]:
+            (Config.BRONZE_PATH / f'raw_data_{version}.parquet').write_bytes(b'b')
+            partition = Config.SILVER_PATH / f'clean_data_{version}' / 'Year=2024' / 'Month=01'
+            partition.mkdir(parents=True)
+            (partition / 'part-0.parquet').write_bytes(b's')
+            (Config.SILVER_PATH / f'clean_data_{version}.dictionaries.json').write_text('{}')
+            for name in main.GOLD_TABLES:
+                (Config.GOLD_PATH / f'{name}_{version}.parquet').write_bytes(b'g')
+        
+        main._save_gold_manifest({'tables': {'sales_by_time': {'file': f'sales_by_time_{old}.parquet'}}})
+        main._save_watermark({'bronze_snapshot': f'raw_data_{mid}.parquet',
+                              'silver_files': [f'clean_data_{old}']})
+        stale_tmp = Config.GOLD_PATH / 'top_products_20240401_000000.parquet.tmp'
+        fresh_tmp = Config.SILVER_PATH / 'clean_data_20240401_000000.dictionaries.json.tmp'
+        for tmp in [stale_tmp, fresh_tmp]:
+            tmp.write_bytes(b't')
+        os.utime(stale_tmp, (0, 0))
+        
+        def layer_files():
+            return sorted(p.name for path in [Config.BRONZE_PATH, Config.SILVER_PATH, Config.GOLD_PATH]
+                          for p in path.iterdir())
+        
+        everything = layer_files()
+        self.assertIsNotNone(main.collect_garbage(self.logger, 1, 0, 0, dry_run=True))
+        self.assertEqual(layer_files(), everything)
+        
+        removed = main.collect_garbage(self.logger, keep_last=1, keep_days=0, keep_monthly=0)
+        self.assertEqual(removed, {'bronze': 1, 'silver': 2, 'quarantine': 0, 'gold': 2 * len(main.GOLD_TABLES),
+                                   'source_cache': 0})
+        
+        self.assertEqual(sorted(p.name for p in Config.BRONZE_PATH.glob('raw_data_*')),
+                         [f'raw_data_{mid}.parquet', f'raw_data_{new}.parquet'])
+        self.assertTrue((Config.SILVER_PATH / f'clean_data_{old}.dictionaries.json').exists())
+        self.assertTrue((Config.SILVER_PATH / f'clean_data_{old}').is_dir())
+        self.assertFalse((Config.SILVER_PATH / f'clean_data_{mid}').exists())
+        self.assertTrue((Config.GOLD_PATH / f'sales_by_time_{old}.parquet').exists())
+        self.assertFalse(stale_tmp.exists())
+        self.assertTrue(fresh_tmp.exists())
+    
+    def test_source_cache_keeps_indexed_versions(self):
+        """Verificar que el GC borra las copias de la caché que el índice ya no referencia"""
+        source_file = self.tmp_dir / 'Online Retail.xlsx'
+        source_file.write_bytes(b'contenido-v1')
+        old_path, _ = main.fetch_source(self.logger, str(source_file))
+        source_file.write_bytes(b'contenido-v2-mas-largo')
+        new_path, new_sha = main.fetch_source(self.logger, str(source_file))
+        stale_tmp = old_path.parent / '.download.xlsx.tmp'
+        stale_tmp.write_bytes(b't')
+        os.utime(stale_tmp, (0, 0))
+        
+        removed = main.collect_garbage(self.logger)
+        self.assertEqual(removed['source_cache'], 2)
+        self.assertEqual(sorted(p.name for p in new_path.parent.iterdir()), sorted(['index.json', new_path.name]))
+        self.assertEqual(main.fetch_source(self.logger, str(source_file)), (new_path, new_sha))
+
+
+class TestSilverPartitions(PipelineTestCase):
+    """Pruebas del dataset Silver particionado por Year/Month"""
+    
+    def setUp(self):
+        super().setUp()
+        self.df_silver = main.transform_silver(make_bronze_frame(), self.logger).reset_index(drop=True)
+    
+    def test_partitioned_layout_and_pruning(self):
+        """Verificar particiones Hive, poda por rango de fechas y diccionarios"""
+        silver_path = main.load_silver(self.df_silver, self.logger)
+        partitions = main.silver_partitions(silver_path)
+        self.assertEqual([p.parent.relative_to(silver_path).as_posix() for p in partitions],
+                         ['Year=2010/Month=12', 'Year=2011/Month=01'])
+        
+        january = {'start': datetime(2011, 1, 1), 'end': datetime(2011, 2, 1)}
+        self.assertEqual(main.silver_partitions(silver_path, **january), partitions[1:])
+        df_january = main.read_silver(silver_path, **january)
+        self.assertEqual(main.decode_silver(df_january)['InvoiceNo'].tolist(), ['536367', '536368'])
+        
+        # Cada archivo guarda solo sus valores; al leer se aplica el diccionario global
+        file_values = pq.read_table(partitions[1])['StockCode'].chunks[0].dictionary.to_pylist()
+        self.assertEqual(sorted(file_values), ['22728', '22752'])
+        self.assertEqual(df_january['StockCode'].cat.categories.tolist(),
+                         self.df_silver['StockCode'].cat.categories.tolist())
+        
+        pd.testing.assert_frame_equal(main.read_silver(silver_path), self.df_silver, check_dtype=False)
+        self.assertEqual(main.silver_num_rows(silver_path), 4)
+    
+    def test_legacy_single_file_snapshot(self):
+        """Verificar que los Silver de archivo único anteriores se siguen leyendo"""
+        legacy_path = Config.SILVER_PATH / 'clean_data_20240101_000000.parquet'
+        self.df_silver.to_parquet(legacy_path, index=False)
+        
+        self.assertEqual(len(main.read_silver(legacy_path, start=datetime(2011, 1, 1))), 2)
+        self.assertEqual(main.silver_num_rows(legacy_path), 4)
+        
+        gold = main.finalize_gold_partials(main.build_gold_partials_chunked(legacy_path, self.logger))
+        expected = main.build_gold_tables(self.df_silver, self.logger)
+        pd.testing.assert_frame_equal(gold['sales_by_time'].reset_index(drop=True),
+                                      expected['sales_by_time'].reset_index(drop=True), check_dtype=False)
+
+
+class TestParquetStorage(PipelineTestCase):
+    """Pruebas de las opciones Parquet por capa y su benchmark"""
+    
+    def setUp(self):
+        super().setUp()
+        self._saved_settings = Config.PARQUET_SETTINGS
+        Config.PARQUET_SETTINGS = {layer: dict(options) for layer, options in self._saved_settings.items()}
+    
+    def tearDown(self):
+        Config.PARQUET_SETTINGS = self._saved_settings
+        super().tearDown()
+    
+    def test_layer_settings_applied(self):
+        """Verificar que Bronze se escribe con el códec y row group configurados"""
+        Config.PARQUET_SETTINGS['bronze'].update(compression='zstd', compression_level=3, row_group_size=2)
+        main.load_bronze(make_bronze_frame(), self.logger)
+        
+        metadata = pq.read_metadata(main.find_bronze_snapshot())
+        self.assertEqual(metadata.num_row_groups, 4)
+        self.assertEqual(metadata.row_group(0).column(0).compression, 'ZSTD')
+        self.assertEqual(main.parquet_options('bronze', {'compression_level': None})['compression'], 'zstd')
+        self.assertNotIn('compression_level', main.parquet_options('bronze', {'compression_level': None}))
+    
+    def test_benchmark_reports_each_setting(self):
+        """Verificar que el benchmark mide cada capa con cada variante"""
+        main.load_bronze(make_bronze_frame(), self.logger)
+        candidates = {'snappy': {'compression': 'snappy'},
+                      'zstd-1 rg=2': {'compression': 'zstd', 'compression_level': 1, 'row_group_size': 2}}
+        
+        results = main.benchmark_storage(self.logger, candidates, repeats=1)
+        self.assertEqual(list(zip(results['Layer'], results['Setting'])),
+                         [(layer, name) for layer in ['bronze', 'silver'] for name in candidates])
+        self.assertTrue((results['SizeMB'] > 0).all())
+        self.assertEqual(results.set_index('Setting').loc['zstd-1 rg=2', 'RowGroups'].tolist(), [4, 2])
+        self.assertEqual(list(Config.BASE_PATH.glob('tmp*')), [])
+
+
+class TestSilverClustering(PipelineTestCase):
+    """Pruebas del orden de filas (clustering) dentro de las particiones Silver"""
+    
+    def setUp(self):
+        super().setUp()
+        self._saved = (Config.SILVER_CLUSTER_BY, Config.SILVER_CLUSTER_ORDER, Config.PARQUET_SETTINGS)
+        Config.PARQUET_SETTINGS = {layer: dict(options) for layer, options in Config.PARQUET_SETTINGS.items()}
+        Config.SILVER_CLUSTER_BY = ['CustomerID', 'InvoiceDate']
+        Config.SILVER_CLUSTER_ORDER = 'sort'
+    
+    def tearDown(self):
+        Config.SILVER_CLUSTER_BY, Config.SILVER_CLUSTER_ORDER, Config.PARQUET_SETTINGS = self._saved
+        super().tearDown()
+    
+    def test_sorted_partitions_prune_row_groups(self):
+        """Verificar el orden por cliente, la poda por estadísticas y que ambos modos coinciden"""
+        Config.PARQUET_SETTINGS['silver']['row_group_size'] = 1
+        bronze_path = Config.BRONZE_PATH / 'raw_data_20240101_000000.parquet'
+        make_bronze_frame().to_parquet(bronze_path, row_group_size=3, index=False)
+        
+        in_memory = main.load_silver(main.transform_silver(make_bronze_frame(), self.logger), self.logger)
+        chunked = main.transform_silver_chunked(bronze_path, self.logger)
+        df_silver = main.read_silver(in_memory)
+        self.assertEqual(df_silver['CustomerID'].tolist(), [17850, 17850, 12583, 13047])
+        pd.testing.assert_frame_equal(main.read_silver(chunked), df_silver)
+        
+        # En enero (12583, 13047) solo el row group del cliente buscado pasa el filtro
+        fragment = next(iter(main._silver_dataset(in_memory).get_fragments(
+            filter=main.ds.field('Month') == 1)))
+        row_groups = fragment.split_by_row_group(filter=main.ds.field('CustomerID') == 13047)
+        self.assertEqual([rg.row_groups[0].id for rg in row_groups], [1])
+    
+    def test_zorder_interleaves_ranks(self):
+        """Verificar que la clave Z intercala los bits de los rangos de cada columna"""
+        table = main.pa.table({'a': [10, 20, 10, 20], 'b': ['x', 'x', 'y', 'y']})
+        self.assertEqual(main.zorder_keys(table, ['a', 'b']).tolist(), [0, 1, 2, 3])
+        
+        Config.SILVER_CLUSTER_BY = ['a', 'b']
+        Config.SILVER_CLUSTER_ORDER = 'zorder'
+        shuffled = table.take([3, 0, 2, 1])
+        self.assertEqual(main.cluster_silver_rows(shuffled).to_pydict(), table.to_pydict())
+
+
+class TestSilverLookup(PipelineTestCase):
+    """Pruebas de las búsquedas puntuales con filtros de Bloom"""
+    
+    def test_lookup_matches_filtered_read(self):
+        """Verificar que lookup_silver devuelve lo mismo que filtrar la lectura completa"""
+        bronze_path = Config.BRONZE_PATH / 'raw_data_20240101_000000.parquet'
+        make_bronze_frame().to_parquet(bronze_path, row_group_size=3, index=False)
+        in_memory = main.load_silver(main.transform_silver(make_bronze_frame(), self.logger), self.logger)
+        chunked = main.transform_silver_chunked(bronze_path, self.logger)
+        Config.SILVER_CHUNKED_BLOOM_FILTERS = True
+        try:
+            chunked_bloom = main.transform_silver_chunked(bronze_path, self.logger)
+        finally:
+            Config.SILVER_CHUNKED_BLOOM_FILTERS = False
+        
+        for silver_path, has_bloom in [(in_memory, True), (chunked, False), (chunked_bloom, True)]:
+            metadata = pq.read_metadata(main.silver_partitions(silver_path)[0])
+            names = metadata.schema.names
+            for col in Config.SILVER_BLOOM_FILTER_COLUMNS:
+                offset = metadata.row_group(0).column(names.index(col)).bloom_filter_offset
+                self.assertEqual(offset is not None, has_bloom)
+            
+            df_silver = main.decode_silver(main.read_silver(silver_path))
+            for column, value in [('CustomerID', 17850), ('CustomerID', '12583'), ('InvoiceNo', '536368')]:
+                expected = df_silver[df_silver[column].astype(str) == str(value)].reset_index(drop=True)
+                found = main.decode_silver(main.lookup_silver(silver_path, column, value))
+                pd.testing.assert_frame_equal(found[expected.columns], expected, check_dtype=False)
+            self.assertEqual(len(main.lookup_silver(silver_path, 'CustomerID', 99999)), 0)
+    
+    def test_bloom_filter_reader(self):
+        """Verificar XXH64 y que el filtro de Bloom escrito por pyarrow no da falsos negativos"""
+        self.assertEqual(main.xxhash64(b''), 0xEF46DB3751D8E999)
+        self.assertEqual(main.xxhash64(b'abc'), 0x44BC2CF5AD770999)
+        self.assertEqual(main.xxhash64(b'Nobody inspects the spammish repetition'), 0xFBCEA83C8A378BF1)
+        
+        path = self.tmp_dir / 'bloom.parquet'
+        values = np.arange(0, 2000, 2)
+        pq.write_table(main.pa.table({'id': values}), path,
+                       bloom_filter_options={'id': {'ndv': len(values), 'fpp': 0.01}})
+        metadata = pq.read_metadata(path)
+        with open(path, 'rb') as file_obj:
+            contains = [main._row_group_might_contain(metadata, file_obj, 0, 0, int(v)) for v in range(2000)]
+        self.assertTrue(all(contains[::2]))
+        self.assertLess(sum(contains[1::2]), 50)
+    
+    def test_xxhash64_vectors(self):
+        """Verificar XXH64 contra vectores de referencia (entradas cortas, largas y con semilla)"""
+        long_input = b'Nobody inspects the spammish repetition'
+        self.assertEqual(main.xxhash64(b'a'), 0xD24EC4F1A98C6E5B)
+        self.assertEqual(main.xxhash64(long_input, seed=20141025), 0xCE06936136852706)
+        self.assertEqual(main.xxhash64(bytes(range(100))), 0x6AC1E58032166597)
+        self.assertEqual(main.xxhash64(main._plain_bytes(17850)), 0xA96B9896FFA38B7E)
+    
+    def test_bloom_filter_header(self):
+        """Verificar el parser de la cabecera Thrift compacta del filtro de Bloom"""
+        bitset = bytes(range(32))
+        empty_struct = b'\x1c\x1c\x00\x00'          # {1: BLOCK/XXHASH/UNCOMPRESSED {}}
+        header = b'\x15\x40' + empty_struct * 3 + b'\x00'   # numBytes = 32 (zigzag 64)
+        self.assertEqual(main._bloom_filter_bitset(header + bitset + b'resto'), bitset)
+        
+        with self.assertRaises(ValueError):
+            main._bloom_filter_bitset(empty_struct * 3 + b'\x00' + bitset)
+        with self.assertRaises(ValueError):
+            main._bloom_filter_bitset(b'\x18\x00' + bitset)
+        
+        path = self.tmp_dir / 'bloom.parquet'
+        pq.write_table(main.pa.table({'id': ['a', 'b', 'c']}), path,
+                       bloom_filter_options={'id': {'ndv': 3, 'fpp': 0.01}})
+        chunk = pq.read_metadata(path).row_group(0).column(0)
+        with open(path, 'rb') as file_obj:
+            file_obj.seek(chunk.bloom_filter_offset)
+            buffer = file_obj.read(chunk.bloom_filter_length)
+        bitset = main._bloom_filter_bitset(buffer)
+        self.assertEqual(len(bitset) % 32, 0)
+        self.assertEqual(buffer[-len(bitset):], bitset)
+        for value in ['a', 'b', 'c']:
+            self.assertTrue(main.bloom_filter_might_contain(bitset, main.xxhash64(main._plain_bytes(value))))
+
+
+class TestArrowMode(PipelineTestCase):
+    """Pruebas del modo Arrow (transformación Silver con kernels de Arrow)"""
+    
+    def test_matches_pandas_transformation(self):
+        """Verificar que el modo Arrow produce el mismo Silver que transform_silver"""
+        df_bronze = main._prepare_bronze_frame(make_bronze_frame())
+        expected = main.transform_silver(df_bronze, self.logger).reset_index(drop=True)
+        table = main.transform_silver_arrow(main.pa.Table.from_pandas(df_bronze, preserve_index=False),
+                                            self.logger)
+        
+        self.assertEqual(table.schema, main.SILVER_SCHEMA)
+        df_arrow = table.to_pandas()
+        pd.testing.assert_frame_equal(df_arrow, expected, check_dtype=False)
+        for col in main.SILVER_DICTIONARY_COLUMNS:
+            self.assertEqual(df_arrow[col].cat.categories.tolist(), expected[col].cat.categories.tolist())
+    
+    def test_main_arrow_mode(self):
+        """Verificar que --arrow escribe el mismo Silver y Gold que el modo pandas"""
+        main.load_bronze(make_bronze_frame(), self.logger)
+        self.assertTrue(main.main(['--from-bronze', '--no-gc']))
+        self.assertTrue(main.main(['--from-bronze', '--arrow', '--no-gc']))
+        
+        silver_paths = sorted(p for p in Config.SILVER_PATH.iterdir() if p.is_dir())
+        self.assertEqual(len(silver_paths), 2)
+        pd.testing.assert_frame_equal(main.read_silver(silver_paths[0]), main.read_silver(silver_paths[1]))
+        self.assertEqual(main._dictionaries_path(silver_paths[0]).read_text(),
+                         main._dictionaries_path(silver_paths[1]).read_text())
+        
+        gold_files = sorted(Config.GOLD_PATH.glob('customer_segments_*.parquet'))
+        pd.testing.assert_frame_equal(pd.read_parquet(gold_files[0]), pd.read_parquet(gold_files[1]),
+                                      check_dtype=False)
+    
+    def test_silver_write_failure_aborts(self):
+        """Verificar que un fallo al guardar Silver no publica Gold"""
+        main.load_bronze(make_bronze_frame(), self.logger)
+        for args in (['--from-bronze', '--no-gc'], ['--from-bronze', '--arrow', '--no-gc']):
+            with mock.patch.object(main, 'load_silver', return_value=None):
+                self.assertFalse(main.main(args))
+        self.assertIsNone(main.load_gold_manifest())
+        self.assertEqual(list(Config.GOLD_PATH.glob('*.parquet')), [])
+
+
+class TestSilverRejections(PipelineTestCase):
+    """Pruebas de la máscara única de reglas de Silver"""
+    
+    def test_rejection_codes_first_failing_rule(self):
+        """Verificar que cada fila se atribuye a la primera regla que incumple"""
+        codes, rejections = main.silver_rejection_codes(
+            np.array([False, True, False, True, False]),
+            np.array([True, False, False, True, True]),
+            np.array([True, False, False, False, False])
+        )
+        self.assertEqual(codes.tolist(), [0, 1, 2, 1, 3])
+        self.assertEqual(rejections, {'duplicate': 2, 'missing_customer': 1, 'invalid_values': 1})
+    
+    def test_transform_logs_counts_per_rule(self):
+        """Verificar los conteos por regla registrados en ambos modos"""
+        df_bronze = main._prepare_bronze_frame(make_bronze_frame())
+        table = main.pa.Table.from_pandas(df_bronze, preserve_index=False)
+        for transform, data in [(main.transform_silver, df_bronze), (main.transform_silver_arrow, table)]:
+            with self.assertLogs(self.logger, level='INFO') as logs:
+                transform(data, self.logger)
+            output = '\n'.join(logs.output)
+            self.assertIn('Duplicados eliminados: 1', output)
+            self.assertIn('Registros sin CustomerID eliminados: 1', output)
+            self.assertIn('Registros con valores inválidos eliminados: 2', output)
+
+
+class TestQualityProfile(PipelineTestCase):
+    """Pruebas del perfil de calidad en una pasada"""
+    
+    def test_profile_matches_pandas_metrics(self):
+        """Verificar duplicados, nulos y cardinalidades frente a pandas"""
+        df = main._prepare_bronze_frame(make_bronze_frame())
+        profile, row_hashes = main.profile_quality(df)
+        duplicated = main.mark_duplicates(profile, row_hashes)
+        
+        np.testing.assert_array_equal(duplicated, df.duplicated().to_numpy())
+        self.assertEqual(profile['duplicates'], int(df.duplicated().sum()))
+        self.assertEqual(profile['nulls'], {col: int(n) for col, n in df.isna().sum().items()})
+        self.assertEqual(profile['negative_quantity'], int((df['Quantity'] < 0).sum()))
+        self.assertEqual(main.quality_cardinalities(profile), {col: df[col].nunique() for col in df.columns})
+        
+        # El perfil del modo Arrow es el mismo
+        table = main.pa.Table.from_pandas(df, preserve_index=False)
+        profile_arrow = main.profile_quality_arrow(table, duplicated)
+        self.assertEqual({k: profile_arrow[k] for k in main.QUALITY_COUNTS},
+                         {k: profile[k] for k in main.QUALITY_COUNTS})
+        self.assertEqual(main.quality_cardinalities(profile_arrow), main.quality_cardinalities(profile))
+    
+    def test_chunk_profiles_merge_to_full_profile(self):
+        """Verificar que los perfiles por chunks combinados equivalen al del lote completo"""
+        df = main._prepare_bronze_frame(make_bronze_frame())
+        full, full_hashes = main.profile_quality(df)
+        main.mark_duplicates(full, full_hashes)
+        
+        seen = main.RowHashSet()
+        partials = []
+        for part in (df.iloc[:3], df.iloc[3:]):
+            profile, hashes = main.profile_quality(part)
+            main.mark_duplicates(profile, hashes, seen)
+            partials.append(profile)
+        merged = main.merge_quality_profiles(*partials)
+        
+        self.assertEqual({k: merged[k] for k in main.QUALITY_COUNTS}, {k: full[k] for k in main.QUALITY_COUNTS})
+        self.assertEqual(merged['nulls'], full['nulls'])
+        for col, registers in full['registers'].items():
+            np.testing.assert_array_equal(merged['registers'][col], registers)
+
+
+class TestQuarantine(PipelineTestCase):
+    """Pruebas de la cuarentena de filas rechazadas por Silver"""
+    
+    def test_rejected_rows_partitioned_by_reason(self):
+        """Verificar que cada fila rechazada queda en la partición de su regla"""
+        df_bronze = make_bronze_frame()
+        df_silver = main.transform_silver(df_bronze, self.logger, quarantine=True)
+        snapshots = list(Config.QUARANTINE_PATH.glob('rejected_data_*'))
+        self.assertEqual(len(snapshots), 1)
+        
+        quarantined = main.read_quarantine(snapshots[0])
+        self.assertEqual(len(df_silver) + len(quarantined), len(df_bronze))
+        self.assertEqual(quarantined['Reason'].astype(str).value_counts().to_dict(),
+                         {'duplicate': 1, 'missing_customer': 1, 'invalid_values': 2})
+        invalid = main.read_quarantine(snapshots[0], 'invalid_values')
+        self.assertIn('C536379', invalid['InvoiceNo'].tolist())
+        
+        # Sin quarantine=True no se escribe nada
+        main.transform_silver(df_bronze, self.logger)
+        self.assertEqual(len(list(Config.QUARANTINE_PATH.iterdir())), 1)
+    
+    def test_modes_write_same_quarantine(self):
+        """Verificar que los modos en memoria, Arrow y por chunks ponen en cuarentena las mismas filas"""
+        bronze_path = Config.BRONZE_PATH / 'raw_data_20240101_000000.parquet'
+        make_bronze_frame().to_parquet(bronze_path, row_group_size=3, index=False)
+        table = main.read_bronze_table(bronze_path, self.logger)
+        
+        main.transform_silver(table.to_pandas(), self.logger, quarantine=True)
+        main.transform_silver_arrow(table, self.logger, quarantine=True)
+        main.transform_silver_chunked(bronze_path, self.logger, quarantine=True)
+        
+        columns = ['Reason', 'InvoiceNo', 'StockCode', 'Quantity', 'CustomerID']
+        results = [main.read_quarantine(path).astype({'Reason': str}).sort_values(columns).reset_index(drop=True)
+                   for path in sorted(Config.QUARANTINE_PATH.glob('rejected_data_*'))]
+        self.assertEqual(len(results), 3)
+        for result in results[1:]:
+            pd.testing.assert_frame_equal(result, results[0])
+
+
+class TestReturnsNetting(PipelineTestCase):
+    """Pruebas de la compensación de devoluciones (facturas C)"""
+    
+    def test_allocate_returns_fifo_before_return(self):
+        """Verificar el reparto FIFO limitado a ventas anteriores a cada devolución"""
+        keys = np.array([1, 1, 2], dtype=np.uint64)
+        returned, unmatched = main.allocate_returns(
+            keys, np.array([10, 30, 10]), np.array([5, 5, 4]),
+            np.array([1, 1, 3], dtype=np.uint64), np.array([20, 40, 50]), np.array([7, 3, 1])
+        )
+        # La primera devolución solo alcanza la venta anterior (5 de 7); la
+        # segunda consume la venta posterior a la primera; la clave 3 no casa
+        self.assertEqual(returned.tolist(), [5, 3, 0])
+        self.assertEqual(unmatched, 3)
+    
+    def test_net_revenue_in_all_modes(self):
+        """Verificar ReturnedQuantity en Silver (todos los modos) y las columnas netas de Gold"""
+        base = datetime(2010, 12, 1, 8, 26)
+        df_bronze = pd.concat([make_bronze_frame(), pd.DataFrame({
+            'InvoiceNo': ['C536370', 'C536371'],
+            'StockCode': [' 22728', '22752'],
+            'Description': ['ALARM CLOCK', 'SET 7 BABUSHKA'],
+            'Quantity': [-10, -2],
+            'InvoiceDate': [base + timedelta(days=42), base + timedelta(days=39)],
+            'UnitPrice': [3.75, 7.65],
+            'CustomerID': [12583.0, 13047.0],
+            'Country': ['France', 'United Kingdom']
+        })], ignore_index=True)
+        bronze_path = Config.BRONZE_PATH / 'raw_data_20240101_000000.parquet'
+        df_bronze.to_parquet(bronze_path, row_group_size=3, index=False)
+        table = main.read_bronze_table(bronze_path, self.logger)
+        
+        df_silver = main.transform_silver(table.to_pandas(), self.logger)
+        returned = df_silver.set_index(df_silver['StockCode'].astype(str))['ReturnedQuantity']
+        self.assertEqual(returned.to_dict(), {'85123A': 0, '71053': 0, '22752': 0, '22728': 10})
+        np.testing.assert_allclose(df_silver['NetTotalPrice'],
+                                   (df_silver['Quantity'] - df_silver['ReturnedQuantity']) * df_silver['UnitPrice'])
+        
+        columns = ['InvoiceNo', 'StockCode', 'ReturnedQuantity', 'NetTotalPrice']
+        arrow = main.transform_silver_arrow(table, self.logger).to_pandas()
+        chunked = main.read_silver(main.transform_silver_chunked(bronze_path, self.logger))
+        for result in (arrow, chunked):
+            pd.testing.assert_frame_equal(
+                main.decode_silver(result)[columns].sort_values(columns[:2]).reset_index(drop=True),
+                main.decode_silver(df_silver)[columns].sort_values(columns[:2]).reset_index(drop=True)
+            )
+        
+        # Las tablas Gold llevan el importe neto (Francia: 24 - 10 unidades a 3.75)
+        gold = main.build_gold_tables(df_silver, self.logger)
+        partial_gold = main.finalize_gold_partials(main.build_gold_partials(df_silver))
+        for tables in (gold, partial_gold):
+            country = tables['sales_by_country'].set_index('Country')
+            self.assertAlmostEqual(country.loc['France', 'NetRevenue'], 14 * 3.75)
+            self.assertAlmostEqual(country.loc['France', 'TotalRevenue'], 24 * 3.75)
+            self.assertAlmostEqual(tables['sales_by_time']['NetRevenue'].sum(), df_silver['NetTotalPrice'].sum())
+            self.assertAlmostEqual(tables['top_products']['NetRevenue'].sum(), df_silver['NetTotalPrice'].sum())
+            self.assertAlmostEqual(tables['customer_segments'].set_index('CustomerID').loc[12583, 'NetSpent'],
+                                   14 * 3.75)
+    
+    def test_return_of_sale_from_earlier_delta(self):
+        """Verificar que una devolución casa con la venta de un delta anterior (igual que al reconstruir)"""
+        df_bronze = pd.concat([make_bronze_frame(), pd.DataFrame({
+            'InvoiceNo': ['C536400'],
+            'StockCode': ['85123A'],
+            'Description': ['WHITE HANGING HEART'],
+            'Quantity': [-4],
+            'InvoiceDate': [datetime(2011, 1, 20, 10, 0)],
+            'UnitPrice': [2.55],
+            'CustomerID': [17850.0],
+            'Country': ['United Kingdom']
+        })], ignore_index=True)
+        first = Config.BRONZE_PATH / 'raw_data_20250101_000000.parquet'
+        second = Config.BRONZE_PATH / 'raw_data_20250102_000000.parquet'
+        df_bronze[df_bronze['InvoiceDate'] < datetime(2010, 12, 5)].to_parquet(first, index=False)
+        df_bronze.to_parquet(second, index=False)
+        
+        main.run_incremental(first, self.logger)
+        first_silver = main.load_watermark()['silver_files'][0]
+        incremental = main.run_incremental(second, self.logger)
+        
+        df_silver = main.transform_silver(df_bronze, self.logger)
+        full = main.build_gold_tables(df_silver, self.logger)
+        for name in main.GOLD_TABLES:
+            pd.testing.assert_frame_equal(incremental[name].reset_index(drop=True),
+                                          full[name].reset_index(drop=True), check_dtype=False, obj=name)
+        self.assertAlmostEqual(incremental['customer_segments'].set_index('CustomerID').loc[17850, 'NetSpent'],
+                               35.64 - 4 * 2.55)
+        
+        # El Silver anterior se revisa en una versión nueva; el original queda intacto
+        silver_files = main.load_watermark()['silver_files']
+        self.assertNotIn(first_silver, silver_files)
+        self.assertEqual(main.read_silver(Config.SILVER_PATH / first_silver)['ReturnedQuantity'].sum(), 0)
+        df_incremental = pd.concat([main.read_silver(Config.SILVER_PATH / name) for name in silver_files])
+        self.assertEqual(df_incremental['ReturnedQuantity'].sum(), df_silver['ReturnedQuantity'].sum())
+        self.assertEqual(df_incremental['ReturnedQuantity'].sum(), 4)
+    
+    def test_incremental_returns_use_open_sales_index(self):
+        """Verificar que las devoluciones de un delta no leen las particiones Silver anteriores sin ventas casadas"""
+        df_bronze = pd.concat([make_bronze_frame(), pd.DataFrame({
+            'InvoiceNo': ['C536400'],
+            'StockCode': ['85123A'],
+            'Description': ['WHITE HANGING HEART'],
+            'Quantity': [-4],
+            'InvoiceDate': [datetime(2011, 1, 20, 10, 0)],
+            'UnitPrice': [2.55],
+            'CustomerID': [17850.0],
+            'Country': ['United Kingdom']
+        })], ignore_index=True)
+        first = Config.BRONZE_PATH / 'raw_data_20250101_000000.parquet'
+        second = Config.BRONZE_PATH / 'raw_data_20250102_000000.parquet'
+        df_bronze[df_bronze['InvoiceDate'] < datetime(2011, 1, 15)].to_parquet(first, index=False)
+        df_bronze.to_parquet(second, index=False)
+        
+        main.run_incremental(first, self.logger)
+        first_silver = Config.SILVER_PATH / main.load_watermark()['silver_files'][0]
+        untouched = [path for path in main.silver_partitions(first_silver) if 'Month=01' in path.parts]
+        self.assertEqual(len(untouched), 1)
+        
+        with mock.patch.object(main.pq, 'read_table', wraps=main.pq.read_table) as read_table, \
+                mock.patch.object(main.pq, 'ParquetFile', wraps=main.pq.ParquetFile) as parquet_file:
+            main.run_incremental(second, self.logger)
+        opened = [Path(call.args[0]) for call in read_table.call_args_list + parquet_file.call_args_list
+                  if isinstance(call.args[0], (str, Path))]
+        self.assertIn(first_silver / 'Year=2010' / 'Month=12' / 'part-0.parquet', opened)
+        self.assertNotIn(untouched[0], opened)
+        
+        # El índice conserva las unidades aún no devueltas de todo Silver
+        watermark = main.load_watermark()
+        df_open = pd.concat([pd.read_parquet(main._open_sales_path(name)) for name in watermark['open_sales']])
+        df_silver = pd.concat([main.read_silver(Config.SILVER_PATH / name) for name in watermark['silver_files']])
+        self.assertEqual(df_open['Remaining'].sum(), (df_silver['Quantity'] - df_silver['ReturnedQuantity']).sum())
+        self.assertEqual(df_silver['ReturnedQuantity'].sum(), 4)
+
+
+class TestRFMSegmentation(unittest.TestCase):
+    """Pruebas de la puntuación RFM de clientes"""
+    
+    def setUp(self):
+        self.logger = logging.getLogger('ETL_Tests')
+        self.df_silver = main.transform_silver(make_bronze_frame(), self.logger)
+    
+    def test_quantile_scores(self):
+        """Verificar quintiles, empates en el mismo nivel y la escala invertida de recencia"""
+        values = np.arange(1, 11)
+        self.assertEqual(main.rfm_scores(values, 5).tolist(), [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+        self.assertEqual(main.rfm_scores(values, 5, higher_is_better=False).tolist(),
+                         [5, 5, 4, 4, 3, 3, 2, 2, 1, 1])
+        
+        ties = main.rfm_scores(np.array([1, 1, 1, 1, 1, 1, 2, 3, 8, 9]), 5)
+        self.assertEqual(ties.tolist(), [1, 1, 1, 1, 1, 1, 4, 4, 5, 5])
+        self.assertEqual(len(main.rfm_scores(np.array([]), 5)), 0)
+    
+    def test_scores_from_merged_partials(self):
+        """Verificar que los lotes puntúan sobre los totales combinados por cliente"""
+        gold = main.build_gold_tables(self.df_silver, self.logger)
+        customers = gold['customer_segments'].set_index('CustomerID')
+        
+        # Todos con un pedido (empate en frecuencia); 17850 es el más antiguo
+        self.assertEqual(customers['FrequencyScore'].tolist(), [1, 1, 1])
+        self.assertEqual(customers.loc[17850, ['Recency', 'RecencyScore']].tolist(), [41, 1])
+        self.assertEqual(customers.loc[12583, ['Recency', 'MonetaryScore']].tolist(), [0, Config.RFM_LEVELS])
+        self.assertTrue((customers['RFMScore'] == customers['RecencyScore'].astype(str)
+                         + customers['FrequencyScore'].astype(str)
+                         + customers['MonetaryScore'].astype(str)).all())
+        
+        halves = [main.build_gold_partials(self.df_silver.iloc[i::2]) for i in range(2)]
+        merged = main.finalize_gold_partials(main.merge_gold_partials(*halves))['customer_segments']
+        columns = ['CustomerID', 'Recency', 'RecencyScore', 'FrequencyScore', 'MonetaryScore', 'RFMScore']
+        pd.testing.assert_frame_equal(merged[columns].reset_index(drop=True),
+                                      gold['customer_segments'][columns].reset_index(drop=True))
+
+
+class TestCustomerCohorts(unittest.TestCase):
+    """Pruebas de la tabla Gold de cohortes de clientes"""
+    
+    def setUp(self):
+        self.logger = logging.getLogger('ETL_Tests')
+    
+    def test_cohort_cells(self):
+        """Verificar clientes activos, tamaño de cohorte y retención por celda"""
+        # Clientes 0 y 1 empiezan en el mes 100, el 2 en el 101; el 0 vuelve en el 102
+        df_cohorts = main.build_customer_cohorts(
+            customer=np.array([0, 0, 1, 2, 0, 0]),
+            month=np.array([100, 100, 100, 101, 102, 102]),
+            first_month=np.array([100, 100, 101]),
+            revenue=np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0]),
+            net_revenue=np.array([1.0, 2.0, 3.0, 4.0, 5.0, 0.0])
+        )
+        self.assertEqual(df_cohorts['CohortMonth'].tolist(), ['0008-05', '0008-05', '0008-06'])
+        self.assertEqual(df_cohorts['MonthsSinceFirst'].tolist(), [0, 2, 0])
+        self.assertEqual(df_cohorts['ActiveCustomers'].tolist(), [2, 1, 1])
+        self.assertEqual(df_cohorts['CohortSize'].tolist(), [2, 2, 1])
+        self.assertEqual(df_cohorts['RetentionRate'].tolist(), [1.0, 0.5, 1.0])
+        self.assertEqual(df_cohorts['TotalRevenue'].tolist(), [6.0, 11.0, 4.0])
+        self.assertEqual(df_cohorts['NetRevenue'].tolist(), [6.0, 5.0, 4.0])
+    
+    def test_returning_customer_in_all_engines(self):
+        """Verificar la cohorte de un cliente que vuelve en motor, referencia y parciales"""
+        df_bronze = make_bronze_frame()
+        repeat = df_bronze.iloc[[0]].assign(InvoiceNo='536370', InvoiceDate=datetime(2011, 2, 3, 9, 0))
+        df_silver = main.transform_silver(pd.concat([df_bronze, repeat], ignore_index=True), self.logger)
+        
+        gold = main.build_gold_tables(df_silver, self.logger)
+        cohorts = gold['customer_cohorts'].set_index(['CohortMonth', 'MonthsSinceFirst'])
+        self.assertEqual(cohorts.loc[('2010-12', 2), ['ActiveCustomers', 'CohortSize']].tolist(), [1, 1])
+        self.assertEqual(cohorts.loc[('2011-01', 0), 'ActiveCustomers'], 2)
+        self.assertNotIn(('2010-12', 1), cohorts.index)
+        
+        df_strings = main.decode_silver(df_silver)
+        reference = main.aggregate_customer_cohorts(
+            df_strings, main.aggregate_customer_segments(df_strings, self.logger), self.logger
+        )
+        halves = [main.build_gold_partials(df_silver.iloc[i::2]) for i in range(2)]
+        merged = main.finalize_gold_partials(main.merge_gold_partials(*halves))['customer_cohorts']
+        for result in (reference, merged):
+            pd.testing.assert_frame_equal(result.reset_index(drop=True), gold['customer_cohorts'],
+                                          check_dtype=False)
+
+
 def run_tests():
     """Ejecutar todas las pruebas"""
     print("="*60)
@@ -207,6 +1500,30 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestAggregations))
     suite.addTests(loader.loadTestsFromTestCase(TestDataCleaning))
     suite.addTests(loader.loadTestsFromTestCase(TestPipelineIntegration))
+    suite.addTests(loader.loadTestsFromTestCase(TestSourceCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestStreamingExtraction))
+    suite.addTests(loader.loadTestsFromTestCase(TestBronzeResume))
+    suite.addTests(loader.loadTestsFromTestCase(TestChunkedSilver))
+    suite.addTests(loader.loadTestsFromTestCase(TestGoldEngine))
+    suite.addTests(loader.loadTestsFromTestCase(TestSilverDictionaries))
+    suite.addTests(loader.loadTestsFromTestCase(TestIncrementalProcessing))
+    suite.addTests(loader.loadTestsFromTestCase(TestGoldPartials))
+    suite.addTests(loader.loadTestsFromTestCase(TestApproxDistinct))
+    suite.addTests(loader.loadTestsFromTestCase(TestTopProducts))
+    suite.addTests(loader.loadTestsFromTestCase(TestGoldCatalog))
+    suite.addTests(loader.loadTestsFromTestCase(TestGoldTransactions))
+    suite.addTests(loader.loadTestsFromTestCase(TestRetention))
+    suite.addTests(loader.loadTestsFromTestCase(TestSilverPartitions))
+    suite.addTests(loader.loadTestsFromTestCase(TestParquetStorage))
+    suite.addTests(loader.loadTestsFromTestCase(TestSilverClustering))
+    suite.addTests(loader.loadTestsFromTestCase(TestSilverLookup))
+    suite.addTests(loader.loadTestsFromTestCase(TestArrowMode))
+    suite.addTests(loader.loadTestsFromTestCase(TestSilverRejections))
+    suite.addTests(loader.loadTestsFromTestCase(TestQualityProfile))
+    suite.addTests(loader.loadTestsFromTestCase(TestQuarantine))
+    suite.addTests(loader.loadTestsFromTestCase(TestReturnsNetting))
+    suite.addTests(loader.loadTestsFromTestCase(TestRFMSegmentation))
+    suite.addTests(loader.loadTestsFromTestCase(TestCustomerCohorts))
     
     # Ejecutar pruebas
     runner = unittest.TextTestRunner(verbosity=2)
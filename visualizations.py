@@ -12,6 +12,8 @@ from pathlib import Path
 from typing import Optional
 import logging
 
+from main import load_gold_manifest, resolve_gold_table
+
 # Configuración de estilo
 sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (12, 6)
@@ -33,6 +35,9 @@ class VisualizationEngine:
         self.output_path = output_path or gold_path.parent / 'visualizations'
         self.output_path.mkdir(exist_ok=True)
         
+        # Catálogo fijado durante un dashboard (todas las tablas del mismo snapshot)
+        self.manifest = None
+        
         self.logger = logging.getLogger('Visualizations')
     
     def load_gold_table(self, table_name: str) -> Optional[pd.DataFrame]:
@@ -46,13 +51,12 @@ class VisualizationEngine:
             DataFrame con datos
         """
         try:
-            # Buscar archivo más reciente
-            files = list(self.gold_path.glob(f'{table_name}_*.parquet'))
-            if not files:
+            # Versión vigente según el catálogo Gold
+            latest_file = resolve_gold_table(table_name, self.gold_path, self.manifest)
+            if latest_file is None:
                 self.logger.error(f"No se encontró tabla: {table_name}")
                 return None
             
-            latest_file = max(files, key=lambda p: p.stat().st_mtime)
             df = pd.read_parquet(latest_file)
             
             self.logger.info(f"Tabla cargada: {table_name} ({len(df)} registros)")
@@ -302,6 +306,7 @@ class VisualizationEngine:
         print("="*60 + "\n")
         
         try:
+            self.manifest = load_gold_manifest(self.gold_path)
             self.plot_top_countries(top_n=10)
             self.plot_sales_trend()
             self.plot_top_products(top_n=15)
@@ -314,6 +319,9 @@ class VisualizationEngine:
             
         except Exception as e:
             self.logger.error(f"Error generando dashboard: {str(e)}")
+        
+        finally:
+            self.manifest = None
 
 
 def main():